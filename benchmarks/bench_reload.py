@@ -0,0 +1,89 @@
+#!/usr/bin/python3
+"""
+This script measures how reloading FileStorage scales with worker processes.
+
+It fills a storage with objects in a temporary directory and saves the
+snapshot, then times reloads of it with each number of workers:
+
+    1               records parsed and built in this process
+    N               records parsed and built by a pool of N processes
+
+Usage:
+    ./benchmarks/bench_reload.py [--objects N] [--workers 1,2,4,8]
+                                 [--repeat R]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+
+def fill(count):
+    """
+    Creates `count` users and places in the storage.
+    """
+    from models.user import User
+    from models.place import Place
+
+    for i in range(count // 2):
+        user = User()
+        user.email = "user{}@example.com".format(i)
+        place = Place()
+        place.user_id = user.id
+        place.name = "Place {}".format(i)
+        place.price_by_night = i % 500
+
+
+def bench(workers, repeat):
+    """
+    Returns the best and median durations of `repeat` reloads of the
+    snapshot with `workers` processes, in seconds.
+    """
+    from models.engine.file_storage import FileStorage
+
+    storage = FileStorage(reload_workers=workers, reload_min_bytes=0)
+    times = []
+    for _ in range(repeat):
+        FileStorage._FileStorage__objects = {}
+        start = time.perf_counter()
+        storage.reload()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[0], times[len(times) // 2]
+
+
+def main():
+    """
+    Runs the benchmark and prints one line per number of workers.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--objects", type=int, default=100000)
+    parser.add_argument("--workers", default="1,2,4,8")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        import models
+
+        fill(args.objects)
+        models.storage.save()
+        size = os.path.getsize("file.json")
+        print("{} objects, {:.1f} MiB snapshot, {} cores, {} reloads each"
+              .format(models.storage.count(), size / (1 << 20),
+                      os.cpu_count(), args.repeat))
+        baseline = None
+        for workers in map(int, args.workers.split(",")):
+            best, median = bench(workers, args.repeat)
+            baseline = baseline or best
+            print("{:>2} workers  best {:7.2f} s  median {:7.2f} s  "
+                  "speedup {:4.2f}x".format(workers, best, median,
+                                            baseline / best))
+
+
+if __name__ == "__main__":
+    main()
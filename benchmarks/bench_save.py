@@ -0,0 +1,89 @@
+#!/usr/bin/python3
+"""
+This script measures the cost of the durability options of FileStorage.
+
+It fills a storage with objects in a temporary directory, then times
+full snapshot saves with each option:
+
+    atomic          temporary file renamed over the snapshot
+    fsync           the same, flushing the file to disk before the rename
+    fsync+dir       the same, also flushing the directory after the rename
+
+Usage:
+    ./benchmarks/bench_save.py [--objects N] [--repeat R]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+MODES = (
+    ("atomic", {}),
+    ("fsync", {"fsync": True}),
+    ("fsync+dir", {"fsync": True, "fsync_directory": True}),
+)
+
+
+def fill(count):
+    """
+    Creates `count` users and places in the storage.
+    """
+    from models.user import User
+    from models.place import Place
+
+    for i in range(count // 2):
+        user = User()
+        user.email = "user{}@example.com".format(i)
+        place = Place()
+        place.user_id = user.id
+        place.name = "Place {}".format(i)
+        place.price_by_night = i % 500
+
+
+def bench(options, repeat):
+    """
+    Returns the best and median durations of `repeat` snapshot saves of
+    the current objects, in milliseconds.
+    """
+    from models.engine.file_storage import FileStorage
+
+    storage = FileStorage(**options)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        storage.save()
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return times[0], times[len(times) // 2]
+
+
+def main():
+    """
+    Runs the benchmark and prints one line per durability option.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--objects", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        import models
+
+        fill(args.objects)
+        models.storage.save()
+        size = os.path.getsize("file.json")
+        print("{} objects, {:.1f} MiB snapshot, {} saves each".format(
+            models.storage.count(), size / (1 << 20), args.repeat))
+        for name, options in MODES:
+            best, median = bench(options, args.repeat)
+            print("{:<10} best {:8.2f} ms  median {:8.2f} ms".format(
+                name, best, median))
+
+
+if __name__ == "__main__":
+    main()
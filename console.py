@@ -3,11 +3,13 @@
 Importing necessary libraries and modules
 """
 import cmd
+import math
 import re
 import shlex
 import ast
+from datetime import datetime
 from models import storage
-from models.base_model import BaseModel
+from models.base_model import BaseModel, ConflictError
 from models.user import User
 from models.amenity import Amenity
 from models.place import Place
@@ -65,16 +67,27 @@ class HBNBCommand(cmd.Cmd):
         """
         pass
 
+    def precmd(self, line):
+        """
+        Method to pick up the changes other processes saved to the
+        storage before running a command
+        """
+        if hasattr(storage, "refresh"):
+            storage.refresh()
+        return line
+
     def do_EOF(self, arg):
         """
         Method to handle EOF (End Of File)
         """
+        storage.close()
         return True
 
     def do_quit(self, arg):
         """
         Method to handle quit command
         """
+        storage.close()
         return True
 
     def do_create(self, arg):
@@ -105,11 +118,9 @@ class HBNBCommand(cmd.Cmd):
         elif len(commands) < 2:
             print("** instance id missing **")
         else:
-            objects = storage.all()
-
-            key = "{}.{}".format(commands[0], commands[1])
-            if key in objects:
-                print(objects[key])
+            obj = storage.get(commands[0], commands[1])
+            if obj is not None:
+                print(obj)
             else:
                 print("** no instance found **")
 
@@ -126,10 +137,9 @@ class HBNBCommand(cmd.Cmd):
         elif len(commands) < 2:
             print("** instance id missing **")
         else:
-            objects = storage.all()
-            key = "{}.{}".format(commands[0], commands[1])
-            if key in objects:
-                del objects[key]
+            obj = storage.get(commands[0], commands[1])
+            if obj is not None:
+                storage.delete(obj)
                 storage.save()
             else:
                 print("** no instance found **")
@@ -138,40 +148,101 @@ class HBNBCommand(cmd.Cmd):
         """
         Method to handle all command
         """
-        objects = storage.all()
-
         commands = shlex.split(arg)
 
         if len(commands) == 0:
-            for key, value in objects.items():
+            for key, value in storage.snapshot().items():
                 print(str(value))
         elif commands[0] not in self.valid_classes:
             print("** class doesn't exist **")
         else:
-            for key, value in objects.items():
-                if key.split('.')[0] == commands[0]:
-                    print(str(value))
+            for key, value in storage.all_by_class(commands[0]).items():
+                print(str(value))
 
     def do_count(self, arg):
         """
         Method to handle count command
         """
-        objects = storage.all()
         commands = shlex.split(arg)
         if arg:
             cls_nm = commands[0]
-        count = 0
         if commands:
             if cls_nm in self.valid_classes:
-                for obj in objects.values():
-                    if obj.__class__.__name__ == cls_nm:
-                        count += 1
-                print(count)
+                print(storage.count(cls_nm))
             else:
                 print("** invalid class name **")
         else:
             print("** class name missing **")
 
+    def do_nearby(self, arg):
+        """
+        Method to handle nearby command
+        """
+        commands = shlex.split(arg.replace(",", " "))
+        cls_nm = "Place"
+        if commands and commands[0] in self.valid_classes:
+            cls_nm = commands.pop(0)
+        elif commands and not re.match(r"^[-+]?([.\d]|inf|nan)",
+                                       commands[0], re.IGNORECASE):
+            print("** class doesn't exist **")
+            return
+        if len(commands) < 3:
+            print("** coordinates missing **")
+            return
+        try:
+            latitude, longitude, radius = (float(c) for c in commands[:3])
+        except ValueError:
+            print("** invalid coordinates **")
+            return
+        if (not all(map(math.isfinite, (latitude, longitude, radius))) or
+                radius < 0):
+            print("** invalid coordinates **")
+            return
+        for distance, obj in storage.nearby(cls_nm, latitude, longitude,
+                                            radius):
+            print("{:.2f} km {}".format(distance, obj))
+
+    def do_bgsave(self, arg):
+        """
+        Method to handle bgsave command
+        """
+        if not hasattr(storage, "bgsave"):
+            print("** background saves not supported **")
+        elif storage.bgsave_status()["running"]:
+            print("** background save already in progress **")
+        elif storage.bgsave() is not None:
+            print("Background saving started")
+        elif storage.bgsave_status()["running"]:
+            print("Background saving scheduled")
+        else:
+            print("Saved in the foreground (os.fork not available)")
+
+    def do_status(self, arg):
+        """
+        Method to handle status command
+        """
+        if not hasattr(storage, "bgsave_status"):
+            print("** background saves not supported **")
+            return
+        status = storage.bgsave_status()
+        if status["running"]:
+            print("bgsave: running (pid {})".format(status["pid"]))
+        else:
+            print("bgsave: idle")
+        last = status["last"]
+        if last is None:
+            print("last snapshot: none")
+            return
+        finished = datetime.fromtimestamp(last["finished_at"]).isoformat(
+            sep=" ", timespec="seconds")
+        if not last["ok"]:
+            print("last snapshot: failed at {}: {}".format(
+                finished, last["error"]))
+        else:
+            print("last snapshot: {} ({:.3f} s, {} bytes{})".format(
+                finished, last["seconds"], last["size"],
+                ", superseded" if last["superseded"] else ""))
+
     def do_update(self, arg):
         """
         Method to handle update command
@@ -184,35 +255,22 @@ class HBNBCommand(cmd.Cmd):
         elif len(commands) < 2:
             print("** instance id missing **")
         else:
-            objects = storage.all()
-            key = "{}.{}".format(commands[0], commands[1])
-            if key not in objects:
+            obj = storage.get(commands[0], commands[1])
+            if obj is None:
                 print("** no instance found **")
             elif len(commands) < 3:
                 print("** attribute name missing **")
             elif len(commands) < 4:
                 print("** value missing **")
             else:
-                obj = objects[key]
+                version = obj.version
+                attributes = {}
                 curly_braces = re.search(r"\{(.*?)\}", arg)
                 if curly_braces:
                     try:
                         str_data = curly_braces.group(1)
                         arg_dict = ast.literal_eval("{" + str_data + "}")
-                        attribute_names = list(arg_dict.keys())
-                        attribute_values = list(arg_dict.values())
-                        try:
-                            attr_name1 = attribute_names[0]
-                            attr_value1 = attribute_values[0]
-                            setattr(obj, attr_name1, attr_value1)
-                        except Exception:
-                            pass
-                        try:
-                            attr_name2 = attribute_names[1]
-                            attr_value2 = attribute_values[1]
-                            setattr(obj, attr_name2, attr_value2)
-                        except Exception:
-                            pass
+                        attributes.update(list(arg_dict.items())[:2])
                     except Exception:
                         pass
                 else:
@@ -222,14 +280,19 @@ class HBNBCommand(cmd.Cmd):
                         attr_value = eval(attr_value)
                     except Exception:
                         pass
-                    setattr(obj, attr_name, attr_value)
-                obj.save()
+                    attributes[attr_name] = attr_value
+                    if len(commands) > 4 and commands[4].isdigit():
+                        version = int(commands[4])
+                try:
+                    storage.update(obj, version, **attributes)
+                except (ConflictError, AttributeError) as error:
+                    print("** {} **".format(error))
 
     def default(self, arg):
         """
         Method to handle default command
         """
-        arg_list = arg.split('.')
+        arg_list = arg.split('.', 1)
         cls_nm = arg_list[0]
         command = arg_list[1].split('(')
         cmd_met = command[0]
@@ -239,7 +302,8 @@ class HBNBCommand(cmd.Cmd):
                 'show': self.do_show,
                 'destroy': self.do_destroy,
                 'update': self.do_update,
-                'count': self.do_count
+                'count': self.do_count,
+                'nearby': self.do_nearby
             }
         if cmd_met in method_dict.keys():
             if cmd_met != "update":
@@ -1,11 +1,44 @@
 """
 Import the FileStorage class from the file_storage module.
 """
+import os
 from models.engine.file_storage import FileStorage
 """
-Instantiate a FileStorage object to manage object storage.
+Instantiate the storage engine managing objects.
+Setting HBNB_TYPE_STORAGE=db stores them in the SQLite database named by
+HBNB_SQLITE_DB (default: hbnb.db) instead of the JSON file.
+Setting HBNB_FILE_JOURNAL=1 makes saves append to a journal file
+instead of rewriting the whole JSON file.
+Setting HBNB_FILE_LAZY=1 defers building the loaded objects until they
+are first accessed.
+Setting HBNB_FILE_FSYNC=1 flushes every save, and the directory holding
+the JSON file, to disk before the save returns.
+Setting HBNB_FILE_SAVE_WINDOW to a number of seconds writes the JSON file
+at most once per window, deferring the saves in between.
+Setting HBNB_FILE_WRITE_BEHIND to a number of seconds above 0 makes saves
+return at once, a background thread writing them within that many seconds.
+Setting HBNB_FILE_BGSAVE=1 writes the snapshots from a forked child
+process, so saves do not wait for them.
+Setting HBNB_FILE_RELOAD_WORKERS to a number of processes builds the
+objects of a large JSON file in parallel on startup.
 """
-storage = FileStorage()
+if os.getenv("HBNB_TYPE_STORAGE") == "db":
+    from models.engine.db_storage import DBStorage
+    storage = DBStorage()
+else:
+    durable = os.getenv("HBNB_FILE_FSYNC") == "1"
+    write_behind = float(os.getenv("HBNB_FILE_WRITE_BEHIND") or "0")
+    storage = FileStorage(journal=os.getenv("HBNB_FILE_JOURNAL") == "1",
+                          lazy=os.getenv("HBNB_FILE_LAZY") == "1",
+                          fsync=durable, fsync_directory=durable,
+                          save_window=float(
+                              os.getenv("HBNB_FILE_SAVE_WINDOW", "0")),
+                          write_behind=write_behind > 0,
+                          flush_interval=write_behind if write_behind > 0
+                          else 1.0,
+                          background=os.getenv("HBNB_FILE_BGSAVE") == "1",
+                          reload_workers=int(
+                              os.getenv("HBNB_FILE_RELOAD_WORKERS", "1")))
 """
 Load any existing objects from the JSON file into the storage dictionary.
 If the file doesn't exist, no action is taken.
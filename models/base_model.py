@@ -13,6 +13,38 @@ from datetime import datetime
 import models
 
 
+class ConflictError(Exception):
+    """
+    Raised when an object is updated on the condition that it is still at
+    the version the caller read, and a change to it was saved since.
+
+    Attributes:
+        key (str): The storage key of the object.
+        expected (int): The version the caller read.
+        actual (int): The version saved since, or None if the object was
+        deleted.
+    """
+
+    def __init__(self, key, expected, actual):
+        """
+        Initializes the error.
+
+        Args:
+            key: The storage key of the object.
+            expected: The version the caller read.
+            actual: The version saved since, or None.
+        """
+        if actual is None:
+            message = "{} was deleted".format(key)
+        else:
+            message = "{} is at version {}, not {}".format(
+                key, actual, expected)
+        super().__init__(message)
+        self.key = key
+        self.expected = expected
+        self.actual = actual
+
+
 class BaseModel:
     """
     Represents a base model with common attributes and methods.
@@ -21,11 +53,15 @@ class BaseModel:
         id (str): A unique identifier for the object (UUID).
         created_at (datetime): The datetime when the object was created.
         updated_at (datetime): The datetime when the object was last updated.
+        version (int): The number of saves that persisted a change to the
+        object (0 until it is first saved). The storage increments it.
 
     Methods:
         __init__(self, *args, **kwargs):
             Initializes the object with a unique ID, timestamps, and
             optional keyword arguments.
+        __setattr__(self, name, value):
+            Sets an attribute and marks the object as changed in storage.
         save(self):
             Updates the updated_at timestamp and saves the object to storage.
         to_dict(self):
@@ -37,6 +73,8 @@ class BaseModel:
             ID, and all attributes.
     """
 
+    version = 0
+
     def __init__(self, *args, **kwargs):
         """
         Initializes the object with a unique ID, timestamps, and
@@ -45,6 +83,8 @@ class BaseModel:
         Args:
             *args: Unused arguments (for future compatibility).
             **kwargs: Keyword arguments used to set object attributes.
+            Those naming read-only properties (such as State.cities) are
+            ignored.
         """
         if (len(kwargs) == 0):
             self.id = str(uuid.uuid4())
@@ -52,13 +92,26 @@ class BaseModel:
             self.updated_at = datetime.now()
             models.storage.new(self)
         else:
-            kwargs["created_at"] = datetime.strptime(kwargs["created_at"],
-                                                     "%Y-%m-%dT%H:%M:%S.%f")
-            kwargs["updated_at"] = datetime.strptime(kwargs["updated_at"],
-                                                     "%Y-%m-%dT%H:%M:%S.%f")
+            kwargs["created_at"] = datetime.fromisoformat(
+                kwargs["created_at"])
+            kwargs["updated_at"] = datetime.fromisoformat(
+                kwargs["updated_at"])
             for key, val in kwargs.items():
-                if "__class__" not in key:
-                    setattr(self, key, val)
+                if "__class__" in key:
+                    continue
+                attr = getattr(type(self), key, None)
+                if isinstance(attr, property) and attr.fset is None:
+                    continue
+                setattr(self, key, val)
+
+    def __setattr__(self, name, value):
+        """
+        Sets an attribute and marks the object as dirty in storage, so the
+        next save serializes it again instead of reusing its cached record.
+        """
+        super().__setattr__(name, value)
+        if "id" in self.__dict__:
+            models.storage.touch(self, name)
 
     def save(self):
         """
@@ -4,6 +4,7 @@ This script defines a class `City` that inherits from `BaseModel`.
 
 A city is a location within a state and can have many associated places.
 """
+import models
 from models.base_model import BaseModel
 
 
@@ -14,6 +15,8 @@ class City(BaseModel):
     Attributes:
         state_id (str): The ID of the state the city belongs to.
         name (str): The name of the city.
+        places (list): The places of the city (read-only).
+        _indexes (tuple): The storage index declared on state_id.
 
     Inherits from the BaseModel class which provides common functionality
     for managing objects in the application.
@@ -21,3 +24,14 @@ class City(BaseModel):
 
     state_id = ""
     name = ""
+
+    _indexes = (("hash", "state_id"),)
+
+    @property
+    def places(self):
+        """
+        Returns the Place instances whose city_id is this city's id,
+        through the storage index on Place.city_id.
+        """
+        return list(models.storage.lookup("Place", "city_id",
+                                          self.id).values())
@@ -0,0 +1,514 @@
+#!/usr/bin/python3
+"""
+This script defines a storage engine keeping objects in a SQLite database.
+
+Every model class gets its own table holding the JSON representation of
+its instances, keyed by id, with expression indexes on the attributes the
+model declares in `_indexes`. Writes touch only the rows of the objects
+that changed, and lookups are answered by SQLite through those indexes.
+"""
+import json
+import math
+import os
+import re
+import sqlite3
+from datetime import datetime
+from itertools import islice
+from models.engine.indexes import GridIndex, TextIndex, tokenize
+from models.engine.indexes import EARTH_RADIUS_KM
+from models.engine.query import parse_filters, matches, OPERATORS
+from models.base_model import BaseModel, ConflictError
+from models.user import User
+from models.amenity import Amenity
+from models.place import Place
+from models.review import Review
+from models.state import State
+from models.city import City
+
+classes = {"BaseModel": BaseModel, "User": User, "Amenity": Amenity,
+           "Place": Place, "Review": Review, "State": State, "City": City}
+
+SQL_OPERATORS = {"eq": "=", "ne": "!=", "lt": "<", "le": "<=",
+                 "gt": ">", "ge": ">="}
+
+
+class DBStorage:
+    """
+    A class that stores objects in a SQLite database, with the same
+    interface as FileStorage.
+
+    Attributes:
+        path: The path of the database file (default: the HBNB_SQLITE_DB
+        environment variable, or "hbnb.db").
+        __objects: The objects loaded from or added to the database
+        (key: object ID, value: object), so that each row is represented
+        by a single instance.
+        __pending: The changes not written to the current transaction yet
+        (key: object ID, value: the object, or None when it was deleted).
+        __unsaved: The changes made since the last commit, written to the
+        current transaction or not (same keys and values as __pending).
+
+    Reads write the pending changes to the current transaction first, so
+    SQLite sees them, but versions are only incremented by the commits of
+    `save` and `update`, once per committed change.
+    """
+
+    def __init__(self, *, path=None):
+        """
+        Initializes the storage engine. The database is opened by `reload`.
+
+        Args:
+            path: The path of the database file.
+        """
+        self.path = path or os.getenv("HBNB_SQLITE_DB", "hbnb.db")
+        self.__connection = None
+        self.__objects = {}
+        self.__pending = {}
+        self.__unsaved = {}
+
+    def __db(self):
+        """
+        Returns the database connection, opening it and creating the
+        tables and indexes on first use.
+        """
+        if self.__connection is None:
+            self.__connection = sqlite3.connect(self.path)
+            for name, cls in classes.items():
+                self.__connection.execute(
+                    'CREATE TABLE IF NOT EXISTS "{}" (id TEXT PRIMARY KEY, '
+                    'data TEXT NOT NULL) WITHOUT ROWID'.format(name))
+                for kind, attribute, *_ in getattr(cls, "_indexes", ()):
+                    if kind not in ("hash", "sorted", "grid"):
+                        continue
+                    self.__connection.execute(
+                        'CREATE INDEX IF NOT EXISTS "{0}_{1}" ON "{0}" ({2})'
+                        .format(name, attribute, self.__column(attribute)))
+            self.__connection.commit()
+        return self.__connection
+
+    def __column(self, attribute):
+        """
+        Returns the SQL expression extracting an attribute from a row.
+
+        Raises:
+            ValueError: If the attribute name is not a plain identifier.
+        """
+        if not re.fullmatch(r"[A-Za-z_]\w*", attribute):
+            raise ValueError("invalid attribute name: {}".format(attribute))
+        return "json_extract(data, '$.{}')".format(attribute)
+
+    def __class_name(self, cls):
+        """
+        Returns the name of a model class given as a class or a name,
+        or None if it is not a model class.
+        """
+        if not isinstance(cls, str):
+            cls = cls.__name__
+        return cls if cls in classes else None
+
+    def __load(self, cls_name, obj_id, data):
+        """
+        Returns the instance of a row, building it on first access.
+        """
+        key = "{}.{}".format(cls_name, obj_id)
+        obj = self.__objects.get(key)
+        if obj is None:
+            obj = classes[cls_name](**json.loads(data))
+            self.__objects[key] = obj
+        return obj
+
+    def __flush(self):
+        """
+        Writes the rows of the pending changes in the current transaction.
+        """
+        if not self.__pending:
+            return
+        db = self.__db()
+        for key, obj in self.__pending.items():
+            cls_name, obj_id = key.split('.', 1)
+            if obj is None:
+                db.execute('DELETE FROM "{}" WHERE id = ?'.format(cls_name),
+                           (obj_id,))
+            else:
+                db.execute('INSERT OR REPLACE INTO "{}" (id, data) '
+                           'VALUES (?, ?)'.format(cls_name),
+                           (obj.id, json.dumps(obj.to_dict())))
+        self.__pending.clear()
+
+    def __commit(self):
+        """
+        Commits the changes made since the last commit, incrementing the
+        version of every object changed.
+        """
+        for key, obj in self.__unsaved.items():
+            if obj is not None:
+                obj.__dict__["version"] = obj.version + 1
+            self.__pending[key] = obj
+        self.__flush()
+        self.__db().commit()
+        self.__unsaved.clear()
+
+    def new(self, obj):
+        """
+        Adds a new object to the database.
+
+        Args:
+            obj: The object to be added.
+        """
+        key = "{}.{}".format(obj.__class__.__name__, obj.id)
+        self.__objects[key] = obj
+        self.__pending[key] = obj
+        self.__unsaved[key] = obj
+
+    def touch(self, obj, name=None):
+        """
+        Marks a stored object as changed so its row is written again.
+
+        Args:
+            obj: The object that was modified.
+            name: The name of the modified attribute (unused).
+        """
+        key = "{}.{}".format(obj.__class__.__name__, obj.id)
+        if self.__objects.get(key) is obj:
+            self.__pending[key] = obj
+            self.__unsaved[key] = obj
+
+    def delete(self, obj):
+        """
+        Deletes the row of an object.
+
+        Args:
+            obj: The object to be removed.
+        """
+        cls_name = obj.__class__.__name__
+        key = "{}.{}".format(cls_name, obj.id)
+        self.__objects.pop(key, None)
+        self.__pending.pop(key, None)
+        if cls_name in classes:
+            self.__unsaved[key] = None
+            self.__db().execute('DELETE FROM "{}" WHERE id = ?'
+                                .format(cls_name), (obj.id,))
+
+    def all(self):
+        """
+        Returns a dictionary containing all stored objects.
+
+        Returns:
+            A dictionary (key: object ID, value: object).
+        """
+        result = {}
+        for cls_name in classes:
+            result.update(self.all_by_class(cls_name))
+        return result
+
+    def snapshot(self):
+        """
+        Returns a dictionary containing all stored objects; `all` already
+        returns a new dictionary.
+
+        Returns:
+            A dictionary (key: object ID, value: object).
+        """
+        return self.all()
+
+    def all_by_class(self, cls):
+        """
+        Returns a dictionary containing the stored objects of one class.
+
+        Args:
+            cls: The class, or the name of the class, to look up.
+
+        Returns:
+            A dictionary (key: object ID, value: object).
+        """
+        cls_name = self.__class_name(cls)
+        if cls_name is None:
+            return {}
+        self.__flush()
+        rows = self.__db().execute('SELECT id, data FROM "{}"'
+                                   .format(cls_name))
+        return {"{}.{}".format(cls_name, obj_id):
+                self.__load(cls_name, obj_id, data) for obj_id, data in rows}
+
+    def get(self, cls, obj_id):
+        """
+        Returns the stored object of a class with an id, or None.
+
+        Args:
+            cls: The class, or the name of the class, to look up.
+            obj_id: The id of the object.
+        """
+        cls_name = self.__class_name(cls)
+        if cls_name is None:
+            return None
+        key = "{}.{}".format(cls_name, obj_id)
+        if key in self.__objects:
+            return self.__objects[key]
+        row = self.__db().execute('SELECT data FROM "{}" WHERE id = ?'
+                                  .format(cls_name), (obj_id,)).fetchone()
+        return None if row is None else self.__load(cls_name, obj_id, row[0])
+
+    def count(self, cls=None):
+        """
+        Returns the number of stored objects.
+
+        Args:
+            cls: The class, or the name of the class, to count
+            (default: count every object).
+        """
+        if cls is None:
+            return sum(self.count(cls_name) for cls_name in classes)
+        cls_name = self.__class_name(cls)
+        if cls_name is None:
+            return 0
+        self.__flush()
+        return self.__db().execute('SELECT COUNT(*) FROM "{}"'
+                                   .format(cls_name)).fetchone()[0]
+
+    def lookup(self, cls, attribute, value):
+        """
+        Returns the stored objects of a class whose attribute equals a
+        value.
+
+        Args:
+            cls: The class, or the name of the class, to look up.
+            attribute: The name of the attribute to match.
+            value: The value to match.
+
+        Returns:
+            A dictionary (key: object ID, value: object).
+        """
+        return {"{}.{}".format(obj.__class__.__name__, obj.id): obj
+                for obj in self.query(cls, **{attribute: value})}
+
+    def __select(self, cls_name, conditions, order_by, limit):
+        """
+        Translates a query into SQL. Conditions SQLite cannot evaluate
+        are returned to be checked in Python.
+
+        Returns:
+            A tuple of (sql, parameters, remaining conditions, whether
+            the limit was applied in SQL).
+        """
+        cls = classes[cls_name]
+        where, params, remaining = [], [], []
+        for attribute, op, value in conditions:
+            column = self.__column(attribute)
+            if op == "in" and isinstance(value, (list, tuple, set)):
+                values = list(value)
+                sql = "{} IN ({})".format(column,
+                                          ", ".join("?" * len(values)))
+            elif op in SQL_OPERATORS and isinstance(value, (str, int,
+                                                            float)):
+                values = [value]
+                sql = "{} {} ?".format(column, SQL_OPERATORS[op])
+            else:
+                remaining.append((attribute, op, value))
+                continue
+            default = getattr(cls, attribute, None)
+            if default is not None and matches(cls, [(attribute, op,
+                                                      value)]):
+                sql = "({} IS NULL OR {})".format(column, sql)
+            where.append(sql)
+            params.extend(values)
+        sql = 'SELECT id, data FROM "{}"'.format(cls_name)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        if order_by:
+            sql += " ORDER BY {}{}".format(self.__column(order_by.lstrip("-")),
+                                           " DESC" if order_by[0] == "-"
+                                           else "")
+        pushed = limit is not None and not remaining
+        if pushed:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return sql, params, remaining, pushed
+
+    def query(self, cls, order_by=None, limit=None, **filters):
+        """
+        Returns an iterator over the stored objects of a class that
+        satisfy every filter, evaluated by SQLite where possible (see
+        FileStorage.query for the filters). Objects still holding the
+        class default of the ordering attribute come first.
+
+        Args:
+            cls: The class, or the name of the class, to query.
+            order_by: The attribute to order by, prefixed with "-" for
+            descending order.
+            limit: The maximum number of objects to return.
+            **filters: Conditions named "<attribute>[__<operator>]".
+
+        Returns:
+            An iterator over the matching objects.
+        """
+        conditions = parse_filters(filters)
+        cls_name = self.__class_name(cls)
+        if cls_name is None:
+            return iter(())
+        sql, params, remaining, pushed = self.__select(cls_name, conditions,
+                                                       order_by, limit)
+        self.__flush()
+        rows = self.__db().execute(sql, params)
+        result = (obj for obj in (self.__load(cls_name, obj_id, data)
+                                  for obj_id, data in rows)
+                  if matches(obj, remaining))
+        return result if pushed else islice(result, limit)
+
+    def explain(self, cls, order_by=None, limit=None, **filters):
+        """
+        Describes how SQLite would answer the same `query` call.
+
+        Returns:
+            A dictionary with the generated SQL, SQLite's query plan and
+            the conditions left to check in Python.
+        """
+        cls_name = self.__class_name(cls)
+        sql, params, remaining, _ = self.__select(
+            cls_name, parse_filters(filters), order_by, limit)
+        plan = self.__db().execute("EXPLAIN QUERY PLAN " + sql, params)
+        return {"class": cls_name, "sql": sql,
+                "plan": [row[-1] for row in plan], "remaining": remaining}
+
+    def nearby(self, cls, latitude, longitude, radius_km):
+        """
+        Returns the stored objects of a class located within a distance
+        of a point, nearest first. SQLite narrows the candidates to the
+        band of latitudes the circle spans.
+
+        Returns:
+            A list of (distance in km, object) tuples.
+        """
+        d_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+        index = GridIndex("latitude", "longitude")
+        for obj in self.query(cls, latitude__ge=latitude - d_lat,
+                              latitude__le=latitude + d_lat):
+            index.add("{}.{}".format(obj.__class__.__name__, obj.id), obj)
+        return [(distance, obj) for distance, key, obj in
+                index.nearby(latitude, longitude, radius_km)]
+
+    def within(self, cls, south, west, north, east):
+        """
+        Returns the stored objects of a class located inside a bounding
+        box (see GridIndex.within).
+
+        Returns:
+            A dictionary (key: object ID, value: object).
+        """
+        index = GridIndex("latitude", "longitude")
+        for obj in self.query(cls, latitude__ge=south, latitude__le=north):
+            index.add("{}.{}".format(obj.__class__.__name__, obj.id), obj)
+        return index.within(south, west, north, east)
+
+    def search(self, cls, text, mode="and", attribute=None, limit=None):
+        """
+        Returns the stored objects of a class whose text attributes
+        contain the words of a text, best matches first (see
+        FileStorage.search). The text indexes are built for the call.
+
+        Returns:
+            A list of (score, object) tuples.
+        """
+        cls_name = self.__class_name(cls)
+        if cls_name is None:
+            return []
+        bucket = self.all_by_class(cls_name)
+        terms = tokenize(text)
+        scores = {}
+        found = {term: set() for term in terms}
+        for kind, name, *_ in getattr(classes[cls_name], "_indexes", ()):
+            if kind != "text" or attribute not in (None, name):
+                continue
+            index = TextIndex(name)
+            for key, obj in bucket.items():
+                index.add(key, obj)
+            for key, score in index.search(terms, "or").items():
+                scores[key] = scores.get(key, 0.0) + score
+            for term in found:
+                found[term].update(index.search([term], "or"))
+        if mode == "and":
+            for keys in found.values():
+                scores = {key: scores[key] for key in keys if key in scores}
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(score, bucket[key]) for key, score in ranked[:limit]]
+
+    def save(self):
+        """
+        Writes the rows of the changed objects and commits.
+        """
+        self.__commit()
+
+    def update(self, obj, version, /, **attributes):
+        """
+        Sets attributes of a stored object and commits it at once,
+        provided its row (which other connections may have written) is
+        still at the version the caller read. Changes not saved yet, to
+        the object or others, are committed along: the rows reads wrote
+        for them are rolled back first and written again after the check,
+        which therefore only sees committed rows.
+
+        Args:
+            obj: The stored object.
+            version: The version of the object the caller read.
+            **attributes: The attributes to set.
+
+        Returns:
+            The new version of the object.
+
+        Raises:
+            ConflictError: If the row is at another version or was
+            deleted; the object then holds the state saved last.
+        """
+        cls_name = obj.__class__.__name__
+        key = "{}.{}".format(cls_name, obj.id)
+        db = self.__db()
+        if db.in_transaction:
+            db.rollback()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            if self.__objects.get(key) is not obj:
+                raise ConflictError(key, version, None)
+            row = db.execute('SELECT data FROM "{}" WHERE id = ?'
+                             .format(cls_name), (obj.id,)).fetchone()
+            if row is None and key not in self.__unsaved:
+                self.__objects.pop(key, None)
+                raise ConflictError(key, version, None)
+            actual = obj.version
+            if row is not None:
+                saved = json.loads(row[0])
+                actual = saved.get("version", 0)
+                if actual != obj.version and key not in self.__unsaved:
+                    fresh = classes[cls_name](**saved)
+                    obj.__dict__.clear()
+                    obj.__dict__.update(fresh.__dict__)
+            if actual != version:
+                raise ConflictError(key, version, actual)
+            for name, value in attributes.items():
+                setattr(obj, name, value)
+            obj.updated_at = datetime.now()
+            self.__unsaved[key] = obj
+            self.__commit()
+        except BaseException:
+            db.rollback()
+            self.__pending.update(self.__unsaved)
+            self.__flush()
+            raise
+        return obj.version
+
+    def reload(self):
+        """
+        Opens the database, creating its tables if needed, and forgets
+        the objects loaded so far so they are read again from the rows.
+        """
+        self.__db()
+        self.__objects = {}
+        self.__pending = {}
+        self.__unsaved = {}
+
+    def close(self):
+        """
+        Commits the pending changes and closes the database.
+        """
+        if self.__connection is not None:
+            self.save()
+            self.__connection.close()
+            self.__connection = None
@@ -2,9 +2,29 @@
 """
 This script defines a class for storing and retrieving objects in JSON format.
 """
+import asyncio
+import atexit
 import json
+import multiprocessing
 import os
-from models.base_model import BaseModel
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+from models.engine.indexes import build_indexes, tokenize
+from models.engine.indexes import GridIndex, SortedIndex, TextIndex
+from models.engine.query import parse_filters, matches, order
+from models.engine.rwlock import RWLock
+from models.engine.stream import CHECKSUMS, checksum, scan_records
+from models.engine.stream import parse_records, split_records, write_records
+from models.base_model import BaseModel, ConflictError
 from models.user import User
 from models.amenity import Amenity
 from models.place import Place
@@ -12,6 +32,9 @@ from models.review import Review
 from models.state import State
 from models.city import City
 
+classes = {"BaseModel": BaseModel, "User": User, "Amenity": Amenity,
+           "Place": Place, "Review": Review, "State": State, "City": City}
+
 
 class FileStorage:
     """
@@ -22,11 +45,208 @@ class FileStorage:
         are stored (default: "file.json").
         __objects: A dictionary that stores all objects
         (key: object ID, value: object).
+        __pending: A dictionary of the keys changed since the last save
+        (value: the object, or None when it was deleted).
+        __records: A cache of the last serialized form of every object
+        (key: object ID, value: (object, JSON text)).
+        __journal_entries: The number of records appended to the journal
+        since the last snapshot.
+        __classes: An index of the stored objects by class
+        (key: class name, value: {object ID: object}).
+        __secondary: The secondary indexes declared by the models
+        (key: class name, value: list of indexes).
+        __indexed: The objects dictionary the indexes were built from.
+        __raw: The records loaded by a lazy reload and not materialized yet
+        (key: class name, value: {object ID: record dictionary}).
+        __recovery: The report of the last reload (see recovery_report).
+        __lock: The readers-writer lock guarding the storage: queries
+        hold it for reading, changes and writes for writing.
+        __generation: The number of snapshots written in the foreground,
+        which tells whether a background snapshot is out of date.
+        __disk: The state of the files as this process last read or wrote
+        them: (identity of the snapshot, or None; size of the journal).
+        __lock_fd: The descriptor of the lock file while this process
+        holds the file lock, or None.
+        __lock_exclusive: True while the file lock is held exclusively.
+        __overtaken: The versions other processes saved of the objects
+        with a change pending here (key: object ID, value: version, or
+        None when deleted).
+        __shared: The names of the classes whose dictionary in __classes
+        a query iterates over; it is copied before it next changes.
+        __stamped: The keys whose version `update` already incremented for
+        the next write.
+        __saving: The changes written by the snapshots that `__install`
+        is writing outside the lock (one dictionary per snapshot, like
+        __pending).
+
+    In journal mode, `save` appends only the pending changes to
+    "<file_path>.journal" instead of rewriting the whole snapshot, and
+    `reload` replays the journal on top of the snapshot. The journal is
+    folded back into the snapshot by `compact`, which `save` triggers on
+    its own once the journal holds more records than the store.
+
+    The snapshot is never overwritten in place: it is written to a
+    temporary file next to it, optionally flushed to disk, and renamed
+    over the previous snapshot, so a crash leaves either the old or the
+    new snapshot, never a truncated one. Saves write that file after
+    releasing the readers-writer lock (see `__install`), so the threads
+    and coroutines changing objects meanwhile do not wait for the disk.
+
+    In lazy mode, `reload` only parses the JSON file and keeps the records
+    as dictionaries; the objects of a class are built the first time the
+    class is accessed (or a single object, by `get`), and `all` builds
+    every remaining object. Records never accessed are saved unchanged.
+
+    Saves can be coalesced: inside a `batch` block, or within
+    `save_window` seconds of the previous write, `save` only records
+    that a write is owed. The owed write happens at the end of the
+    outermost batch, on the first save after the window, on `flush`, or
+    when the process exits.
+
+    In background mode, snapshots are written by a forked child process
+    working on a copy-on-write image of the objects (see `bgsave`), so a
+    save returns before the snapshot is written.
+
+    The storage can be shared by threads. Lookups and queries hold a
+    readers-writer lock for reading, so they run concurrently, while
+    changes, saves and reloads hold it for writing. `all` returns the
+    storage's own dictionary; other threads iterate over `snapshot`.
+
+    In write-behind mode, a deferred save is written by a background
+    thread at most `flush_interval` seconds later, or as soon as
+    `flush_threshold` objects are waiting to be written. `close` stops
+    the thread after writing what is owed.
+
+    With `reload_workers` above 1, reloading a snapshot of at least
+    `reload_min_bytes` cuts it into ranges of whole records, which a pool
+    of forked processes parses and turns into objects in parallel (see
+    `__load_parallel`).
+
+    Coroutines use `asave`, `areload` and `aquery`, which run the work
+    in executor threads so the event loop goes on meanwhile. Saves and
+    reloads run one at a time on a single writer thread, and the saves
+    requested while one is waiting to start share it.
+
+    Several processes can share the same files. Writes hold an advisory
+    lock on "<file_path>.lock" exclusively and reloads hold it shared
+    (where fcntl is available). Before writing, the records other
+    processes saved since this one last read or wrote the files are
+    merged in: only the records whose text changed are built again, and
+    the changes pending in this process win over the records they
+    replace. `refresh` merges them without writing.
     """
     __file_path = "file.json"
 
     __objects = {}
 
+    __pending = {}
+
+    __records = {}
+
+    __journal_entries = 0
+
+    __classes = {}
+
+    __secondary = {}
+
+    __indexed = None
+
+    __raw = {}
+
+    __recovery = {}
+
+    __lock = RWLock()
+
+    __generation = 0
+
+    __disk = (None, 0)
+
+    __lock_fd = None
+
+    __lock_exclusive = False
+
+    __overtaken = {}
+
+    __shared = set()
+
+    __stamped = set()
+
+    __saving = []
+
+    def __init__(self, *, journal=False, journal_min_entries=1000,
+                 lazy=False, fsync=False, fsync_directory=False,
+                 save_window=0.0, write_behind=False, flush_interval=1.0,
+                 flush_threshold=1000, background=False, reload_workers=1,
+                 reload_min_bytes=1 << 20):
+        """
+        Initializes the storage engine.
+
+        Args:
+            journal: If True, saves append changed records to the journal.
+            journal_min_entries: The journal is never compacted
+            automatically before it holds this many records.
+            lazy: If True, reload defers building the objects until they
+            are accessed.
+            fsync: If True, saves flush the snapshot or journal to disk
+            before returning.
+            fsync_directory: If True, the directory holding the snapshot
+            is also flushed after the snapshot is replaced, so that the
+            replacement itself survives a power loss.
+            save_window: The minimum number of seconds between two
+            writes; saves issued sooner are deferred.
+            write_behind: If True, saves are deferred and written by a
+            background thread.
+            flush_interval: The longest time, in seconds, a deferred save
+            waits for the background thread.
+            flush_threshold: The number of changed objects that makes the
+            background thread write without waiting.
+            background: If True, snapshots are written by a forked child
+            process (see bgsave).
+            reload_workers: The number of processes building the objects
+            of a reload in parallel (1: build them in this process).
+            reload_min_bytes: The size of the smallest snapshot reloaded
+            in parallel.
+        """
+        self.journal = journal
+        self.journal_min_entries = journal_min_entries
+        self.lazy = lazy
+        self.fsync = fsync
+        self.fsync_directory = fsync_directory
+        self.save_window = save_window
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.__owed = False
+        self.__owed_at = None
+        self.__batches = 0
+        self.__written_at = None
+        self.__at_exit = False
+        self.__wake = threading.Event()
+        self.__flusher = None
+        self.__stopping = False
+        self.background = background
+        self.reload_workers = reload_workers
+        self.reload_min_bytes = reload_min_bytes
+        self.__child = None
+        self.__rerun = False
+        self.__last_bgsave = None
+        self.__executor = None
+        self.__queued = None
+        self.__queue_lock = threading.Lock()
+
+    def journal_path(self):
+        """
+        Returns the path of the journal file next to the snapshot.
+        """
+        return FileStorage.__file_path + ".journal"
+
+    def text_index_path(self):
+        """
+        Returns the path of the file persisting the full-text indexes
+        next to the snapshot.
+        """
+        return FileStorage.__file_path + ".text"
+
     def new(self, obj):
         """
         Adds a new object to the storage dictionary.
@@ -38,7 +258,53 @@ class FileStorage:
 
         key = "{}.{}".format(obj_cls_name, obj.id)
 
-        FileStorage.__objects[key] = obj
+        with FileStorage.__lock.write():
+            FileStorage.__raw.get(obj_cls_name, {}).pop(key, None)
+            FileStorage.__objects[key] = obj
+            FileStorage.__pending[key] = obj
+            self.__index_add(key, obj)
+
+    def touch(self, obj, name=None):
+        """
+        Marks a stored object as dirty so the next save serializes and
+        persists it again, and refreshes the indexes covering the
+        modified attribute.
+
+        Args:
+            obj: The object that was modified.
+            name: The name of the modified attribute
+            (default: refresh every index of the object).
+
+        Objects that are not stored, such as those a reload is building,
+        are left alone without taking the lock.
+        """
+        key = "{}.{}".format(obj.__class__.__name__, obj.id)
+        if FileStorage.__objects.get(key) is not obj:
+            return
+
+        with FileStorage.__lock.write():
+            if FileStorage.__objects.get(key) is obj:
+                FileStorage.__pending[key] = obj
+                for index in FileStorage.__secondary.get(
+                        obj.__class__.__name__, ()):
+                    if name is None or name in index.attributes:
+                        index.add(key, obj)
+
+    def delete(self, obj):
+        """
+        Removes an object from the storage dictionary.
+
+        Args:
+            obj: The object to be removed.
+        """
+        key = "{}.{}".format(obj.__class__.__name__, obj.id)
+
+        with FileStorage.__lock.write():
+            raw = FileStorage.__raw.get(obj.__class__.__name__, {})
+            if (FileStorage.__objects.pop(key, None) is not None or
+                    raw.pop(key, None) is not None):
+                FileStorage.__pending[key] = None
+                self.__index_remove(key, obj)
 
     def all(self):
         """
@@ -47,41 +313,1753 @@ class FileStorage:
         Returns:
             A dictionary containing all stored objects
             (key: object ID, value: object).
+
+        The dictionary is the storage's own: threads other than the one
+        changing the storage should iterate over `snapshot` instead.
         """
+        self.__ready()
         return FileStorage.__objects
 
+    def snapshot(self):
+        """
+        Returns a copy of the dictionary of all stored objects, taken
+        while no other thread changes the storage.
+
+        Returns:
+            A dictionary (key: object ID, value: object).
+        """
+        self.__ready()
+        with FileStorage.__lock.read():
+            return dict(FileStorage.__objects)
+
+    def all_by_class(self, cls):
+        """
+        Returns a dictionary containing the stored objects of one class,
+        in time proportional to the number of objects of that class.
+
+        Args:
+            cls: The class, or the name of the class, to look up.
+
+        Returns:
+            A dictionary (key: object ID, value: object).
+        """
+        if not isinstance(cls, str):
+            cls = cls.__name__
+        self.__ready(cls)
+        with FileStorage.__lock.read():
+            return dict(FileStorage.__classes.get(cls, {}))
+
+    def get(self, cls, obj_id):
+        """
+        Returns the stored object of a class with an id, or None.
+
+        Args:
+            cls: The class, or the name of the class, to look up.
+            obj_id: The id of the object.
+        """
+        if not isinstance(cls, str):
+            cls = cls.__name__
+        key = "{}.{}".format(cls, obj_id)
+        if key in FileStorage.__raw.get(cls, ()):
+            with FileStorage.__lock.write():
+                record = FileStorage.__raw.get(cls, {}).pop(key, None)
+                if record is not None:
+                    self.__materialize(key, record)
+        return FileStorage.__objects.get(key)
+
+    def count(self, cls=None):
+        """
+        Returns the number of stored objects, without scanning them.
+
+        Args:
+            cls: The class, or the name of the class, to count
+            (default: count every object).
+
+        Returns:
+            The number of stored objects of `cls`.
+        """
+        if cls is not None and not isinstance(cls, str):
+            cls = cls.__name__
+        self.__ready(cls, hydrate=False)
+        with FileStorage.__lock.read():
+            if cls is None:
+                return len(FileStorage.__objects) + sum(
+                    map(len, FileStorage.__raw.values()))
+            return (len(FileStorage.__classes.get(cls, {})) +
+                    len(FileStorage.__raw.get(cls, {})))
+
+    def lookup(self, cls, attribute, value):
+        """
+        Returns the stored objects of a class whose attribute equals a
+        value, through the index declared on that attribute if any.
+
+        Args:
+            cls: The class, or the name of the class, to look up.
+            attribute: The name of the attribute to match.
+            value: The value to match.
+
+        Returns:
+            A dictionary (key: object ID, value: object).
+        """
+        if not isinstance(cls, str):
+            cls = cls.__name__
+        return {"{}.{}".format(cls, obj.id): obj
+                for obj in self.query(cls, **{attribute: value})}
+
+    def query(self, cls, order_by=None, limit=None, **filters):
+        """
+        Returns an iterator over the stored objects of a class that
+        satisfy every filter. The most selective index able to serve one
+        of the filters provides the candidates; without one, the objects
+        of the class are scanned. Results ordered by an attribute with a
+        sorted index are read from the index in order, so the first
+        `limit` results are found without sorting the class.
+
+        The iterator is not affected by later changes to the storage, yet
+        does not copy the candidates: it walks the class dictionary or
+        sorted index as they were when `query` was called, and the next
+        change to them replaces them with a copy instead of changing them
+        in place. Candidates found through another index are collected in
+        a new dictionary, and results ordered without a sorted index are
+        sorted in a list. With a limit, the results are collected at once.
+
+        Args:
+            cls: The class, or the name of the class, to query.
+            order_by: The attribute to order by, prefixed with "-" for
+            descending order (default: no particular order).
+            limit: The maximum number of objects to return.
+            **filters: Conditions named "<attribute>[__<operator>]"
+            (see models.engine.query).
+
+        Returns:
+            An iterator over the matching objects.
+        """
+        if not isinstance(cls, str):
+            cls = cls.__name__
+        conditions = parse_filters(filters)
+        self.__ready(cls)
+        with FileStorage.__lock.read():
+            index, condition, _, ordered = self.__strategy(cls, conditions,
+                                                           order_by)
+            reverse = bool(order_by) and order_by.startswith("-")
+            if ordered is not None:
+                op, value = (None, None) if index is None else condition[1:]
+                candidates = (obj for key, obj in
+                              ordered.ordered(reverse, op, value))
+            elif index is None:
+                FileStorage.__shared.add(cls)
+                candidates = FileStorage.__classes.get(cls, {}).values()
+            else:
+                candidates = index.search(condition[1],
+                                          condition[2]).values()
+            if limit is not None:
+                result = (obj for obj in candidates
+                          if matches(obj, conditions))
+                if order_by and ordered is None:
+                    return iter(order(result, order_by.lstrip("-"),
+                                      reverse, limit))
+                return iter(list(islice(result, limit)))
+        result = (obj for obj in candidates if matches(obj, conditions))
+        if order_by and ordered is None:
+            result = iter(order(result, order_by.lstrip("-"), reverse))
+        return result
+
+    def explain(self, cls, order_by=None, limit=None, **filters):
+        """
+        Describes how `query` would answer the same call.
+
+        Args:
+            cls: The class, or the name of the class, to query.
+            order_by: The ordering, as for `query`.
+            limit: The maximum number of objects, as for `query`.
+            **filters: The conditions, as for `query`.
+
+        Returns:
+            A dictionary with the access method ("index" or "scan"), the
+            index attribute and operator used, the estimated number of
+            candidate objects, and how results are ordered ("index",
+            "sort" or None).
+        """
+        if not isinstance(cls, str):
+            cls = cls.__name__
+        conditions = parse_filters(filters)
+        self.__ready(cls)
+        with FileStorage.__lock.read():
+            index, condition, estimate, ordered = self.__strategy(
+                cls, conditions, order_by)
+        plan = {"class": cls, "access": "scan", "index": None,
+                "operator": None, "estimate": estimate, "order": None}
+        if index is not None:
+            plan.update(access="index", index=condition[0],
+                        operator=condition[1])
+        if order_by:
+            plan["order"] = "sort" if ordered is None else "index"
+        return plan
+
+    def __strategy(self, cls, conditions, order_by):
+        """
+        Chooses how to answer a query.
+
+        Args:
+            cls: The name of the queried class.
+            conditions: The parsed conditions of the query.
+            order_by: The requested ordering, or None.
+
+        Returns:
+            A tuple of (index, condition, estimate, ordered), where
+            `ordered` is the sorted index to read results from in order,
+            or None when results need sorting (or no order was asked).
+        """
+        index, condition, estimate = self.__plan(cls, conditions)
+        if not order_by:
+            return index, condition, estimate, None
+        attribute = order_by.lstrip("-")
+        for candidate in FileStorage.__secondary.get(cls, ()):
+            if (candidate.attributes == (attribute,) and
+                    hasattr(candidate, "ordered") and
+                    index in (None, candidate)):
+                return index, condition, estimate, candidate
+        return index, condition, estimate, None
+
+    def __plan(self, cls, conditions):
+        """
+        Picks the index yielding the fewest candidates for a query.
+
+        Args:
+            cls: The name of the queried class.
+            conditions: The parsed conditions of the query.
+
+        Returns:
+            A tuple of (index, condition, estimate); index and condition
+            are None when scanning the class is the only option.
+        """
+        best = (None, None, len(FileStorage.__classes.get(cls, {})))
+        for condition in conditions:
+            for index in FileStorage.__secondary.get(cls, ()):
+                if (index.attributes[0] != condition[0] or
+                        not hasattr(index, "estimate")):
+                    continue
+                estimate = index.estimate(condition[1], condition[2])
+                if estimate is not None and (best[0] is None or
+                                             estimate < best[2]):
+                    best = (index, condition, estimate)
+        return best
+
+    def search(self, cls, text, mode="and", attribute=None, limit=None):
+        """
+        Returns the stored objects of a class whose indexed text
+        attributes contain all ("and") or any ("or") of the words of a
+        text, best matches first.
+
+        Args:
+            cls: The class, or the name of the class, to search.
+            text: The words to look for.
+            mode: "and" or "or".
+            attribute: The only text attribute to search
+            (default: every text index of the class).
+            limit: The maximum number of results.
+
+        Returns:
+            A list of (score, object) tuples.
+        """
+        if not isinstance(cls, str):
+            cls = cls.__name__
+        terms = tokenize(text)
+        self.__ready(cls)
+        with FileStorage.__lock.read():
+            bucket = FileStorage.__classes.get(cls, {})
+            indexes = [index for index in FileStorage.__secondary.get(cls, ())
+                       if isinstance(index, TextIndex) and
+                       attribute in (None, index.attribute)]
+            scores = {}
+            for index in indexes:
+                for key, score in index.search(terms, "or").items():
+                    scores[key] = scores.get(key, 0.0) + score
+            if mode == "and":
+                for term in set(terms):
+                    found = set()
+                    for index in indexes:
+                        found.update(index.search([term], "or"))
+                    scores = {key: scores[key] for key in found
+                              if key in scores}
+            ranked = sorted(scores.items(),
+                            key=lambda item: (-item[1], item[0]))
+            return [(score, bucket[key]) for key, score in ranked[:limit]]
+
+    def nearby(self, cls, latitude, longitude, radius_km):
+        """
+        Returns the stored objects of a class located within a distance
+        of a point, nearest first.
+
+        Args:
+            cls: The class, or the name of the class, to search.
+            latitude, longitude: The coordinates of the point, in degrees.
+            radius_km: The search radius, in kilometers.
+
+        Returns:
+            A list of (distance in km, object) tuples.
+        """
+        self.__ready(cls if isinstance(cls, str) else cls.__name__)
+        with FileStorage.__lock.read():
+            index = self.__grid(cls)
+            return [(distance, obj) for distance, key, obj in
+                    index.nearby(latitude, longitude, radius_km)]
+
+    def within(self, cls, south, west, north, east):
+        """
+        Returns the stored objects of a class located inside a bounding
+        box (see GridIndex.within).
+
+        Args:
+            cls: The class, or the name of the class, to search.
+            south, west, north, east: The edges of the box, in degrees.
+
+        Returns:
+            A dictionary (key: object ID, value: object).
+        """
+        self.__ready(cls if isinstance(cls, str) else cls.__name__)
+        with FileStorage.__lock.read():
+            return self.__grid(cls).within(south, west, north, east)
+
+    def __grid(self, cls):
+        """
+        Returns the spatial index of a class, or a temporary one built
+        over its objects when the class declares none. The caller holds
+        the read lock.
+        """
+        if not isinstance(cls, str):
+            cls = cls.__name__
+        bucket = FileStorage.__classes.get(cls, {})
+        for index in FileStorage.__secondary.get(cls, ()):
+            if isinstance(index, GridIndex):
+                return index
+        index = GridIndex("latitude", "longitude")
+        for key, obj in bucket.items():
+            index.add(key, obj)
+        return index
+
     def save(self):
         """
         Saves all objects in the storage dictionary to a JSON file.
+
+        In journal mode only the objects changed since the last save are
+        appended to the journal. Inside a batch, within `save_window`
+        seconds of the previous write, or in write-behind mode, the write
+        is deferred instead.
+        """
+        with FileStorage.__lock.write():
+            self.__reap()
+            if self.write_behind or self.__batches or (
+                    self.__written_at is not None and
+                    time.monotonic() - self.__written_at <
+                    self.save_window):
+                if not self.__owed:
+                    self.__owed = True
+                    self.__owed_at = time.monotonic()
+                self.__flush_at_exit()
+                if self.write_behind:
+                    self.__start_flusher()
+                    self.__wake.set()
+                return
+            staged = self.__write(self.background)
+        if staged is not None:
+            self.__install(staged)
+
+    def update(self, obj, version, /, **attributes):
+        """
+        Sets attributes of a stored object and saves it, provided no
+        change to the object was saved (by this process or another) since
+        the caller read `version`. Changes made to the object and not
+        saved yet are saved along.
+
+        The version is checked and incremented at once, while holding the
+        lock, and the object is then saved by `save`: inside a batch, in
+        write-behind mode or within the save window, the write is deferred
+        like any other save.
+
+        Args:
+            obj: The stored object.
+            version: The version of the object the caller read.
+            **attributes: The attributes to set; `version` itself is set
+            by the storage.
+
+        Returns:
+            The new version of the object.
+
+        Raises:
+            ConflictError: If the object is at another version or was
+            deleted; it then holds the state saved last.
+        """
+        key = "{}.{}".format(obj.__class__.__name__, obj.id)
+        with FileStorage.__lock.write(), self.__locked(exclusive=True):
+            self.__reap()
+            self.__merge()
+            actual = FileStorage.__overtaken.get(key, obj.version)
+            if FileStorage.__objects.get(key) is not obj or actual is None:
+                raise ConflictError(key, version, None)
+            if actual != version:
+                raise ConflictError(key, version, actual)
+            for name, value in attributes.items():
+                setattr(obj, name, value)
+            obj.updated_at = datetime.now()
+            obj.__dict__["version"] = version + 1
+            FileStorage.__overtaken.pop(key, None)
+            FileStorage.__pending[key] = obj
+            FileStorage.__stamped.add(key)
+            self.save()
+            return obj.version
+
+    def __flush_at_exit(self):
+        """
+        Registers `flush` to run when the interpreter exits, once, so the
+        writes owed by deferred saves and the background save in progress
+        are not lost.
+        """
+        if not self.__at_exit:
+            atexit.register(self.flush)
+            self.__at_exit = True
+
+    def flush(self):
+        """
+        Performs the write owed by deferred saves, if any, after waiting
+        for the background save in progress.
+
+        Returns:
+            True if something was written, False otherwise.
+        """
+        with FileStorage.__lock.write():
+            self.__reap(block=True)
+            if not self.__owed:
+                return False
+            staged = self.__write()
+        if staged is not None:
+            self.__install(staged)
+        return True
+
+    def close(self):
+        """
+        Writes what deferred saves owe and stops the background flusher.
+        A later save starts it again, as does a later `asave` for the
+        writer thread, which is stopped once its work is done.
+
+        The postings of the full-text indexes are then persisted, so the
+        next reload does not tokenize the objects again, unless changes
+        are left out of the snapshot (in the journal, or pending).
+        """
+        with FileStorage.__lock.write():
+            flusher = self.__flusher
+            self.__stopping = True
+        self.__wake.set()
+        if flusher is not None:
+            flusher.join()
+        with FileStorage.__lock.write():
+            self.__flusher = None
+            self.__stopping = False
+        with self.__queue_lock:
+            executor, self.__executor = self.__executor, None
+        if executor is not None:
+            executor.shutdown()
+        self.flush()
+        with FileStorage.__lock.write(), self.__locked(exclusive=True):
+            if (not FileStorage.__pending and self.__child is None and
+                    FileStorage.__disk[1] == 0 and
+                    self.__disk_state() == FileStorage.__disk):
+                self.__save_text_indexes()
+
+    def __start_flusher(self):
+        """
+        Starts the background flusher thread unless it is running.
+        """
+        if self.__flusher is None:
+            self.__flusher = threading.Thread(target=self.__flush_behind,
+                                              name="FileStorage flusher",
+                                              daemon=True)
+            self.__flusher.start()
+
+    def __flush_behind(self):
+        """
+        Runs the background flusher: waits for a deferred save, then
+        writes once it is `flush_interval` seconds old or enough objects
+        have changed, until `close` is called.
+        """
+        timeout = None
+        while True:
+            self.__wake.wait(timeout)
+            self.__wake.clear()
+            with FileStorage.__lock.write():
+                if self.__stopping:
+                    return
+                timeout = None
+                if not self.__owed or self.__batches:
+                    continue
+                delay = self.__owed_at + self.flush_interval - \
+                    time.monotonic()
+                if (delay > 0 and
+                        len(FileStorage.__pending) < self.flush_threshold):
+                    timeout = delay
+                    continue
+                staged = self.__write(self.background)
+            if staged is not None:
+                self.__install(staged)
+
+    @contextmanager
+    def batch(self):
+        """
+        Returns a context manager deferring every save made inside it to
+        a single write when the outermost batch ends:
+
+            with storage.batch():
+                for place in places:
+                    place.price_by_night += 10
+                    place.save()
+        """
+        with FileStorage.__lock.write():
+            self.__batches += 1
+        try:
+            yield self
+        finally:
+            with FileStorage.__lock.write():
+                self.__batches -= 1
+                if not self.__batches:
+                    self.flush()
+            self.__wake.set()
+
+    async def asave(self):
+        """
+        Performs `save` on the writer thread and waits for it without
+        blocking the event loop. Saves run one at a time; when a save is
+        already waiting for its turn, the call waits for that one, which
+        will write the current changes too.
+        """
+        with self.__queue_lock:
+            if self.__queued is None:
+                self.__queued = self.__writer().submit(self.__run_save)
+            future = self.__queued
+        await asyncio.wrap_future(future)
+
+    async def areload(self):
+        """
+        Performs `reload` on the writer thread, after the saves requested
+        before it, and waits for it without blocking the event loop.
+        """
+        with self.__queue_lock:
+            future = self.__writer().submit(self.reload)
+        await asyncio.wrap_future(future)
+
+    async def aquery(self, cls, order_by=None, limit=None, chunk_size=100,
+                     **filters):
+        """
+        Yields the results of `query` asynchronously; the objects are
+        found and filtered in the event loop's default executor,
+        `chunk_size` results at a time:
+
+            async for place in storage.aquery(Place, city_id=city_id):
+                ...
+
+        Args:
+            cls: The class, or the name of the class, to query.
+            order_by: The ordering, as for `query`.
+            limit: The maximum number of objects, as for `query`.
+            chunk_size: The number of results fetched per executor call.
+            **filters: The conditions, as for `query`.
+        """
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(
+            None, lambda: self.query(cls, order_by, limit, **filters))
+        while True:
+            chunk = await loop.run_in_executor(
+                None, lambda: list(islice(results, chunk_size)))
+            for obj in chunk:
+                yield obj
+            if len(chunk) < chunk_size:
+                return
+
+    def __writer(self):
+        """
+        Returns the single-thread executor running the asynchronous
+        saves and reloads, starting it if needed; the caller holds the
+        queue lock.
+        """
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="FileStorage writer")
+        return self.__executor
+
+    def __run_save(self):
+        """
+        Runs a save queued by `asave`; the saves requested from now on
+        queue another one.
+        """
+        with self.__queue_lock:
+            self.__queued = None
+        self.save()
+
+    def __write(self, background=False):
+        """
+        Writes the snapshot, or appends the pending changes to the
+        journal in journal mode; the caller holds the write lock.
+
+        A snapshot written in the foreground is only prepared by
+        `__stage`: the caller writes it with `__install` once it released
+        the write lock.
+
+        Args:
+            background: If True, the snapshot is written by `bgsave`.
+
+        Returns:
+            The snapshot to install, or None if the write is done.
+        """
+        self.__owed = False
+        staged = None
+        try:
+            with self.__locked(exclusive=True):
+                self.__merge()
+                if self.journal:
+                    self.__append_journal(background)
+                elif background:
+                    self.bgsave()
+                else:
+                    staged = self.__stage()
+        except BaseException:
+            self.__owed = True
+            raise
+        if not self.__owed:
+            self.__owed_at = None
+        self.__written_at = time.monotonic()
+        return staged
+
+    def __append_journal(self, background=False):
+        """
+        Appends the changes pending since the last save to the journal,
+        and compacts it once it holds more records than the store.
+
+        Args:
+            background: If True, the journal is compacted by `bgsave`.
+        """
+        all_objs = FileStorage.__objects
+        self.__stamp()
+
+        with open(self.journal_path(), "a", encoding="utf-8") as file:
+            for key, obj in FileStorage.__pending.items():
+                if obj is not None and all_objs.get(key) is obj:
+                    text = self.__serialize(key, obj)
+                    file.write('{{"op": "put", "key": {}, "value": {}}}\n'
+                               .format(json.dumps(key), text))
+                else:
+                    FileStorage.__records.pop(key, None)
+                    file.write(json.dumps({"op": "del", "key": key}) + "\n")
+                FileStorage.__journal_entries += 1
+            if self.fsync:
+                file.flush()
+                os.fsync(file.fileno())
+        FileStorage.__pending.clear()
+        FileStorage.__overtaken.clear()
+        FileStorage.__disk = self.__disk_state()
+
+        limit = max(self.journal_min_entries, self.count())
+        if FileStorage.__journal_entries > limit:
+            if background:
+                self.bgsave()
+            else:
+                self.__compact()
+
+    def compact(self):
+        """
+        Rewrites the snapshot from the storage dictionary and drops the
+        journal, whose records are all contained in the new snapshot.
+        Records are written to the file one at a time as they are
+        serialized, rather than joined into one string first.
+
+        The new snapshot replaces the previous one atomically; if writing
+        it fails, the previous snapshot is left untouched.
+
+        The postings of the full-text indexes are persisted along, which
+        saves do not do (see `close`).
+        """
+        with FileStorage.__lock.write(), self.__locked(exclusive=True):
+            self.__compact()
+            self.__save_text_indexes()
+
+    def __compact(self):
+        """
+        Rewrites the snapshot and drops the journal, as `compact` does
+        for saves, without persisting the full-text postings.
+        """
+        with FileStorage.__lock.write(), self.__locked(exclusive=True):
+            self.__install(self.__stage())
+
+    def __stage(self):
+        """
+        Prepares a snapshot of the stored records for `__install`; the
+        caller holds the write lock and the file lock. Only the objects
+        changed since their text was cached are serialized. Like a forked
+        `bgsave`, the snapshot takes over the pending changes, which
+        merges keep over the records of other processes until it is
+        installed.
+
+        Returns:
+            A dictionary holding the "records" ((key, JSON text) tuples),
+            the "pending" changes they write, and the state of the files
+            they are to replace ("disk").
+        """
+        self.__merge()
+        self.__stamp()
+        staged = {"records": list(self.__snapshot_records()),
+                  "pending": dict(FileStorage.__pending),
+                  "disk": FileStorage.__disk}
+        FileStorage.__saving.append(staged["pending"])
+        FileStorage.__pending.clear()
+        FileStorage.__overtaken.clear()
+        return staged
+
+    def __install(self, staged):
+        """
+        Writes a snapshot prepared by `__stage` to a temporary file, then
+        renames it over the previous snapshot and drops the journal. The
+        temporary file is written without the locks (unless the caller
+        holds them), so objects can be read and changed meanwhile; those
+        changes are pending for the next save.
+
+        When the files were written by another thread or process since
+        the snapshot was prepared, it is discarded: its changes are
+        pending again and a snapshot is written while holding the locks.
+
+        Args:
+            staged: The snapshot returned by `__stage`.
+        """
+        path = FileStorage.__file_path
+        temp_path = "{}.{}-{}.tmp".format(path, os.getpid(),
+                                          threading.get_ident())
+        try:
+            written = self.__write_snapshot(temp_path, staged["records"])
+        except BaseException:
+            with FileStorage.__lock.write():
+                self.__unstage(staged)
+            raise
+        with FileStorage.__lock.write(), self.__locked(exclusive=True):
+            if (FileStorage.__disk != staged["disk"] or
+                    self.__disk_state() != staged["disk"]):
+                os.remove(temp_path)
+                self.__unstage(staged)
+                self.__compact()
+                return
+            self.__unstage(staged, installed=True)
+            os.replace(temp_path, path)
+            FileStorage.__generation += 1
+            if self.fsync_directory:
+                self.__sync_directory()
+
+            all_objs = FileStorage.__objects
+            raw = FileStorage.__raw
+            records = FileStorage.__records
+            if len(records) > written:
+                FileStorage.__records = {
+                    key: record for key, record in records.items()
+                    if key in all_objs or
+                    key in raw.get(key.split('.')[0], ())}
+
+            if os.path.isfile(self.journal_path()):
+                os.remove(self.journal_path())
+            FileStorage.__journal_entries = 0
+            FileStorage.__disk = self.__disk_state()
+
+    def __unstage(self, staged, installed=False):
+        """
+        Ends the write of a snapshot prepared by `__stage`; the caller
+        holds the write lock. Unless it was installed, its changes are
+        pending again (keeping the versions they were given) and a write
+        is owed.
+
+        Args:
+            staged: The snapshot returned by `__stage`.
+            installed: True if the snapshot replaced the previous one.
+        """
+        FileStorage.__saving[:] = [
+            pending for pending in FileStorage.__saving
+            if pending is not staged["pending"]]
+        if installed:
+            return
+        for key, obj in staged["pending"].items():
+            FileStorage.__pending.setdefault(key, obj)
+            if obj is not None:
+                FileStorage.__stamped.add(key)
+        if not self.__owed:
+            self.__owed = True
+            self.__owed_at = time.monotonic()
+
+    def __stamp(self):
+        """
+        Increments the version of the objects changed since the last
+        save, which the write in progress persists. The objects `update`
+        already stamped keep their version, unless another process saved
+        the object since.
         """
         all_objs = FileStorage.__objects
+        overtaken = FileStorage.__overtaken
+        stamped = FileStorage.__stamped
+        for key, obj in FileStorage.__pending.items():
+            if obj is not None and all_objs.get(key) is obj:
+                theirs = overtaken.get(key) or 0
+                if key in stamped:
+                    obj.__dict__["version"] = max(obj.version, theirs + 1)
+                else:
+                    obj.__dict__["version"] = max(obj.version, theirs) + 1
+        stamped.clear()
+
+    def __write_snapshot(self, temp_path, records=None):
+        """
+        Writes every record to a new snapshot file, which is removed if
+        writing fails.
+
+        Args:
+            temp_path: The path of the file to write.
+            records: The (key, JSON text) tuples to write
+            (default: the stored records).
+
+        Returns:
+            The number of records written.
+        """
+        try:
+            with open(temp_path, "w", encoding="utf-8",
+                      buffering=1 << 16) as file:
+                if records is None:
+                    records = self.__snapshot_records()
+                written = write_records(file, records, checksums=True)
+                if self.fsync:
+                    file.flush()
+                    os.fsync(file.fileno())
+        except BaseException:
+            if os.path.isfile(temp_path):
+                os.remove(temp_path)
+            raise
+        return written
+
+    def bgsave(self):
+        """
+        Starts writing the snapshot in a forked child process, which
+        serializes the objects as they were at the time of the fork
+        while this process goes on. The snapshot replaces the previous
+        one (and the journal records it contains are dropped) once the
+        child is reaped by a later save, `bgsave_status`, `flush` or
+        `close`, unless a snapshot was written in the foreground since.
+
+        Where os.fork is not available, the snapshot is written at once.
+
+        Returns:
+            The process ID of the child, or None if no child was started
+            because a background save is still running (another one is
+            started when it ends).
+        """
+        with FileStorage.__lock.write():
+            self.__reap()
+            if self.__child is not None:
+                self.__rerun = True
+                if not self.journal and not self.__owed:
+                    self.__owed = True
+                    self.__owed_at = time.monotonic()
+                return None
+            if not hasattr(os, "fork"):
+                self.__compact()
+                return None
+            with self.__locked(exclusive=True):
+                self.__merge()
+                return self.__fork_snapshot()
+
+    def __fork_snapshot(self):
+        """
+        Starts the child process of `bgsave`; the caller holds the write
+        lock and the file lock.
+
+        Returns:
+            The process ID of the child.
+        """
+        temp_path = FileStorage.__file_path + ".bgsave.tmp"
+        snapshot, offset = FileStorage.__disk
+        self.__stamp()
+        started = time.time()
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            if FileStorage.__lock_fd is not None:
+                os.close(FileStorage.__lock_fd)
+            status = {"ok": False, "error": "interrupted"}
+            try:
+                written = self.__write_snapshot(temp_path)
+                status = {"ok": True, "records": written,
+                          "size": os.path.getsize(temp_path)}
+            except BaseException as error:
+                status = {"ok": False, "error": str(error)}
+            finally:
+                status["seconds"] = time.time() - started
+                os.write(write_fd, json.dumps(status).encode("utf-8"))
+                os._exit(0)
+        os.close(write_fd)
+        self.__flush_at_exit()
+        written = dict(FileStorage.__pending)
+        if not self.journal:
+            self.__owed = False
+            self.__owed_at = None
+            for key in written:
+                FileStorage.__records.pop(key, None)
+            FileStorage.__pending.clear()
+            FileStorage.__overtaken.clear()
+        self.__child = {"pid": pid, "pipe": read_fd,
+                        "started_at": started, "temp_path": temp_path,
+                        "generation": FileStorage.__generation,
+                        "snapshot": snapshot, "journal_offset": offset,
+                        "pending": written}
+        return pid
+
+    def bgsave_status(self):
+        """
+        Reports on the background saves.
+
+        Returns:
+            A dictionary telling whether a background save is "running"
+            (and its "pid"), and describing the "last" one that ended, or
+            None: when it "started_at" and "finished_at" (timestamps), the
+            "seconds" it took, whether it was "ok" (or the "error"), the
+            "size" of the snapshot in bytes, its number of "records", and
+            whether it was "superseded" by a foreground snapshot.
+        """
+        with FileStorage.__lock.write():
+            self.__reap()
+            child = self.__child
+            return {"running": child is not None,
+                    "pid": child["pid"] if child else None,
+                    "last": dict(self.__last_bgsave)
+                    if self.__last_bgsave else None}
+
+    def __reap(self, block=False):
+        """
+        Collects the background save if it ended, installs its snapshot,
+        and starts another one if saves were deferred meanwhile.
+
+        Args:
+            block: If True, wait for the background save to end.
+        """
+        child = self.__child
+        if child is None:
+            return
+        pid, _ = os.waitpid(child["pid"], 0 if block else os.WNOHANG)
+        if pid == 0:
+            return
+        self.__child = None
+        with os.fdopen(child["pipe"], "rb") as pipe:
+            data = pipe.read()
+        try:
+            status = json.loads(data.decode("utf-8"))
+        except ValueError:
+            status = {"ok": False, "error": "the snapshot process died"}
+        status["started_at"] = child["started_at"]
+        status["finished_at"] = child["started_at"] + status.get(
+            "seconds", time.time() - child["started_at"])
+        temp_path = child["temp_path"]
+        with self.__locked(exclusive=True):
+            snapshot = self.__disk_state()[0]
+            overwritten = child["snapshot"] != snapshot
+            status["superseded"] = (
+                child["generation"] != FileStorage.__generation or
+                overwritten)
+            if status["ok"] and not status["superseded"]:
+                os.replace(temp_path, FileStorage.__file_path)
+                if self.fsync_directory:
+                    self.__sync_directory()
+                self.__drop_journal_head(child["journal_offset"])
+                seen = FileStorage.__disk[1] - child["journal_offset"]
+                FileStorage.__disk = (self.__disk_state()[0], max(0, seen))
+            elif os.path.isfile(temp_path):
+                os.remove(temp_path)
+        lost = not status["ok"] or (
+            overwritten and child["generation"] == FileStorage.__generation)
+        if lost and not self.journal:
+            for key, obj in child["pending"].items():
+                FileStorage.__pending.setdefault(key, obj)
+            if not self.__owed:
+                self.__owed = True
+                self.__owed_at = time.monotonic()
+        self.__last_bgsave = status
+        rerun, self.__rerun = self.__rerun, False
+        if rerun and not block:
+            self.bgsave()
+
+    def __drop_journal_head(self, offset):
+        """
+        Removes from the journal the records written before `offset`,
+        which a background snapshot now contains.
+        """
+        path = self.journal_path()
+        if offset == 0 or not os.path.isfile(path):
+            return
+        with open(path, "rb") as file:
+            file.seek(offset)
+            tail = file.read()
+        if tail:
+            with open(path + ".tmp", "wb") as file:
+                file.write(tail)
+            os.replace(path + ".tmp", path)
+        else:
+            os.remove(path)
+        FileStorage.__journal_entries = tail.count(b"\n")
+
+    def __sync_directory(self):
+        """
+        Flushes the directory entry of the snapshot to disk.
+        """
+        directory = os.path.dirname(os.path.abspath(FileStorage.__file_path))
+        fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
 
-        obj_dict = {}
+    @contextmanager
+    def __locked(self, exclusive):
+        """
+        Returns a context manager holding the advisory lock that the
+        processes sharing the files take on "<file_path>.lock". The lock
+        is reentrant, and is upgraded when an exclusive hold nests in a
+        shared one. The caller holds the write lock, so a single thread
+        of this process uses the lock file at a time.
 
-        for obj in all_objs.keys():
-            obj_dict[obj] = all_objs[obj].to_dict()
+        Where fcntl is not available, or the lock file cannot be opened,
+        nothing is locked.
 
-        with open(FileStorage.__file_path, "w", encoding="utf-8") as file:
-            json.dump(obj_dict, file)
+        Args:
+            exclusive: True to exclude every other process, False to only
+            exclude writers.
+        """
+        outer = FileStorage.__lock_fd is None
+        if outer and fcntl is not None:
+            try:
+                FileStorage.__lock_fd = os.open(
+                    FileStorage.__file_path + ".lock",
+                    os.O_RDWR | os.O_CREAT, 0o644)
+            except OSError:
+                pass
+        fd = FileStorage.__lock_fd
+        if fd is None:
+            yield
+            return
+        try:
+            if outer or (exclusive and not FileStorage.__lock_exclusive):
+                fcntl.flock(fd, fcntl.LOCK_EX if exclusive else
+                            fcntl.LOCK_SH)
+                FileStorage.__lock_exclusive = exclusive
+            yield
+        finally:
+            if outer:
+                FileStorage.__lock_fd = None
+                FileStorage.__lock_exclusive = False
+                os.close(fd)
+
+    def __disk_state(self):
+        """
+        Returns the identity of the snapshot file (inode, size and
+        modification time, or None when it does not exist) and the size
+        of the journal, which change whenever a process writes them.
+        """
+        try:
+            stat = os.stat(FileStorage.__file_path)
+            snapshot = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            snapshot = None
+        try:
+            offset = os.path.getsize(self.journal_path())
+        except OSError:
+            offset = 0
+        return snapshot, offset
+
+    def __snapshot_records(self):
+        """
+        Yields the JSON text of every stored record, serializing only the
+        objects changed since their text was cached.
+
+        Yields:
+            (key, JSON text) tuples.
+        """
+        records = FileStorage.__records
+        pending = FileStorage.__pending
+
+        for key, obj in FileStorage.__objects.items():
+            cached = records.get(key)
+            if cached is None or cached[0] is not obj or key in pending:
+                yield key, self.__serialize(key, obj)
+            else:
+                yield key, cached[1]
+
+        for class_records in FileStorage.__raw.values():
+            for key, value in class_records.items():
+                cached = records.get(key)
+                if cached is None or cached[0] is not None:
+                    cached = (None, json.dumps(value))
+                    records[key] = cached
+                yield key, cached[1]
+
+    def __save_text_indexes(self):
+        """
+        Persists the postings of the full-text indexes, tagged with the
+        identity of the snapshot they describe. The caller holds the
+        write lock and the file lock, and the objects match the snapshot.
+
+        Like the snapshot, the file is written to "<path>.tmp" and renamed
+        over the previous one. Nothing is written while records of a lazy
+        reload are not built, as the indexes do not cover them.
+        """
+        path = self.text_index_path()
+        snapshot = FileStorage.__disk[0]
+        if snapshot is None or any(FileStorage.__raw.values()):
+            return
+        indexes = {}
+        for cls_name, class_indexes in self.__index_state().items():
+            for index in class_indexes:
+                if isinstance(index, TextIndex):
+                    indexes.setdefault(cls_name, {})[index.attribute] = \
+                        index.dump()
+        if not any(any(postings.values()) for postings in indexes.values()):
+            if os.path.isfile(path):
+                os.remove(path)
+            return
+        try:
+            with open(path + ".tmp", "w", encoding="utf-8") as file:
+                json.dump({"snapshot": list(snapshot),
+                           "indexes": indexes}, file)
+                if self.fsync:
+                    file.flush()
+                    os.fsync(file.fileno())
+            os.replace(path + ".tmp", path)
+        except BaseException:
+            if os.path.isfile(path + ".tmp"):
+                os.remove(path + ".tmp")
+            raise
+
+    def __load_text_indexes(self):
+        """
+        Returns the persisted full-text postings if they describe the
+        current snapshot, or None.
+        """
+        snapshot = self.__disk_state()[0]
+        try:
+            with open(self.text_index_path(), "r", encoding="utf-8") as file:
+                saved = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if snapshot is None or saved.get("snapshot") != list(snapshot):
+            return None
+        return saved.get("indexes")
+
+    def __serialize(self, key, obj):
+        """
+        Serializes an object and caches the JSON text of its record.
+
+        Args:
+            key: The storage key of the object.
+            obj: The object to serialize.
+
+        Returns:
+            The JSON text of the object's dictionary representation.
+        """
+        text = json.dumps(obj.to_dict())
+        FileStorage.__records[key] = (obj, text)
+        return text
+
+    def __materialize(self, key, record):
+        """
+        Builds the object of a record left by a lazy reload and adds it
+        to the storage dictionary and the indexes.
+
+        Args:
+            key: The storage key of the record.
+            record: The dictionary representation of the object.
+        """
+        cls = classes[key.split('.')[0]]
+        obj = cls(**record)
+        FileStorage.__objects[key] = obj
+        self.__index_add(key, obj)
+
+    def __ready(self, cls_name=None, hydrate=True):
+        """
+        Prepares a read, under the write lock when there is anything to
+        do: builds the objects a lazy reload left for a class, and brings
+        the indexes in sync with the objects dictionary.
+
+        Args:
+            cls_name: The name of the class about to be read
+            (default: every class).
+            hydrate: If False, leave the records of a lazy reload as
+            they are.
+        """
+        raw = FileStorage.__raw
+        if ((hydrate and raw and (cls_name is None or cls_name in raw)) or
+                FileStorage.__indexed is not FileStorage.__objects or
+                sum(map(len, FileStorage.__classes.values())) !=
+                len(FileStorage.__objects)):
+            with FileStorage.__lock.write():
+                if hydrate:
+                    self.__hydrate(cls_name)
+                self.__index()
+
+    def __hydrate(self, cls_name=None):
+        """
+        Builds the objects of the records left by a lazy reload.
+
+        Args:
+            cls_name: The name of the class whose records to build
+            (default: build the records of every class).
+        """
+        if not FileStorage.__raw:
+            return
+        names = list(FileStorage.__raw) if cls_name is None else [cls_name]
+        for name in names:
+            for key, record in FileStorage.__raw.pop(name, {}).items():
+                self.__materialize(key, record)
+
+    def __defer(self, key, record):
+        """
+        Keeps a record loaded by a lazy reload in place of the object
+        stored under its key, if any.
+
+        Args:
+            key: The storage key of the record.
+            record: The dictionary representation of the object.
+
+        Raises:
+            ValueError: If the key does not name a model class.
+        """
+        class_name = key.split('.')[0]
+        if class_name not in classes:
+            raise ValueError("unknown class: {}".format(class_name))
+        obj = FileStorage.__objects.pop(key, None)
+        if obj is not None:
+            self.__index_remove(key, obj)
+        FileStorage.__raw.setdefault(class_name, {})[key] = record
 
     def reload(self):
         """
-        Loads objects from a JSON file into the storage dictionary.
+        Loads objects from a JSON file into the storage dictionary,
+        then replays the journal on top of them. The file is parsed one
+        record at a time, so the whole parsed file is never held in
+        memory next to the objects. In lazy mode the records are kept as
+        dictionaries until their objects are accessed.
+
+        Records that cannot be parsed, do not match their checksum or
+        cannot be turned into objects are skipped, and the others are
+        loaded; `recovery_report` tells what was loaded and skipped.
 
         If the file doesn't exist, nothing happens.
         """
-        if os.path.isfile(FileStorage.__file_path):
+        with FileStorage.__lock.write(), self.__locked(exclusive=False):
+            self.__load()
+
+    def refresh(self):
+        """
+        Merges the changes other processes saved since this process last
+        read or wrote the files, building only the records that changed
+        (see `__merge`). When nothing changed, this only costs two stat
+        calls, so it can run before every command.
+
+        Returns:
+            The number of objects added, updated or removed.
+        """
+        with FileStorage.__lock.write():
+            if self.__disk_state() == FileStorage.__disk:
+                return 0
+            with self.__locked(exclusive=False):
+                return self.__merge()
+
+    def __load(self):
+        """
+        Performs `reload`; the caller holds the write lock and the file
+        lock.
+        """
+        started = time.perf_counter()
+        state = self.__disk_state()
+        report = {"loaded": {}, "skipped": {}, "verified": False,
+                  "journal_skipped": 0, "seconds": 0.0}
+        known = len(FileStorage.__objects)
+        loaded = buckets = None
+        if (not self.lazy and self.reload_workers > 1 and
+                os.path.isfile(FileStorage.__file_path) and
+                os.path.getsize(FileStorage.__file_path) >=
+                self.reload_min_bytes):
+            buckets = self.__load_parallel(report)
+        if buckets is not None:
+            loaded = sum(map(len, buckets.values()))
+        elif os.path.isfile(FileStorage.__file_path):
+            loaded = 0
+            sums = {}
+            checksums = None
             with open(FileStorage.__file_path, "r", encoding="utf-8") as file:
-                try:
-                    obj_dict = json.load(file)
+                for key, value, text in scan_records(file):
+                    if key == CHECKSUMS and isinstance(value, dict):
+                        checksums = value
+                        continue
+                    try:
+                        if value is None:
+                            raise ValueError("unreadable record")
 
-                    for key, value in obj_dict.items():
                         class_name, obj_id = key.split('.')
 
-                        cls = eval(class_name)
+                        cls = classes[class_name]
 
-                        instance = cls(**value)
+                        if self.lazy:
+                            self.__defer(key, value)
+                            obj = None
+                        else:
+                            obj = cls(**value)
+                            FileStorage.__objects[key] = obj
+                    except Exception:
+                        self.__count(report["skipped"], key)
+                        continue
+                    FileStorage.__records[key] = (obj, text)
+                    sums[key] = checksum(text)
+                    self.__count(report["loaded"], key)
+                    loaded += 1
+            if checksums is not None:
+                report["verified"] = True
+                for key, crc in sums.items():
+                    if checksums.get(key) != crc:
+                        FileStorage.__objects.pop(key, None)
+                        FileStorage.__records.pop(key, None)
+                        FileStorage.__raw.get(key.split('.')[0],
+                                              {}).pop(key, None)
+                        self.__count(report["loaded"], key, -1)
+                        self.__count(report["skipped"], key)
+                        loaded -= 1
+        if self.lazy or loaded is None:
+            loaded = 0
+        restored = None
+        if (known == 0 and loaded == len(FileStorage.__objects) and
+                not report["skipped"]):
+            restored = self.__load_text_indexes()
+        self.__rebuild_indexes(restored, buckets if known == 0 else None)
+        report["journal_skipped"] = self.__replay_journal()
+        FileStorage.__pending.clear()
+        FileStorage.__overtaken.clear()
+        FileStorage.__stamped.clear()
+        FileStorage.__disk = state
+        report["seconds"] = time.perf_counter() - started
+        FileStorage.__recovery = report
+        skipped = sum(report["skipped"].values())
+        if skipped:
+            print("** {}: skipped {} corrupt record(s) ({}) **".format(
+                FileStorage.__file_path, skipped, ", ".join(
+                    "{} {}".format(count, name) for name, count in
+                    sorted(report["skipped"].items()))), file=sys.stderr)
+
+    def __load_parallel(self, report):
+        """
+        Loads the snapshot with a pool of `reload_workers` forked
+        processes, each parsing ranges of whole records, building their
+        objects and checksumming their text. Each worker sends its
+        objects grouped by class, so this process merges whole
+        dictionaries and builds the indexes from them, without a step per
+        record. The caller holds the write lock and the file lock.
+
+        Some of the work stays serial and bounds the speedup: the objects
+        are pickled back to this process and unpickled one worker result
+        at a time (roughly a third of the time it takes to build them),
+        and the secondary indexes are built here. Persisted full-text
+        postings (see `close`) spare the tokenizing.
+
+        Nothing is loaded when the snapshot cannot be cut into several
+        ranges, when os.fork is not available, or when any record is
+        malformed, unknown or does not match its checksum: the caller
+        then loads the snapshot in this process, which skips and reports
+        the damaged records.
+
+        Args:
+            report: The report of the reload in progress.
 
-                        FileStorage.__objects[key] = instance
+        Returns:
+            The objects loaded, by class (key: class name, value:
+            {object ID: object}), or None if nothing was loaded.
+        """
+        path = FileStorage.__file_path
+        with open(path, "rb") as file:
+            offsets = split_records(file, self.reload_workers * 4)
+        if len(offsets) < 3 or "fork" not in \
+                multiprocessing.get_all_start_methods():
+            return None
+        try:
+            context = multiprocessing.get_context("fork")
+            with context.Pool(self.reload_workers,
+                              initializer=_start_worker) as pool:
+                results = pool.starmap(_load_range, [
+                    (path, start, end)
+                    for start, end in zip(offsets, offsets[1:])])
+        except Exception:
+            return None
+        if not results[-1][4]:
+            return None
+        checksums = None
+        for _, _, _, found, _ in results:
+            if found is not None:
+                checksums = found
+        if checksums is not None:
+            for _, _, sums, _, _ in results:
+                if not sums.items() <= checksums.items():
+                    return None
+        buckets = {}
+        for loaded, records, _, _, _ in results:
+            for class_name, bucket in loaded.items():
+                buckets.setdefault(class_name, {}).update(bucket)
+                FileStorage.__objects.update(bucket)
+            FileStorage.__records.update(records)
+        for class_name, bucket in buckets.items():
+            report["loaded"][class_name] = len(bucket)
+        report["verified"] = checksums is not None
+        return buckets
+
+    def recovery_report(self):
+        """
+        Returns what the last reload loaded and skipped.
+
+        Returns:
+            A dictionary with the number of records "loaded" and "skipped"
+            by class name ("?" for records whose key was unreadable),
+            whether the records were "verified" against checksums, the
+            number of "journal_skipped" lines and the "seconds" taken.
+        """
+        report = dict(FileStorage.__recovery)
+        report["loaded"] = dict(report.get("loaded", {}))
+        report["skipped"] = dict(report.get("skipped", {}))
+        return report
+
+    @staticmethod
+    def __count(counts, key, step=1):
+        """
+        Adds `step` to the count of the class of a storage key.
+        """
+        name = key.split('.')[0] if isinstance(key, str) else "?"
+        counts[name] = counts.get(name, 0) + step
+        if not counts[name]:
+            del counts[name]
+
+    def __replay_journal(self):
+        """
+        Applies the records of the journal file, in order, to the
+        storage dictionary. A torn last line left by a crash is ignored.
+
+        Returns:
+            The number of lines that could not be applied.
+        """
+        FileStorage.__journal_entries = 0
+        skipped = 0
+        if not os.path.isfile(self.journal_path()):
+            return skipped
+        with open(self.journal_path(), "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                    key = entry["key"]
+                    FileStorage.__records.pop(key, None)
+                    if entry["op"] == "put" and self.lazy:
+                        self.__defer(key, entry["value"])
+                    elif entry["op"] == "put":
+                        FileStorage.__raw.get(key.split('.')[0],
+                                              {}).pop(key, None)
+                        cls = classes[key.split('.')[0]]
+                        obj = cls(**entry["value"])
+                        FileStorage.__objects[key] = obj
+                        self.__index_add(key, obj)
+                    else:
+                        FileStorage.__raw.get(key.split('.')[0],
+                                              {}).pop(key, None)
+                        obj = FileStorage.__objects.pop(key, None)
+                        if obj is not None:
+                            self.__index_remove(key, obj)
+                except Exception:
+                    skipped += 1
+                    continue
+                FileStorage.__journal_entries += 1
+        return skipped
+
+    def __merge(self):
+        """
+        Adopts the records other processes saved since this process last
+        read or wrote the files; the caller holds the write lock and the
+        file lock. When the snapshot was replaced, it is scanned again
+        along with the journal; otherwise only the journal records
+        appended since are read. Records whose text did not change are
+        not built again, objects still stored are updated in place, and
+        the keys changed in this process since its last save keep their
+        pending change.
+
+        Returns:
+            The number of objects added, updated or removed.
+        """
+        state = self.__disk_state()
+        seen = FileStorage.__disk
+        if state == seen:
+            return 0
+        snapshot, offset = state
+        full = snapshot != seen[0] or offset < seen[1]
+        start = 0 if full else seen[1]
+        FileStorage.__disk = state
+        if snapshot is None and offset == 0:
+            return 0
+        found = {}
+        if full and snapshot is not None:
+            with open(FileStorage.__file_path, "r", encoding="utf-8") as file:
+                for key, value, text in scan_records(file):
+                    if key != CHECKSUMS and isinstance(value, dict):
+                        found[key] = (value, text)
+        entries = 0
+        if offset > start:
+            with open(self.journal_path(), "rb") as file:
+                file.seek(start)
+                lines = file.read(offset - start).splitlines()
+            for line in lines:
+                try:
+                    entry = json.loads(line)
+                    key = entry["key"]
+                    if not isinstance(key, str):
+                        raise ValueError("invalid key")
+                    if entry["op"] == "put":
+                        found[key] = (dict(entry["value"]), None)
+                    else:
+                        found[key] = None
                 except Exception:
-                    pass
+                    continue
+                entries += 1
+        if full:
+            FileStorage.__journal_entries = entries
+        else:
+            FileStorage.__journal_entries += entries
+        pending = set(FileStorage.__pending).union(*FileStorage.__saving)
+        changed = 0
+        for key, record in found.items():
+            if key in pending:
+                FileStorage.__overtaken[key] = None if record is None else \
+                    record[0].get("version", 0)
+                continue
+            if record is None:
+                changed += self.__forget(key)
+            else:
+                changed += self.__adopt(key, *record)
+        if full:
+            stored = list(FileStorage.__objects)
+            for class_records in FileStorage.__raw.values():
+                stored.extend(class_records)
+            for key in stored:
+                if key not in found and key not in pending:
+                    changed += self.__forget(key)
+        return changed
+
+    def __adopt(self, key, value, text=None):
+        """
+        Stores the record another process saved under a key, unless it
+        is the record this process already holds.
+
+        Args:
+            key: The storage key of the record.
+            value: The dictionary representation of the object.
+            text: The JSON text of the record (default: encode `value`).
+
+        Returns:
+            1 if the stored object changed, 0 otherwise.
+        """
+        if text is None:
+            text = json.dumps(value)
+        class_name = key.split('.')[0]
+        obj = FileStorage.__objects.get(key)
+        raw = FileStorage.__raw.get(class_name, {})
+        cached = FileStorage.__records.get(key)
+        if (cached is not None and cached[1] == text and
+                (cached[0] is obj if obj is not None else key in raw)):
+            return 0
+        try:
+            cls = classes[class_name]
+            if self.lazy and obj is None:
+                FileStorage.__raw.setdefault(class_name, {})[key] = value
+                FileStorage.__records[key] = (None, text)
+                return 1
+            fresh = cls(**value)
+        except Exception:
+            return 0
+        raw.pop(key, None)
+        if obj is None:
+            obj = fresh
+            FileStorage.__objects[key] = obj
+        else:
+            self.__index_remove(key, obj)
+            obj.__dict__.clear()
+            obj.__dict__.update(fresh.__dict__)
+        self.__index_add(key, obj)
+        FileStorage.__records[key] = (obj, text)
+        return 1
+
+    def __forget(self, key):
+        """
+        Removes the object or record another process deleted.
+
+        Args:
+            key: The storage key of the deleted object.
+
+        Returns:
+            1 if something was removed, 0 otherwise.
+        """
+        FileStorage.__records.pop(key, None)
+        class_name = key.split('.')[0]
+        if FileStorage.__raw.get(class_name, {}).pop(key, None) is not None:
+            return 1
+        obj = FileStorage.__objects.pop(key, None)
+        if obj is None:
+            return 0
+        self.__index_remove(key, obj)
+        return 1
+
+    def __index_state(self):
+        """
+        Returns the secondary indexes once the class index is in sync.
+        """
+        self.__index()
+        return FileStorage.__secondary
+
+    def __index(self):
+        """
+        Returns the class index, rebuilding it first when the objects
+        dictionary was replaced or resized behind the storage's back.
+        """
+        objects = FileStorage.__objects
+        if (FileStorage.__indexed is not objects or
+                sum(map(len, FileStorage.__classes.values())) !=
+                len(objects)):
+            self.__rebuild_indexes()
+        return FileStorage.__classes
+
+    def __rebuild_indexes(self, restored=None, buckets=None):
+        """
+        Builds the indexes again from the whole objects dictionary.
+
+        Args:
+            restored: Persisted full-text postings to adopt instead of
+            tokenizing the objects (key: class name, value: {attribute:
+            postings}).
+            buckets: The stored objects already grouped by class (key:
+            class name, value: {object ID: object}), which are adopted
+            instead of grouping the objects dictionary.
+        """
+        classes = buckets
+        if classes is None:
+            classes = {}
+            for key, obj in FileStorage.__objects.items():
+                classes.setdefault(obj.__class__.__name__, {})[key] = obj
+        FileStorage.__classes = classes
+        FileStorage.__shared = set()
+        FileStorage.__secondary = {}
+        FileStorage.__indexed = FileStorage.__objects
+        restored = restored or {}
+        for cls_name, bucket in classes.items():
+            indexes = build_indexes(type(next(iter(bucket.values()))))
+            for index in indexes:
+                postings = None
+                if isinstance(index, TextIndex):
+                    postings = restored.get(cls_name, {}).get(
+                        index.attribute)
+                if postings is not None:
+                    index.restore(postings, bucket)
+                    continue
+                if isinstance(index, SortedIndex):
+                    index.build(bucket)
+                    continue
+                for key, obj in bucket.items():
+                    index.add(key, obj)
+            FileStorage.__secondary[cls_name] = indexes
+
+    def __index_add(self, key, obj):
+        """
+        Adds an object to the indexes.
+
+        Args:
+            key: The storage key of the object.
+            obj: The object to index.
+        """
+        cls_name = obj.__class__.__name__
+        self.__bucket(cls_name)[key] = obj
+        if cls_name not in FileStorage.__secondary:
+            FileStorage.__secondary[cls_name] = build_indexes(type(obj))
+        for index in FileStorage.__secondary[cls_name]:
+            index.add(key, obj)
+
+    def __bucket(self, cls_name):
+        """
+        Returns the dictionary of the objects of a class, about to be
+        changed: when a query iterates over it, it is replaced with a
+        copy first.
+
+        Args:
+            cls_name: The name of the class.
+        """
+        bucket = FileStorage.__classes.setdefault(cls_name, {})
+        if cls_name in FileStorage.__shared:
+            FileStorage.__shared.discard(cls_name)
+            bucket = FileStorage.__classes[cls_name] = dict(bucket)
+        return bucket
+
+    def __index_remove(self, key, obj):
+        """
+        Removes an object from the indexes.
+
+        Args:
+            key: The storage key of the object.
+            obj: The object to remove.
+        """
+        cls_name = obj.__class__.__name__
+        if key in FileStorage.__classes.get(cls_name, ()):
+            del self.__bucket(cls_name)[key]
+        for index in FileStorage.__secondary.get(cls_name, ()):
+            index.remove(key)
+
+
+def _start_worker():
+    """
+    Prepares a process forked by `FileStorage.__load_parallel`: the
+    storage lock and the file lock it inherited are held by the parent.
+    """
+    if FileStorage._FileStorage__lock_fd is not None:
+        os.close(FileStorage._FileStorage__lock_fd)
+        FileStorage._FileStorage__lock_fd = None
+    FileStorage._FileStorage__lock = RWLock()
+
+
+def _load_range(path, start, end):
+    """
+    Builds the objects of the records between two offsets of a snapshot,
+    in a process forked by `FileStorage.__load_parallel`.
+
+    Args:
+        path: The path of the snapshot.
+        start, end: The offsets of the range (see split_records).
+
+    Returns:
+        A tuple of the objects by class (key: class name, value: {object
+        ID: object}), the cached records (key: object ID, value: (object,
+        JSON text)), the checksums of their text (key: object ID), the
+        checksums member if the range holds it (or None), and True if the
+        range ends the snapshot.
+
+    Raises:
+        Exception: If the range is malformed or a record cannot be turned
+        into an object.
+    """
+    with open(path, "rb") as file:
+        file.seek(start)
+        data = file.read(end - start)
+    parsed, closed = parse_records(data.decode("utf-8"))
+    loaded = {}
+    records = {}
+    sums = {}
+    checksums = None
+    for key, value, text in parsed:
+        if key == CHECKSUMS and isinstance(value, dict):
+            checksums = value
+            continue
+        class_name, obj_id = key.split('.')
+        obj = classes[class_name](**value)
+        loaded.setdefault(class_name, {})[key] = obj
+        records[key] = (obj, text)
+        sums[key] = checksum(text)
+    return loaded, records, sums, checksums, closed
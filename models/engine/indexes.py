@@ -0,0 +1,762 @@
+#!/usr/bin/python3
+"""
+This script defines the secondary indexes maintained by the storage engine.
+
+Models declare the indexes they want in their `_indexes` class attribute,
+as tuples of an index kind followed by the attribute names it covers:
+
+    _indexes = (("hash", "state_id"),)
+
+The storage engine builds one index per declaration and keeps it up to
+date as objects are created, modified, deleted and reloaded.
+"""
+import math
+import re
+from bisect import bisect_left, insort
+from models.engine.query import sort_key
+
+
+class HashIndex:
+    """
+    An equality index mapping the values of one attribute to the objects
+    holding them.
+
+    Attributes:
+        attribute (str): The name of the indexed attribute.
+        attributes (tuple): The names of the attributes the index covers.
+    """
+
+    def __init__(self, attribute):
+        """
+        Initializes an empty index.
+
+        Args:
+            attribute: The name of the attribute to index.
+        """
+        self.attribute = attribute
+        self.attributes = (attribute,)
+        self.__buckets = {}
+        self.__values = {}
+
+    def add(self, key, obj):
+        """
+        Adds an object to the index, replacing any previous entry
+        for the same key.
+
+        Args:
+            key: The storage key of the object.
+            obj: The object to index.
+        """
+        self.remove(key)
+        value = getattr(obj, self.attribute, None)
+        try:
+            bucket = self.__buckets.setdefault(value, {})
+        except TypeError:
+            return
+        bucket[key] = obj
+        self.__values[key] = value
+
+    def remove(self, key):
+        """
+        Removes the entry of a key from the index, if there is one.
+
+        Args:
+            key: The storage key of the object.
+        """
+        if key not in self.__values:
+            return
+        value = self.__values.pop(key)
+        bucket = self.__buckets[value]
+        del bucket[key]
+        if not bucket:
+            del self.__buckets[value]
+
+    def lookup(self, value):
+        """
+        Returns the objects whose attribute equals a value.
+
+        Args:
+            value: The value to look up.
+
+        Returns:
+            A dictionary (key: object ID, value: object).
+        """
+        try:
+            return dict(self.__buckets.get(value, {}))
+        except TypeError:
+            return {}
+
+    def estimate(self, op, value):
+        """
+        Returns the number of candidates a search would yield, or None
+        if the index cannot serve the operator.
+
+        Args:
+            op: The query operator.
+            value: The value of the condition.
+        """
+        if op not in ("eq", "in"):
+            return None
+        values = [value] if op == "eq" else value
+        try:
+            return sum(len(self.__buckets.get(v, ())) for v in values)
+        except TypeError:
+            return None
+
+    def search(self, op, value):
+        """
+        Returns the objects matching an "eq" or "in" condition.
+
+        Args:
+            op: The query operator.
+            value: The value of the condition.
+
+        Returns:
+            A dictionary (key: object ID, value: object).
+        """
+        if op == "eq":
+            return self.lookup(value)
+        result = {}
+        for v in value:
+            result.update(self.lookup(v))
+        return result
+
+
+class _Top:
+    """
+    A sentinel comparing greater than any storage key, used to bisect
+    past every entry holding a given value.
+    """
+
+    def __lt__(self, other):
+        return False
+
+    def __gt__(self, other):
+        return True
+
+
+_TOP = _Top()
+
+
+class SortedIndex:
+    """
+    An ordered index over one numeric attribute, kept as a sorted list of
+    (value, key) pairs searched with bisect. It serves range conditions
+    and ordered iteration without sorting the indexed objects.
+
+    Objects whose value is not a number are kept aside: they never match
+    a range and are ordered after the numbers.
+
+    The iterators returned by `ordered` walk the entries as they were
+    when it was called: the next change to the index copies them rather
+    than changing them in place.
+
+    Attributes:
+        attribute (str): The name of the indexed attribute.
+        attributes (tuple): The names of the attributes the index covers.
+    """
+
+    def __init__(self, attribute):
+        """
+        Initializes an empty index.
+
+        Args:
+            attribute: The name of the attribute to index.
+        """
+        self.attribute = attribute
+        self.attributes = (attribute,)
+        self.__entries = []
+        self.__values = {}
+        self.__objects = {}
+        self.__others = {}
+        self.__shared = False
+
+    def __own(self):
+        """
+        Copies the entries an iterator may be walking before they change.
+        """
+        if self.__shared:
+            self.__entries = list(self.__entries)
+            self.__objects = dict(self.__objects)
+            self.__shared = False
+
+    def add(self, key, obj):
+        """
+        Adds an object to the index, replacing any previous entry
+        for the same key.
+
+        Args:
+            key: The storage key of the object.
+            obj: The object to index.
+        """
+        self.remove(key)
+        self.__own()
+        value = getattr(obj, self.attribute, None)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            insort(self.__entries, (value, key))
+            self.__values[key] = value
+            self.__objects[key] = obj
+        else:
+            self.__others[key] = obj
+
+    def build(self, bucket):
+        """
+        Fills the index with many objects at once, replacing its entries.
+        The entries are sorted once rather than inserted one at a time,
+        which would take quadratic time.
+
+        Args:
+            bucket: The objects to index (key: object ID, value: object).
+        """
+        self.__values = {}
+        self.__objects = {}
+        self.__others = {}
+        self.__shared = False
+        for key, obj in bucket.items():
+            value = getattr(obj, self.attribute, None)
+            if (isinstance(value, (int, float)) and
+                    not isinstance(value, bool)):
+                self.__values[key] = value
+                self.__objects[key] = obj
+            else:
+                self.__others[key] = obj
+        self.__entries = sorted((value, key) for key, value in
+                                self.__values.items())
+
+    def remove(self, key):
+        """
+        Removes the entry of a key from the index, if there is one.
+
+        Args:
+            key: The storage key of the object.
+        """
+        if key in self.__values:
+            self.__own()
+            value = self.__values.pop(key)
+            del self.__entries[bisect_left(self.__entries, (value, key))]
+            del self.__objects[key]
+        else:
+            self.__others.pop(key, None)
+
+    def __bounds(self, op, value):
+        """
+        Returns the slice of the sorted entries matching a condition.
+
+        Args:
+            op: One of eq, lt, le, gt or ge.
+            value: The value of the condition.
+
+        Raises:
+            TypeError: If the value cannot be compared with numbers.
+        """
+        entries = self.__entries
+        low, high = 0, len(entries)
+        if op in ("eq", "ge"):
+            low = bisect_left(entries, (value,))
+        elif op == "gt":
+            low = bisect_left(entries, (value, _TOP))
+        if op in ("eq", "le"):
+            high = bisect_left(entries, (value, _TOP))
+        elif op == "lt":
+            high = bisect_left(entries, (value,))
+        return low, max(low, high)
+
+    def estimate(self, op, value):
+        """
+        Returns the number of candidates a search would yield, or None
+        if the index cannot serve the condition.
+
+        Args:
+            op: The query operator.
+            value: The value of the condition.
+        """
+        if op not in ("eq", "lt", "le", "gt", "ge"):
+            return None
+        try:
+            low, high = self.__bounds(op, value)
+        except TypeError:
+            return None
+        return high - low
+
+    def search(self, op, value):
+        """
+        Returns the objects matching a condition, in ascending order.
+
+        Args:
+            op: One of eq, lt, le, gt or ge.
+            value: The value of the condition.
+
+        Returns:
+            A dictionary (key: object ID, value: object).
+        """
+        low, high = self.__bounds(op, value)
+        return {key: self.__objects[key] for _, key in
+                self.__entries[low:high]}
+
+    def ordered(self, reverse=False, op=None, value=None):
+        """
+        Iterates over the indexed objects in the order of their values,
+        optionally restricted to a range condition.
+
+        Args:
+            reverse: If True, iterate in descending order.
+            op: The operator of an optional range condition.
+            value: The value of the condition.
+
+        Returns:
+            An iterator over (key, object) pairs, unaffected by later
+            changes to the index.
+        """
+        if op is None:
+            low, high = 0, len(self.__entries)
+        else:
+            low, high = self.__bounds(op, value)
+        steps = range(high - 1, low - 1, -1) if reverse else range(low, high)
+        others = []
+        if op is None:
+            others = sorted(self.__others.items(), reverse=reverse,
+                            key=lambda item: sort_key(
+                                getattr(item[1], self.attribute, None)))
+        self.__shared = True
+        return self.__walk(self.__entries, self.__objects, steps, others,
+                           reverse)
+
+    @staticmethod
+    def __walk(entries, objects, steps, others, reverse):
+        """
+        Yields the (key, object) pairs of `ordered`, from the entries and
+        objects it was called with.
+        """
+        if reverse:
+            yield from others
+        for i in steps:
+            key = entries[i][1]
+            yield key, objects[key]
+        if not reverse:
+            yield from others
+
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """
+    Returns the great-circle (haversine) distance between two points.
+
+    Args:
+        lat1, lon1: The coordinates of the first point, in degrees.
+        lat2, lon2: The coordinates of the second point, in degrees.
+
+    Returns:
+        The distance in kilometers.
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = (math.sin(d_phi / 2) ** 2 +
+         math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GridIndex:
+    """
+    A spatial index bucketing objects into a grid of latitude/longitude
+    cells, so that nearby searches only look at the cells overlapping
+    the searched area.
+
+    Objects whose coordinates are not numbers are left out.
+
+    Attributes:
+        attributes (tuple): The names of the latitude and longitude
+        attributes.
+        cell_size (float): The size of a grid cell, in degrees.
+    """
+
+    def __init__(self, latitude, longitude, cell_size=0.1):
+        """
+        Initializes an empty index.
+
+        Args:
+            latitude: The name of the latitude attribute.
+            longitude: The name of the longitude attribute.
+            cell_size: The size of a grid cell, in degrees.
+        """
+        self.attributes = (latitude, longitude)
+        self.cell_size = cell_size
+        self.__columns = max(1, round(360 / cell_size))
+        self.__cells = {}
+        self.__points = {}
+
+    def __cell(self, lat, lon):
+        """
+        Returns the grid cell of a point.
+        """
+        return (math.floor(lat / self.cell_size),
+                math.floor((lon + 180) / self.cell_size) % self.__columns)
+
+    def add(self, key, obj):
+        """
+        Adds an object to the index, replacing any previous entry
+        for the same key.
+
+        Args:
+            key: The storage key of the object.
+            obj: The object to index.
+        """
+        self.remove(key)
+        point = tuple(getattr(obj, name, None) for name in self.attributes)
+        for value in point:
+            if (not isinstance(value, (int, float)) or
+                    isinstance(value, bool) or math.isnan(value)):
+                return
+        cell = self.__cell(*point)
+        self.__cells.setdefault(cell, {})[key] = obj
+        self.__points[key] = (point, cell)
+
+    def remove(self, key):
+        """
+        Removes the entry of a key from the index, if there is one.
+
+        Args:
+            key: The storage key of the object.
+        """
+        if key not in self.__points:
+            return
+        point, cell = self.__points.pop(key)
+        bucket = self.__cells[cell]
+        del bucket[key]
+        if not bucket:
+            del self.__cells[cell]
+
+    def within(self, south, west, north, east):
+        """
+        Returns the objects inside a bounding box. A box whose west edge
+        is greater than its east edge crosses the antimeridian.
+
+        Args:
+            south, west, north, east: The edges of the box, in degrees.
+
+        Returns:
+            A dictionary (key: object ID, value: object).
+        """
+        result = {}
+        for key, obj in self.__candidates(south, west, north, east):
+            lat, lon = self.__points[key][0]
+            if south <= lat <= north and (
+                    west <= lon <= east if west <= east else
+                    lon >= west or lon <= east):
+                result[key] = obj
+        return result
+
+    def nearby(self, latitude, longitude, radius_km):
+        """
+        Returns the objects within a distance of a point, nearest first.
+
+        Args:
+            latitude, longitude: The coordinates of the point, in degrees.
+            radius_km: The search radius, in kilometers.
+
+        Returns:
+            A list of (distance in km, key, object) tuples.
+        """
+        d_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+        south, north = latitude - d_lat, latitude + d_lat
+        cos_lat = min(math.cos(math.radians(max(south, -90))),
+                      math.cos(math.radians(min(north, 90))))
+        if cos_lat <= 0 or d_lat / cos_lat >= 180:
+            west, east = -180, 180
+        else:
+            d_lon = d_lat / cos_lat
+            west = (longitude - d_lon + 180) % 360 - 180
+            east = (longitude + d_lon + 180) % 360 - 180
+        result = []
+        for key, obj in self.__candidates(south, west, north, east):
+            lat, lon = self.__points[key][0]
+            distance = distance_km(latitude, longitude, lat, lon)
+            if distance <= radius_km:
+                result.append((distance, key, obj))
+        result.sort(key=lambda item: item[:2])
+        return result
+
+    def __candidates(self, south, west, north, east):
+        """
+        Iterates over the objects of the cells overlapping a box, or of
+        every occupied cell when that is cheaper.
+        """
+        rows = range(math.floor(south / self.cell_size),
+                     math.floor(north / self.cell_size) + 1)
+        first = self.__cell(0, west)[1]
+        span = east - west if west <= east else east - west + 360
+        count = min(self.__columns, math.floor(span / self.cell_size) + 2)
+        if len(rows) * count >= len(self.__cells):
+            for bucket in self.__cells.values():
+                yield from bucket.items()
+            return
+        for row in rows:
+            for step in range(count):
+                column = (first + step) % self.__columns
+                yield from self.__cells.get((row, column), {}).items()
+
+
+class SetIndex:
+    """
+    A many-to-many index over an attribute holding a collection of
+    values (such as Place.amenity_ids), mapping each value to the set of
+    objects holding it. It serves "contains" conditions, and
+    "contains_all" conditions as set intersections.
+
+    The index reads the value stored on the instance; objects without
+    one are treated as holding nothing.
+
+    Attributes:
+        attribute (str): The name of the indexed attribute.
+        attributes (tuple): The names of the attributes the index covers.
+    """
+
+    def __init__(self, attribute):
+        """
+        Initializes an empty index.
+
+        Args:
+            attribute: The name of the attribute to index.
+        """
+        self.attribute = attribute
+        self.attributes = (attribute,)
+        self.__members = {}
+        self.__values = {}
+        self.__objects = {}
+
+    def add(self, key, obj):
+        """
+        Adds an object to the index, replacing any previous entry
+        for the same key.
+
+        Args:
+            key: The storage key of the object.
+            obj: The object to index.
+        """
+        self.remove(key)
+        values = set()
+        held = vars(obj).get(self.attribute, ())
+        if not isinstance(held, (list, tuple, set, frozenset)):
+            held = ()
+        for value in held:
+            try:
+                self.__members.setdefault(value, set()).add(key)
+            except TypeError:
+                continue
+            values.add(value)
+        self.__values[key] = values
+        self.__objects[key] = obj
+
+    def remove(self, key):
+        """
+        Removes the entry of a key from the index, if there is one.
+
+        Args:
+            key: The storage key of the object.
+        """
+        if key not in self.__objects:
+            return
+        for value in self.__values.pop(key):
+            members = self.__members[value]
+            members.discard(key)
+            if not members:
+                del self.__members[value]
+        del self.__objects[key]
+
+    def __sets(self, op, value):
+        """
+        Returns the member sets a condition has to intersect.
+        """
+        values = [value] if op == "contains" else list(value)
+        return [self.__members.get(v, set()) for v in values]
+
+    def estimate(self, op, value):
+        """
+        Returns an upper bound of the number of candidates a search would
+        yield, or None if the index cannot serve the condition.
+
+        Args:
+            op: The query operator.
+            value: The value of the condition.
+        """
+        if op not in ("contains", "contains_all"):
+            return None
+        try:
+            sets = self.__sets(op, value)
+        except TypeError:
+            return None
+        return min(map(len, sets)) if sets else len(self.__objects)
+
+    def search(self, op, value):
+        """
+        Returns the objects holding one value ("contains") or every
+        value ("contains_all").
+
+        Args:
+            op: "contains" or "contains_all".
+            value: A value, or a collection of values.
+
+        Returns:
+            A dictionary (key: object ID, value: object).
+        """
+        sets = sorted(self.__sets(op, value), key=len)
+        if not sets:
+            return dict(self.__objects)
+        keys = set(sets[0]).intersection(*sets[1:])
+        return {key: self.__objects[key] for key in keys}
+
+
+def tokenize(text):
+    """
+    Splits a text into lowercase word terms.
+
+    Args:
+        text: The text to split.
+
+    Returns:
+        A list of terms.
+    """
+    if not isinstance(text, str):
+        return []
+    return re.findall(r"\w+", text.lower())
+
+
+class TextIndex:
+    """
+    An inverted index mapping the terms of one text attribute to the
+    objects containing them, with their term frequencies.
+
+    Attributes:
+        attribute (str): The name of the indexed attribute.
+        attributes (tuple): The names of the attributes the index covers.
+    """
+
+    def __init__(self, attribute):
+        """
+        Initializes an empty index.
+
+        Args:
+            attribute: The name of the attribute to index.
+        """
+        self.attribute = attribute
+        self.attributes = (attribute,)
+        self.__postings = {}
+        self.__terms = {}
+        self.__objects = {}
+
+    def add(self, key, obj):
+        """
+        Adds an object to the index, replacing any previous entry
+        for the same key.
+
+        Args:
+            key: The storage key of the object.
+            obj: The object to index.
+        """
+        self.remove(key)
+        frequencies = {}
+        for term in tokenize(getattr(obj, self.attribute, None)):
+            frequencies[term] = frequencies.get(term, 0) + 1
+        for term, count in frequencies.items():
+            self.__postings.setdefault(term, {})[key] = count
+        self.__terms[key] = list(frequencies)
+        self.__objects[key] = obj
+
+    def remove(self, key):
+        """
+        Removes the entry of a key from the index, if there is one.
+
+        Args:
+            key: The storage key of the object.
+        """
+        if key not in self.__objects:
+            return
+        for term in self.__terms.pop(key):
+            posting = self.__postings[term]
+            del posting[key]
+            if not posting:
+                del self.__postings[term]
+        del self.__objects[key]
+
+    def search(self, terms, mode="and"):
+        """
+        Scores the objects containing all ("and") or any ("or") of the
+        terms, by the sum of tf-idf weights of the matched terms.
+
+        Args:
+            terms: A list of terms, as returned by `tokenize`.
+            mode: "and" or "or".
+
+        Returns:
+            A dictionary (key: object ID, value: score).
+        """
+        postings = [self.__postings.get(term, {}) for term in set(terms)]
+        if not postings:
+            return {}
+        if mode == "and":
+            postings.sort(key=len)
+            keys = set(postings[0])
+            for posting in postings[1:]:
+                keys.intersection_update(posting)
+        else:
+            keys = set().union(*postings)
+        total = len(self.__objects)
+        scores = dict.fromkeys(keys, 0.0)
+        for posting in postings:
+            if not posting:
+                continue
+            idf = math.log(1 + total / len(posting))
+            for key in keys.intersection(posting):
+                scores[key] += posting[key] * idf
+        return scores
+
+    def dump(self):
+        """
+        Returns the postings of the index, to be persisted as JSON.
+        """
+        return self.__postings
+
+    def restore(self, postings, bucket):
+        """
+        Fills the index from persisted postings instead of tokenizing
+        every object again.
+
+        Args:
+            postings: The postings returned by `dump`.
+            bucket: The indexed objects (key: object ID, value: object).
+        """
+        self.__postings = {}
+        self.__terms = {key: [] for key in bucket}
+        self.__objects = dict(bucket)
+        for term, posting in postings.items():
+            posting = {key: count for key, count in posting.items()
+                       if key in bucket}
+            if posting:
+                self.__postings[term] = posting
+                for key in posting:
+                    self.__terms[key].append(term)
+
+
+KINDS = {
+    "hash": HashIndex,
+    "sorted": SortedIndex,
+    "grid": GridIndex,
+    "text": TextIndex,
+    "set": SetIndex,
+}
+
+
+def build_indexes(cls):
+    """
+    Builds empty indexes for the declarations of a model class.
+
+    Args:
+        cls: The model class.
+
+    Returns:
+        A list of indexes.
+    """
+    return [KINDS[kind](*attrs) for kind, *attrs in
+            getattr(cls, "_indexes", ())]
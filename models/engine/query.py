@@ -0,0 +1,113 @@
+#!/usr/bin/python3
+"""
+This script defines the filter conditions understood by `storage.query`.
+
+Filters are given as keyword arguments named "<attribute>__<operator>",
+where a bare "<attribute>" means equality:
+
+    storage.query(Place, city_id="1234", max_guest__ge=4)
+
+Supported operators are eq, ne, lt, le, gt, ge, in (membership in a
+collection of values), contains (the attribute is a collection holding
+the value) and contains_all (the attribute holds every given value).
+
+Results can be ordered by an attribute ("-<attribute>" for descending
+order): numbers come first, then strings, then any other value.
+"""
+import heapq
+import operator
+
+OPERATORS = {
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "lt": operator.lt,
+    "le": operator.le,
+    "gt": operator.gt,
+    "ge": operator.ge,
+    "in": lambda value, values: value in values,
+    "contains": lambda values, value: value in values,
+    "contains_all": lambda values, wanted: all(v in values for v in wanted),
+}
+
+
+def parse_filters(filters):
+    """
+    Splits keyword filters into conditions.
+
+    Args:
+        filters: A dictionary of "<attribute>__<operator>" to values.
+
+    Returns:
+        A list of (attribute, operator, value) tuples.
+
+    Raises:
+        ValueError: If an operator is unknown.
+    """
+    conditions = []
+    for name, value in filters.items():
+        attribute, _, op = name.partition("__")
+        op = op or "eq"
+        if op not in OPERATORS:
+            raise ValueError("unknown query operator: {}".format(op))
+        conditions.append((attribute, op, value))
+    return conditions
+
+
+def matches(obj, conditions):
+    """
+    Tells whether an object satisfies every condition. Values that cannot
+    be compared with the condition's value never match.
+
+    Args:
+        obj: The object to test.
+        conditions: A list of (attribute, operator, value) tuples.
+
+    Returns:
+        True if all the conditions hold, False otherwise.
+    """
+    for attribute, op, value in conditions:
+        try:
+            if not OPERATORS[op](getattr(obj, attribute, None), value):
+                return False
+        except TypeError:
+            return False
+    return True
+
+
+def sort_key(value):
+    """
+    Returns a key ordering numbers, then strings, then other values,
+    so that attributes holding mixed types can still be sorted.
+
+    Args:
+        value: The attribute value.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (0, value, "")
+    if isinstance(value, str):
+        return (1, 0, value)
+    return (2, 0, "")
+
+
+def order(objects, attribute, reverse=False, limit=None):
+    """
+    Sorts objects by an attribute, keeping only the first `limit` ones
+    without sorting the rest when a limit is given.
+
+    Args:
+        objects: An iterable of objects.
+        attribute: The name of the attribute to sort on.
+        reverse: If True, sort in descending order.
+        limit: The maximum number of objects to return.
+
+    Returns:
+        A list of objects.
+    """
+    def key(obj):
+        return sort_key(getattr(obj, attribute, None))
+
+    if limit is None:
+        return sorted(objects, key=key, reverse=reverse)
+    if reverse:
+        return heapq.nlargest(limit, objects, key=key)
+    return heapq.nsmallest(limit, objects, key=key)
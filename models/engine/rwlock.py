@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+"""
+This script defines a readers-writer lock.
+
+Any number of threads can hold the lock for reading at the same time,
+while a thread holding it for writing excludes every other thread:
+
+    lock = RWLock()
+    with lock.read():
+        ...
+    with lock.write():
+        ...
+
+Both sides are reentrant, and the writer may also take the read side.
+A reader cannot take the write side (that would deadlock against another
+reader doing the same). Waiting writers go before new readers, so a
+steady flow of readers cannot starve them.
+"""
+import threading
+from contextlib import contextmanager
+
+
+class RWLock:
+    """
+    A reentrant readers-writer lock favoring writers.
+
+    Attributes:
+        __condition: The condition guarding the state of the lock.
+        __readers: The number of read acquisitions held by each thread
+        (key: thread identifier, value: count).
+        __writer: The identifier of the thread holding the write side,
+        or None.
+        __writes: The number of write acquisitions held by the writer.
+        __waiting: The number of threads waiting for the write side.
+    """
+
+    def __init__(self):
+        """
+        Initializes an unlocked lock.
+        """
+        self.__condition = threading.Condition(threading.Lock())
+        self.__readers = {}
+        self.__writer = None
+        self.__writes = 0
+        self.__waiting = 0
+
+    @contextmanager
+    def read(self):
+        """
+        Returns a context manager holding the lock for reading.
+        """
+        me = threading.get_ident()
+        with self.__condition:
+            if self.__writer != me and me not in self.__readers:
+                while self.__writer is not None or self.__waiting:
+                    self.__condition.wait()
+            self.__readers[me] = self.__readers.get(me, 0) + 1
+        try:
+            yield
+        finally:
+            with self.__condition:
+                self.__readers[me] -= 1
+                if not self.__readers[me]:
+                    del self.__readers[me]
+                    self.__condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        """
+        Returns a context manager holding the lock for writing.
+
+        Raises:
+            RuntimeError: If the thread holds the lock for reading only.
+        """
+        me = threading.get_ident()
+        with self.__condition:
+            if self.__writer != me:
+                if me in self.__readers:
+                    raise RuntimeError("cannot upgrade a read lock")
+                self.__waiting += 1
+                try:
+                    while self.__writer is not None or self.__readers:
+                        self.__condition.wait()
+                finally:
+                    self.__waiting -= 1
+                self.__writer = me
+            self.__writes += 1
+        try:
+            yield
+        finally:
+            with self.__condition:
+                self.__writes -= 1
+                if not self.__writes:
+                    self.__writer = None
+                    self.__condition.notify_all()
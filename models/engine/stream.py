@@ -0,0 +1,337 @@
+#!/usr/bin/python3
+"""
+This script defines an incremental reader and writer for the JSON file
+of the storage engine.
+
+The file holds a single JSON object mapping storage keys to records.
+Instead of parsing the whole file at once, `scan_records` reads it in
+chunks and yields one (key, record, JSON text) tuple at a time, so that
+only the current chunk and record are held in memory besides what the
+caller keeps:
+
+    with open("file.json", "r", encoding="utf-8") as file:
+        for key, record, text in scan_records(file):
+            ...
+
+A malformed record does not stop the reader: it is reported with a
+record of None, and reading resumes at the next record it can find.
+
+`write_records` does the reverse, writing records to the file as they
+are produced instead of assembling the whole document first. It can
+also append a "__checksums__" member holding the CRC-32 of the JSON text
+of every record, which lets the reader verify the text `scan_records`
+yields.
+
+`split_records` cuts a file into byte ranges starting at record keys,
+which `parse_records` parses independently, so that several processes
+can each parse one range.
+"""
+import json
+import os
+import re
+import zlib
+
+WHITESPACE = " \t\n\r"
+
+CHECKSUMS = "__checksums__"
+
+RECORD_START = re.compile(r'[{,]\s*("[A-Za-z_]\w*\.[^"\\]+"\s*:\s*\{)')
+
+RECORD_START_BYTES = re.compile(RECORD_START.pattern.encode("ascii"))
+
+SPACE = re.compile(r"[ \t\n\r]*")
+
+
+def checksum(text):
+    """
+    Returns the CRC-32 of the JSON text of a record.
+    """
+    return zlib.crc32(text.encode("utf-8"))
+
+
+class _Chunks:
+    """
+    A text buffer refilled from a file on demand.
+
+    Attributes:
+        file: The file being read.
+        chunk_size (int): The minimum number of characters read at once.
+        text (str): The characters read and not consumed yet.
+        pos (int): The position of the next character to consume in text.
+    """
+
+    def __init__(self, file, chunk_size):
+        """
+        Initializes an empty buffer over a file.
+
+        Args:
+            file: A file opened in text mode.
+            chunk_size: The minimum number of characters read at once.
+        """
+        self.file = file
+        self.chunk_size = chunk_size
+        self.text = ""
+        self.pos = 0
+
+    def more(self):
+        """
+        Drops the consumed characters and reads more of the file. The
+        amount read grows with the unconsumed text, so that a record
+        larger than a chunk is parsed a logarithmic number of times.
+
+        Returns:
+            False at the end of the file, True otherwise.
+        """
+        chunk = self.file.read(max(self.chunk_size,
+                                   len(self.text) - self.pos))
+        if not chunk:
+            return False
+        self.text = self.text[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """
+        Skips whitespace and returns the next character without
+        consuming it, or "" at the end of the file.
+        """
+        while True:
+            while (self.pos < len(self.text) and
+                   self.text[self.pos] in WHITESPACE):
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.more():
+                return ""
+
+    def expect(self, chars):
+        """
+        Consumes the next character, which must be one of `chars`.
+
+        Returns:
+            The character consumed.
+
+        Raises:
+            ValueError: If the next character is not one of `chars`.
+        """
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError("expected one of {!r} at {!r}".format(
+                chars, self.text[self.pos:self.pos + 20]))
+        self.pos += 1
+        return char
+
+    def value(self, decoder, with_text=False):
+        """
+        Decodes and consumes the next JSON value, reading more of the
+        file until the value is complete. However large the value, it is
+        only reported as malformed once the rest of the file does not
+        complete it.
+
+        Args:
+            decoder: The json.JSONDecoder to decode with.
+            with_text: If True, also return the JSON text of the value.
+
+        Returns:
+            The value, or a (value, JSON text) tuple.
+
+        Raises:
+            ValueError: If the value is malformed or truncated.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                if self.more():
+                    continue
+                raise
+            if end == len(self.text) and self.more():
+                continue
+            start, self.pos = self.pos, end
+            if with_text:
+                return value, self.text[start:end]
+            return value
+
+    def resync(self):
+        """
+        Skips to the key of the next record after the current position.
+
+        Returns:
+            False if no further record was found, True otherwise.
+        """
+        self.pos += 1
+        while True:
+            match = RECORD_START.search(self.text, self.pos)
+            if match is not None:
+                self.pos = match.start(1)
+                return True
+            self.pos = max(self.pos, len(self.text) - 512)
+            if not self.more():
+                self.pos = len(self.text)
+                return False
+
+
+def scan_records(file, chunk_size=1 << 16):
+    """
+    Yields the members of the JSON object stored in a file, one at a time,
+    skipping over the parts of the file that cannot be parsed.
+
+    Args:
+        file: A file opened in text mode, positioned at the object.
+        chunk_size: The number of characters read at once.
+
+    Yields:
+        (key, value, JSON text of the value) tuples, in file order. For
+        a member that could not be parsed, value and text are None, and
+        key is None as well when it could not be read.
+    """
+    decoder = json.JSONDecoder()
+    chunks = _Chunks(file, chunk_size)
+    if chunks.peek() == "":
+        return
+    try:
+        chunks.expect("{")
+        if chunks.peek() == "}":
+            return
+    except ValueError:
+        yield None, None, None
+        if not chunks.resync():
+            return
+    while True:
+        key = None
+        try:
+            key = chunks.value(decoder)
+            if not isinstance(key, str):
+                raise ValueError("object keys must be strings")
+            chunks.expect(":")
+            value, text = chunks.value(decoder, with_text=True)
+        except ValueError:
+            yield key if isinstance(key, str) else None, None, None
+            if not chunks.resync():
+                return
+            continue
+        yield key, value, text
+        try:
+            if chunks.expect(",}") == "}":
+                return
+        except ValueError:
+            yield None, None, None
+            if not chunks.resync():
+                return
+
+
+def write_records(file, records, checksums=False):
+    """
+    Writes records as the members of one JSON object, one at a time.
+
+    Args:
+        file: A file opened in text mode for writing.
+        records: An iterable of (key, JSON text of the value) tuples.
+        checksums: If True, end the object with a CHECKSUMS member
+        mapping every key to the checksum of its JSON text.
+
+    Returns:
+        The number of records written.
+    """
+    count = 0
+    sums = {}
+    file.write("{")
+    for key, text in records:
+        if count:
+            file.write(", ")
+        file.write(json.dumps(key))
+        file.write(": ")
+        file.write(text)
+        if checksums:
+            sums[key] = checksum(text)
+        count += 1
+    if checksums:
+        file.write('{}"{}": '.format(", " if count else "", CHECKSUMS))
+        json.dump(sums, file)
+    file.write("}")
+    return count
+
+
+def split_records(file, parts, window=1 << 16):
+    """
+    Cuts the JSON object stored in a file into byte ranges of about the
+    same size. Every range but the first starts at the key of a record,
+    so each range holds whole records. In a well-formed file a record
+    key cannot be mistaken for text inside a string, where quotes are
+    escaped.
+
+    Args:
+        file: A file opened in binary mode.
+        parts: The number of ranges wanted.
+        window: The number of bytes read at once looking for a key.
+
+    Returns:
+        The list of offsets starting the ranges, followed by the size of
+        the file; there may be fewer than `parts` ranges.
+    """
+    size = file.seek(0, os.SEEK_END)
+    offsets = [0]
+    for part in range(1, parts):
+        position = max(size * part // parts, offsets[-1] + 1) - 1
+        match = None
+        while match is None and position < size:
+            file.seek(position)
+            data = file.read(window)
+            match = RECORD_START_BYTES.search(data)
+            if match is None:
+                position += max(len(data) - 512, 1)
+        if match is None:
+            break
+        offsets.append(position + match.start(1))
+    offsets.append(size)
+    return offsets
+
+
+def parse_records(text):
+    """
+    Parses the members of one range returned by `split_records`.
+
+    Args:
+        text: The decoded range: members separated by commas, preceded
+        by the opening brace in the first range and followed by the
+        closing brace in the last one.
+
+    Returns:
+        A tuple of the list of (key, value, JSON text of the value)
+        tuples, and True if the range ends the object.
+
+    Raises:
+        ValueError: If the range is malformed.
+    """
+    decoder = json.JSONDecoder()
+    records = []
+    pos = SPACE.match(text).end()
+    if text.startswith("{", pos):
+        pos = SPACE.match(text, pos + 1).end()
+        if text.startswith("}", pos):
+            pos += 1
+            if SPACE.match(text, pos).end() != len(text):
+                raise ValueError("data after the object")
+            return records, True
+    while pos < len(text):
+        key, pos = decoder.raw_decode(text, pos)
+        if not isinstance(key, str):
+            raise ValueError("object keys must be strings")
+        pos = SPACE.match(text, pos).end()
+        if not text.startswith(":", pos):
+            raise ValueError("expected ':' at {!r}".format(
+                text[pos:pos + 20]))
+        start = SPACE.match(text, pos + 1).end()
+        value, pos = decoder.raw_decode(text, start)
+        records.append((key, value, text[start:pos]))
+        pos = SPACE.match(text, pos).end()
+        if text.startswith("}", pos):
+            if SPACE.match(text, pos + 1).end() != len(text):
+                raise ValueError("data after the object")
+            return records, True
+        if not text.startswith(",", pos):
+            raise ValueError("expected ',' or '}}' at {!r}".format(
+                text[pos:pos + 20]))
+        pos = SPACE.match(text, pos + 1).end()
+    return records, False
@@ -6,9 +6,42 @@ A place represents a location that can be booked for accommodation,
 such as an apartment, house, or other lodging.
 """
 
+import models
 from models.base_model import BaseModel
 
 
+class InstanceList:
+    """
+    A list attribute whose class-level value is an empty list, but which
+    gives every instance its own list on first access, so that instances
+    never share (and mutate) a list through the class.
+
+    Attributes:
+        name (str): The name of the attribute.
+    """
+
+    def __set_name__(self, owner, name):
+        """
+        Records the name of the attribute.
+        """
+        self.name = name
+
+    def __get__(self, obj, owner=None):
+        """
+        Returns an empty list on the class, and the instance's own list
+        (created empty if needed) on an instance.
+        """
+        if obj is None:
+            return []
+        return obj.__dict__.setdefault(self.name, [])
+
+    def __set__(self, obj, value):
+        """
+        Stores a value in the instance.
+        """
+        obj.__dict__[self.name] = value
+
+
 class Place(BaseModel):
     """
     Represents a place for accommodation with various attributes.
@@ -25,7 +58,12 @@ class Place(BaseModel):
         latitude (float): The geographical latitude of the place.
         longitude (float): The geographical longitude of the place.
         amenity_ids (list): A list of IDs for
-        amenities associated with the place.
+        amenities associated with the place, owned by each instance.
+        Use add_amenity and remove_amenity to change it, so that the
+        storage indexes see the change.
+        reviews (list): The reviews of the place (read-only).
+        _indexes (tuple): The storage indexes declared on the place's
+        attributes.
 
     Inherits from the BaseModel class which provides common functionality
     for managing objects in the application.
@@ -40,4 +78,43 @@ class Place(BaseModel):
     price_by_night = 0
     latitude = 0.0
     longitude = 0.0
-    amenity_ids = []
+    amenity_ids = InstanceList()
+
+    _indexes = (("hash", "city_id"), ("hash", "user_id"),
+                ("sorted", "price_by_night"), ("sorted", "number_rooms"),
+                ("sorted", "max_guest"), ("grid", "latitude", "longitude"),
+                ("text", "name"), ("text", "description"),
+                ("set", "amenity_ids"))
+
+    @property
+    def reviews(self):
+        """
+        Returns the Review instances whose place_id is this place's id,
+        through the storage index on Review.place_id.
+        """
+        return list(models.storage.lookup("Review", "place_id",
+                                          self.id).values())
+
+    def add_amenity(self, amenity):
+        """
+        Links an amenity to the place. The list of amenity IDs is copied
+        and assigned back rather than modified in place.
+
+        Args:
+            amenity: An Amenity instance or an amenity ID.
+        """
+        amenity_id = getattr(amenity, "id", amenity)
+        if amenity_id not in self.amenity_ids:
+            self.amenity_ids = self.amenity_ids + [amenity_id]
+
+    def remove_amenity(self, amenity):
+        """
+        Unlinks an amenity from the place, copying the list of amenity IDs.
+
+        Args:
+            amenity: An Amenity instance or an amenity ID.
+        """
+        amenity_id = getattr(amenity, "id", amenity)
+        if amenity_id in self.amenity_ids:
+            self.amenity_ids = [i for i in self.amenity_ids
+                                if i != amenity_id]
@@ -15,6 +15,8 @@ class Review(BaseModel):
         place_id (str): The ID of the place being reviewed.
         user_id (str): The ID of the user who wrote the review.
         text (str): The text content of the review.
+        _indexes (tuple): The storage indexes declared on place_id,
+        user_id and text.
 
     Inherits from the BaseModel class which provides common functionality
     for managing objects in the application.
@@ -23,3 +25,5 @@ class Review(BaseModel):
     place_id = ""
     user_id = ""
     text = ""
+
+    _indexes = (("hash", "place_id"), ("hash", "user_id"), ("text", "text"))
@@ -6,6 +6,7 @@ A state represents a geographic division within
 a country, such as a state or province.
 It can contain multiple associated cities.
 """
+import models
 from models.base_model import BaseModel
 
 
@@ -15,9 +16,19 @@ class State(BaseModel):
 
    Attributes:
        name (str): The name of the state.
+       cities (list): The cities of the state (read-only).
 
    Inherits from the BaseModel class which provides common functionality
    for managing objects in the application.
    """
 
     name = ""
+
+    @property
+    def cities(self):
+        """
+        Returns the City instances whose state_id is this state's id,
+        through the storage index on City.state_id.
+        """
+        return list(models.storage.lookup("City", "state_id",
+                                          self.id).values())
@@ -5,6 +5,7 @@ This script defines a class `User` that inherits from `BaseModel`.
 A user represents a person who interacts with the application, such as
 a property owner, guest, or administrator.
 """
+import models
 from models.base_model import BaseModel
 
 
@@ -17,6 +18,7 @@ class User(BaseModel):
         password (str): The user's password (hashed and stored securely).
         first_name (str): The user's first name.
         last_name (str): The user's last name.
+        places (list): The places owned by the user (read-only).
 
     Inherits from the BaseModel class which provides common functionality
     for managing objects in the application.
@@ -29,3 +31,12 @@ class User(BaseModel):
     password = ""
     first_name = ""
     last_name = ""
+
+    @property
+    def places(self):
+        """
+        Returns the Place instances whose user_id is this user's id,
+        through the storage index on Place.user_id.
+        """
+        return list(models.storage.lookup("Place", "user_id",
+                                          self.id).values())
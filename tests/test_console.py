@@ -55,13 +55,32 @@ class TestHBNBCommand_help(unittest.TestCase):
             self.assertFalse(HBNBCommand().onecmd("help EOF"))
             self.assertEqual(h, output.getvalue().strip())
 
+    def test_help_bgsave(self):
+        """
+        This TEST tests the help for the bgsave command
+        """
+        h = "Method to handle bgsave command"
+        with patch("sys.stdout", new=StringIO()) as output:
+            self.assertFalse(HBNBCommand().onecmd("help bgsave"))
+            self.assertEqual(h, output.getvalue().strip())
+
+    def test_help_status(self):
+        """
+        This TEST tests the help for the status command
+        """
+        h = "Method to handle status command"
+        with patch("sys.stdout", new=StringIO()) as output:
+            self.assertFalse(HBNBCommand().onecmd("help status"))
+            self.assertEqual(h, output.getvalue().strip())
+
     def test_help(self):
         """
         This TEST tests the help for all commands
         """
         h = ("Documented commands (type help <topic>):\n"
              "========================================\n"
-             "EOF  all  count  create  destroy  help  quit  show  update")
+             "EOF  bgsave  create   help    quit  status\n"
+             "all  count   destroy  nearby  show  update")
         with patch("sys.stdout", new=StringIO()) as output:
             self.assertFalse(HBNBCommand().onecmd("help"))
             self.assertEqual(h, output.getvalue().strip())
@@ -86,6 +105,25 @@ class TestHBNBCommand_exit(unittest.TestCase):
         with patch("sys.stdout", new=StringIO()) as output:
             self.assertTrue(HBNBCommand().onecmd("EOF"))
 
+    def test_exit_closes_storage(self):
+        """
+        This TEST tests that quit and EOF write the deferred saves and
+        stop the storage's background work
+        """
+        for command in ("quit", "EOF"):
+            with patch("console.storage") as mock_storage:
+                self.assertTrue(HBNBCommand().onecmd(command))
+            mock_storage.close.assert_called_once_with()
+
+    def test_commands_refresh_storage(self):
+        """
+        This TEST tests that the changes saved by other processes are
+        picked up before each command
+        """
+        with patch("console.storage") as mock_storage:
+            self.assertEqual("count User", HBNBCommand().precmd("count User"))
+        mock_storage.refresh.assert_called_once_with()
+
 
 class TestHBNBCommand_create(unittest.TestCase):
     """
@@ -107,10 +145,11 @@ class TestHBNBCommand_create(unittest.TestCase):
         """
         This TEST removes tmp.json and renames file.json back if it existed
         """
-        try:
-            os.remove("file.json")
-        except IOError:
-            pass
+        for path in ("file.json", "file.json.lock"):
+            try:
+                os.remove(path)
+            except IOError:
+                pass
         try:
             os.rename("tmp.json", "file.json")
         except IOError:
@@ -208,10 +247,11 @@ class TestHBNBCommand_show(unittest.TestCase):
         """
         This TEST removes tmp.json and renames file.json back if it existed
         """
-        try:
-            os.remove("file.json")
-        except IOError:
-            pass
+        for path in ("file.json", "file.json.lock"):
+            try:
+                os.remove(path)
+            except IOError:
+                pass
         try:
             os.rename("tmp.json", "file.json")
         except IOError:
@@ -495,10 +535,11 @@ class TestHBNBCommand_destroy(unittest.TestCase):
         This TEST removes tmp.json and renames file.json back if it existed
         """
 
-        try:
-            os.remove("file.json")
-        except FileNotFoundError:
-            pass
+        for path in ("file.json", "file.json.lock"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
         try:
             os.rename("tmp.json", "file.json")
         except FileNotFoundError:
@@ -780,10 +821,11 @@ class TestHBNBCommand_all(unittest.TestCase):
         """
         This TEST removes tmp.json and renames file.json back if it existed
         """
-        try:
-            os.remove("file.json")
-        except FileNotFoundError:
-            pass
+        for path in ("file.json", "file.json.lock"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
         try:
             os.rename("tmp.json", "file.json")
         except FileNotFoundError:
@@ -952,10 +994,11 @@ class TestHBNBCommand_update(unittest.TestCase):
         """
         This TEST removes tmp.json and renames file.json back if it existed
         """
-        try:
-            os.remove("file.json")
-        except FileNotFoundError:
-            pass
+        for path in ("file.json", "file.json.lock"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
         try:
             os.rename("tmp.json", "file.json")
         except FileNotFoundError:
@@ -1598,6 +1641,64 @@ class TestHBNBCommand_update(unittest.TestCase):
         test_dict = storage.all()["Place.{}".format(testId)].__dict__
         self.assertEqual(9.8, test_dict["latitude"])
 
+    def test_update_stale_version(self):
+        """
+        This TEST tests that an update expecting another version than the
+        saved one is refused
+        """
+        with patch("sys.stdout", new=StringIO()) as output:
+            HBNBCommand().onecmd("create User")
+            testId = output.getvalue().strip()
+        obj = storage.all()["User.{}".format(testId)]
+        self.assertEqual(1, obj.version)
+        testCmd = "update User {} first_name 'Betty' 1".format(testId)
+        self.assertFalse(HBNBCommand().onecmd(testCmd))
+        self.assertEqual(2, obj.version)
+        correct = "** User.{} is at version 2, not 1 **".format(testId)
+        testCmd = "update User {} first_name 'Holly' 1".format(testId)
+        with patch("sys.stdout", new=StringIO()) as output:
+            self.assertFalse(HBNBCommand().onecmd(testCmd))
+            self.assertEqual(correct, output.getvalue().strip())
+        self.assertEqual("Betty", obj.first_name)
+
+    def test_update_attributes_named_like_arguments(self):
+        """
+        This TEST tests that attributes named obj and version are set
+        like any other, the version still being kept by the storage
+        """
+        with patch("sys.stdout", new=StringIO()) as output:
+            HBNBCommand().onecmd("create User")
+            testId = output.getvalue().strip()
+        obj = storage.all()["User.{}".format(testId)]
+        for testCmd in ("update User {} obj 5", "update User {} version 9",
+                        "User.update({}, obj, 6)"):
+            with patch("sys.stdout", new=StringIO()) as output:
+                self.assertFalse(HBNBCommand().onecmd(
+                    testCmd.format(testId)))
+                self.assertEqual("", output.getvalue())
+        self.assertEqual(6, obj.obj)
+        self.assertEqual(4, obj.version)
+
+    def test_update_read_only_property(self):
+        """
+        This TEST tests that updating a read-only relationship property
+        prints an error instead of stopping the console
+        """
+        for classname, attribute in (("State", "cities"),
+                                     ("Place", "reviews")):
+            with patch("sys.stdout", new=StringIO()) as output:
+                HBNBCommand().onecmd("create {}".format(classname))
+                testId = output.getvalue().strip()
+            for testCmd in ('update {} {} {} "x"',
+                            "{}.update({}, {}, 1)"):
+                with patch("sys.stdout", new=StringIO()) as output:
+                    self.assertFalse(HBNBCommand().onecmd(
+                        testCmd.format(classname, testId, attribute)))
+                    self.assertTrue(output.getvalue().startswith("** "))
+                    self.assertIn(attribute, output.getvalue())
+            obj = storage.all()["{}.{}".format(classname, testId)]
+            self.assertEqual([], getattr(obj, attribute))
+
 
 class TestHBNBCommand_count(unittest.TestCase):
     """
@@ -1615,10 +1716,11 @@ class TestHBNBCommand_count(unittest.TestCase):
 
     @classmethod
     def tearDown(self):
-        try:
-            os.remove("file.json")
-        except FileNotFoundError:
-            pass
+        for path in ("file.json", "file.json.lock"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
         try:
             os.rename("tmp.json", "file.json")
         except FileNotFoundError:
@@ -1676,5 +1778,149 @@ class TestHBNBCommand_count(unittest.TestCase):
             self.assertEqual("1", output.getvalue().strip())
 
 
+class TestHBNBCommand_nearby(unittest.TestCase):
+    """
+    This class tests the nearby functionality of HBNBCommand
+    """
+
+    @classmethod
+    def setUp(self):
+        try:
+            os.rename("file.json", "tmp.json")
+        except FileNotFoundError:
+            pass
+        FileStorage._FileStorage__objects = {}
+
+    @classmethod
+    def tearDown(self):
+        for path in ("file.json", "file.json.lock"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        try:
+            os.rename("tmp.json", "file.json")
+        except FileNotFoundError:
+            pass
+
+    def test_nearby_missing_coordinates(self):
+        """
+        This TEST tests nearby functionality with missing coordinates
+        """
+        with patch("sys.stdout", new=StringIO()) as output:
+            self.assertFalse(HBNBCommand().onecmd("nearby 48.85 2.35"))
+            self.assertEqual("** coordinates missing **",
+                             output.getvalue().strip())
+
+    def test_nearby_invalid_coordinates(self):
+        """
+        This TEST tests nearby functionality with invalid coordinates
+        """
+        with patch("sys.stdout", new=StringIO()) as output:
+            self.assertFalse(HBNBCommand().onecmd("nearby 48.85 east 5"))
+            self.assertEqual("** invalid coordinates **",
+                             output.getvalue().strip())
+
+    def test_nearby_non_finite_coordinates(self):
+        """
+        This TEST tests nearby functionality with infinite or NaN
+        coordinates and a negative radius
+        """
+        for command in ("nearby 0 0 inf", "nearby nan 0 5",
+                        "nearby Place 0 -inf 5", "nearby 0 0 -1",
+                        "Place.nearby(0, 0, inf)"):
+            with patch("sys.stdout", new=StringIO()) as output:
+                self.assertFalse(HBNBCommand().onecmd(command))
+                self.assertEqual("** invalid coordinates **",
+                                 output.getvalue().strip())
+
+    def test_nearby_invalid_class(self):
+        """
+        This TEST tests nearby functionality with invalid class name
+        """
+        with patch("sys.stdout", new=StringIO()) as output:
+            self.assertFalse(HBNBCommand().onecmd("nearby MyModel 1 2 3"))
+            self.assertEqual("** class doesn't exist **",
+                             output.getvalue().strip())
+
+    def test_nearby_places(self):
+        """
+        This TEST tests nearby functionality using space and dot notation
+        """
+        with patch("sys.stdout", new=StringIO()) as output:
+            self.assertFalse(HBNBCommand().onecmd("create Place"))
+            near_id = output.getvalue().strip()
+        with patch("sys.stdout", new=StringIO()) as output:
+            self.assertFalse(HBNBCommand().onecmd("create Place"))
+            far_id = output.getvalue().strip()
+        HBNBCommand().onecmd("update Place {} latitude 48.86".format(near_id))
+        HBNBCommand().onecmd("update Place {} longitude 2.35".format(near_id))
+        HBNBCommand().onecmd("update Place {} latitude 51.5".format(far_id))
+        for command in ("nearby 48.85 2.35 5",
+                        "Place.nearby(48.85, 2.35, 5)"):
+            with patch("sys.stdout", new=StringIO()) as output:
+                self.assertFalse(HBNBCommand().onecmd(command))
+                self.assertIn(near_id, output.getvalue())
+                self.assertNotIn(far_id, output.getvalue())
+                self.assertTrue(output.getvalue().startswith("1.11 km"))
+
+
+class TestHBNBCommand_bgsave(unittest.TestCase):
+    """
+    This class tests the bgsave and status commands of HBNBCommand
+    """
+
+    def setUp(self):
+        try:
+            os.rename("file.json", "tmp.json")
+        except FileNotFoundError:
+            pass
+        FileStorage._FileStorage__objects = {}
+
+    def tearDown(self):
+        for path in ("file.json", "file.json.lock", "file.json.text"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        try:
+            os.rename("tmp.json", "file.json")
+        except FileNotFoundError:
+            pass
+
+    def test_bgsave_and_status(self):
+        """
+        This TEST tests a background save reported by status
+        """
+        with patch("sys.stdout", new=StringIO()) as output:
+            self.assertFalse(HBNBCommand().onecmd("create User"))
+            user_id = output.getvalue().strip()
+        with patch("sys.stdout", new=StringIO()) as output:
+            self.assertFalse(HBNBCommand().onecmd("bgsave"))
+            self.assertEqual("Background saving started",
+                             output.getvalue().strip())
+        storage.flush()
+        with patch("sys.stdout", new=StringIO()) as output:
+            self.assertFalse(HBNBCommand().onecmd("status"))
+            lines = output.getvalue().strip().splitlines()
+        self.assertEqual("bgsave: idle", lines[0])
+        self.assertRegex(lines[1], r"^last snapshot: .* \(\d+\.\d{3} s, "
+                         r"\d+ bytes\)$")
+        with open("file.json", "r") as f:
+            self.assertIn("User." + user_id, f.read())
+
+    def test_bgsave_in_foreground(self):
+        """
+        This TEST tests that a save done without forking is not reported
+        as a background save
+        """
+        with patch.object(storage, "bgsave", return_value=None):
+            with patch("sys.stdout", new=StringIO()) as output:
+                self.assertFalse(HBNBCommand().onecmd("bgsave"))
+                self.assertEqual("Saved in the foreground "
+                                 "(os.fork not available)",
+                                 output.getvalue().strip())
+
+
 if __name__ == "__main__":
     unittest.main()
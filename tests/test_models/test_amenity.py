@@ -36,10 +36,11 @@ class TestAmenity_instantiation(unittest.TestCase):
         """
         Remove file.json and restore tmp.json if it exists
         """
-        try:
-            os.remove("file.json")
-        except FileNotFoundError:
-            pass
+        for path in ("file.json", "file.json.lock"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
         try:
             os.rename("tmp.json", "file.json")
         except FileNotFoundError:
@@ -155,10 +156,11 @@ class TestAmenity_save(unittest.TestCase):
             pass
 
     def tearDown(self):
-        try:
-            os.remove("file.json")
-        except FileNotFoundError:
-            pass
+        for path in ("file.json", "file.json.lock"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
         try:
             os.rename("tmp.json", "file.json")
         except FileNotFoundError:
@@ -215,10 +217,11 @@ class TestAmenity_to_dict(unittest.TestCase):
             pass
 
     def tearDown(self):
-        try:
-            os.remove("file.json")
-        except FileNotFoundError:
-            pass
+        for path in ("file.json", "file.json.lock"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
         try:
             os.rename("tmp.json", "file.json")
         except FileNotFoundError:
@@ -33,10 +33,11 @@ class TestBasemodel(unittest.TestCase):
         """
         Remove file.json and restore tmp.json if it exists.
         """
-        try:
-            os.remove("file.json")
-        except FileNotFoundError:
-            pass
+        for path in ("file.json", "file.json.lock"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
         try:
             os.rename("tmp.json", "file.json")
         except FileNotFoundError:
@@ -67,6 +68,31 @@ class TestBasemodel(unittest.TestCase):
 
         self.assertNotEqual(initial_updated_at, current_updated_at)
 
+    def test_save_increments_version(self):
+        """
+        Test that the version starts at 0, outside the dictionary
+        representation, and grows with each save of a change.
+        """
+        my_model = BaseModel()
+        self.assertEqual(0, my_model.version)
+        self.assertNotIn("version", my_model.to_dict())
+        my_model.save()
+        self.assertEqual(1, my_model.version)
+        self.assertEqual(1, my_model.to_dict()["version"])
+        my_model.save()
+        self.assertEqual(2, my_model.version)
+
+    def test_init_from_dict_whole_second(self):
+        """
+        Test that a dictionary whose timestamps fall on a whole second,
+        which isoformat writes without microseconds, is loaded back.
+        """
+        my_model = BaseModel()
+        my_model.created_at = my_model.created_at.replace(microsecond=0)
+        copy = BaseModel(**my_model.to_dict())
+        self.assertEqual(my_model.created_at, copy.created_at)
+        self.assertEqual(my_model.updated_at, copy.updated_at)
+
     def test_to_dict(self):
         """
         Test that the 'to_dict' method correctly converts a BaseModel instance
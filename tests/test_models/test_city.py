@@ -13,6 +13,7 @@ import unittest
 from datetime import datetime
 from time import sleep
 from models.city import City
+from models.place import Place
 
 
 class TestCity_instantiation(unittest.TestCase):
@@ -131,10 +132,11 @@ class TestCity_save(unittest.TestCase):
         """
         Remove file.json and restore tmp.json if it exists.
         """
-        try:
-            os.remove("file.json")
-        except FileNotFoundError:
-            pass
+        for path in ("file.json", "file.json.lock"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
         try:
             os.rename("tmp.json", "file.json")
         except FileNotFoundError:
@@ -224,6 +226,51 @@ class TestCity_to_dict(unittest.TestCase):
             my_city.to_dict(None)
 
 
+class TestCity_places(unittest.TestCase):
+    """
+    Test class for the City.places relationship
+    """
+    def setUp(self):
+        try:
+            os.rename("file.json", "tmp.json")
+        except FileNotFoundError:
+            pass
+
+    def tearDown(self):
+        for path in ("file.json", "file.json.lock"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        try:
+            os.rename("tmp.json", "file.json")
+        except FileNotFoundError:
+            pass
+    """
+    Tests for the places accessor
+    """
+    def test_places_follow_city_id(self):
+        city = City()
+        other = City()
+        first = Place()
+        first.city_id = city.id
+        second = Place()
+        second.city_id = city.id
+        Place().city_id = other.id
+        self.assertEqual([first, second], city.places)
+        second.city_id = other.id
+        self.assertEqual([first], city.places)
+        models.storage.delete(first)
+        self.assertEqual([], city.places)
+
+    def test_places_is_read_only(self):
+        city = City()
+        self.assertEqual([], city.places)
+        self.assertNotIn("places", city.to_dict())
+        with self.assertRaises(AttributeError):
+            city.places = []
+
+
 """
 Run the tests if the script is executed directly
 """
@@ -0,0 +1,262 @@
+#!/usr/bin/python3
+"""
+This script defines unit tests for the SQLite storage engine.
+"""
+import os
+import models
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+from models.engine.db_storage import DBStorage
+from models.base_model import BaseModel, ConflictError
+from models.user import User
+from models.state import State
+from models.place import Place
+from models.city import City
+from models.review import Review
+
+
+class TestDBStorage(unittest.TestCase):
+    """
+    This class defines unit tests for the DBStorage class. The storage
+    replaces `models.storage` so that models register with it.
+    """
+
+    def setUp(self):
+        """
+        Opens a storage on a temporary database.
+        """
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "hbnb.db")
+        self.storage = DBStorage(path=self.path)
+        self.storage.reload()
+        self.patcher = patch.object(models, "storage", self.storage)
+        self.patcher.start()
+
+    def tearDown(self):
+        """
+        Restores `models.storage` and removes the database.
+        """
+        self.patcher.stop()
+        self.storage.close()
+        self.tmp.cleanup()
+
+    def reopen(self):
+        """
+        Saves, then returns a new storage on the same database.
+        """
+        self.storage.save()
+        storage = DBStorage(path=self.path)
+        storage.reload()
+        return storage
+
+    def test_instantiation_with_arg(self):
+        """
+        Tests that positional arguments are refused.
+        """
+        with self.assertRaises(TypeError):
+            DBStorage(None)
+
+    def test_new_save_and_reload(self):
+        """
+        Tests that saved objects are found by another connection.
+        """
+        my_user = User()
+        my_user.first_name = "Betty"
+        my_state = State()
+        storage = self.reopen()
+        users = storage.all_by_class(User)
+        self.assertEqual(["User." + my_user.id], list(users))
+        self.assertEqual("Betty", users["User." + my_user.id].first_name)
+        self.assertIn("State." + my_state.id, storage.all())
+        self.assertIs(storage.get(User, my_user.id),
+                      users["User." + my_user.id])
+        self.assertEqual(2, storage.count())
+        storage.close()
+
+    def test_update_writes_one_row(self):
+        """
+        Tests that saving writes only the rows of changed objects.
+        """
+        my_user = User()
+        other = User()
+        self.storage.save()
+        my_user.first_name = "Betty"
+        with patch.object(User, "to_dict", autospec=True,
+                          side_effect=BaseModel.to_dict) as to_dict:
+            self.storage.save()
+        self.assertEqual([my_user], [c.args[0] for c in
+                                     to_dict.call_args_list])
+        storage = self.reopen()
+        self.assertEqual("Betty", storage.get("User", my_user.id).first_name)
+        self.assertIsNotNone(storage.get("User", other.id))
+        storage.close()
+
+    def test_delete(self):
+        """
+        Tests that deleted objects are removed from the database.
+        """
+        my_user = User()
+        self.storage.save()
+        self.storage.delete(my_user)
+        self.assertIsNone(self.storage.get(User, my_user.id))
+        self.assertEqual(0, self.storage.count(User))
+        storage = self.reopen()
+        self.assertEqual({}, storage.all_by_class("User"))
+        storage.close()
+
+    def test_count_and_lookup(self):
+        """
+        Tests counts and foreign key lookups, including unsaved objects.
+        """
+        my_state = State()
+        my_city = City()
+        my_city.state_id = my_state.id
+        City().state_id = "other"
+        self.assertEqual(2, self.storage.count(City))
+        self.assertEqual(0, self.storage.count("MyModel"))
+        self.assertEqual([my_city], my_state.cities)
+        self.assertEqual({"City." + my_city.id: my_city},
+                         self.storage.lookup(City, "state_id", my_state.id))
+
+    def test_query(self):
+        """
+        Tests filters, ordering and limits evaluated by SQLite, including
+        objects holding class defaults.
+        """
+        places = []
+        for price, guests in ((80, 2), (20, 6), (50, 4)):
+            my_place = Place()
+            my_place.price_by_night = price
+            my_place.max_guest = guests
+            places.append(my_place)
+        default = Place()
+        result = self.storage.query(Place, max_guest__ge=4,
+                                    order_by="price_by_night")
+        self.assertEqual([places[1], places[2]], list(result))
+        result = self.storage.query(Place, order_by="-price_by_night",
+                                    limit=1)
+        self.assertEqual([places[0]], list(result))
+        self.assertEqual([default], list(self.storage.query(
+            Place, max_guest__lt=1)))
+        self.assertEqual([], list(self.storage.query(
+            Place, amenity_ids__contains="777")))
+        plan = self.storage.explain(Place, max_guest__ge=4)
+        self.assertTrue(any("Place_max_guest" in row
+                            for row in plan["plan"]))
+        with self.assertRaises(ValueError):
+            list(self.storage.query(Place, **{"a') OR 1=1 --": 1}))
+
+    def test_nearby_and_search(self):
+        """
+        Tests spatial and text searches over the database.
+        """
+        paris = Place()
+        paris.latitude, paris.longitude = 48.8566, 2.3522
+        paris.description = "Sunny loft"
+        london = Place()
+        london.latitude, london.longitude = 51.5074, -0.1278
+        self.assertEqual([paris], [obj for _, obj in
+                                   self.storage.nearby(Place, 48.85, 2.35,
+                                                       20)])
+        self.assertEqual({"Place." + london.id},
+                         set(self.storage.within(Place, 50, -1, 52, 1)))
+        self.assertEqual([paris], [obj for _, obj in
+                                   self.storage.search(Place, "sunny")])
+        my_review = Review()
+        my_review.text = "Great host"
+        self.assertEqual([], self.storage.search(Review, "great pool"))
+
+    def test_tables(self):
+        """
+        Tests that every model class gets its own table.
+        """
+        self.storage.save()
+        with sqlite3.connect(self.path) as db:
+            tables = {row[0] for row in db.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self.assertTrue({"BaseModel", "User", "State", "City", "Amenity",
+                         "Place", "Review"} <= tables)
+
+    def test_update_compares_versions(self):
+        """
+        Tests that an update succeeds at the saved version, and fails
+        with the saved state loaded once another connection saved the
+        object.
+        """
+        my_user = User()
+        self.storage.save()
+        self.assertEqual(2, self.storage.update(my_user, 1,
+                                                first_name="Betty"))
+        other = self.reopen()
+        theirs = other.get(User, my_user.id)
+        self.assertEqual("Betty", theirs.first_name)
+        other.update(theirs, 2, first_name="Holly")
+        other.close()
+        with self.assertRaises(ConflictError) as caught:
+            self.storage.update(my_user, 2, first_name="Ann")
+        self.assertEqual(3, caught.exception.actual)
+        self.assertEqual("Holly", my_user.first_name)
+        self.assertEqual(4, self.storage.update(my_user, 3,
+                                                first_name="Ann"))
+
+    def test_update_deleted(self):
+        """
+        Tests that updating an object deleted by another connection
+        fails.
+        """
+        my_user = User()
+        other = self.reopen()
+        other.delete(other.get(User, my_user.id))
+        other.close()
+        with self.assertRaises(ConflictError) as caught:
+            self.storage.update(my_user, 1, first_name="Betty")
+        self.assertIsNone(caught.exception.actual)
+        self.assertIsNone(self.storage.get(User, my_user.id))
+
+    def test_reads_do_not_increment_versions(self):
+        """
+        Tests that the reads writing unsaved changes to the transaction
+        leave versions alone, so an update at the version read succeeds
+        and each commit increments the version once.
+        """
+        my_user = User()
+        self.storage.save()
+        my_user.first_name = "A"
+        self.assertEqual(1, self.storage.count(User))
+        self.assertEqual(1, my_user.version)
+        self.assertEqual(2, self.storage.update(my_user, 1, last_name="B"))
+        my_user.first_name = "C"
+        self.storage.count(User)
+        list(self.storage.query(User))
+        self.storage.save()
+        self.assertEqual(3, my_user.version)
+        other = self.reopen()
+        self.assertEqual(3, other.get(User, my_user.id).version)
+        other.close()
+
+    def test_conflict_keeps_unsaved_changes(self):
+        """
+        Tests that the changes written by reads and not committed yet are
+        still seen after a failed update, and committed by the next save.
+        """
+        my_user = User()
+        my_state = State()
+        self.storage.save()
+        self.storage.delete(my_state)
+        my_user.first_name = "Betty"
+        self.assertEqual(0, self.storage.count(State))
+        with self.assertRaises(ConflictError):
+            self.storage.update(my_user, 5, last_name="Holly")
+        self.assertEqual(0, self.storage.count(State))
+        self.assertEqual(["Betty"], [user.first_name for user in
+                                     self.storage.query(User)])
+        other = self.reopen()
+        self.assertEqual(0, other.count(State))
+        self.assertEqual("Betty", other.get(User, my_user.id).first_name)
+        other.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
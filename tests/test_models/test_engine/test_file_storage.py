@@ -1,11 +1,19 @@
 #!/usr/bin/python3
 
+import asyncio
 import os
 import json
+import subprocess
+import sys
+import threading
+import time
 import models
 import unittest
-from models.base_model import BaseModel
+from io import StringIO
+from unittest.mock import patch
+from models.base_model import BaseModel, ConflictError
 from models.engine.file_storage import FileStorage
+from models.engine.stream import CHECKSUMS, checksum
 from models.user import User
 from models.state import State
 from models.place import Place
@@ -97,10 +105,11 @@ class TestFileStorage_methods(unittest.TestCase):
         and renaming the original storage file back (if it existed).
         Also resets the storage object's internal dictionary.
         """
-        try:
-            os.remove("file.json")
-        except FileNotFoundError:
-            pass
+        for path in ("file.json", "file.json.lock", "file.json.text"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
         try:
             os.rename("tmp.json", "file.json")
         except FileNotFoundError:
@@ -183,6 +192,284 @@ class TestFileStorage_methods(unittest.TestCase):
         with self.assertRaises(AttributeError):
             models.storage.new(None)
 
+    def test_all_by_class(self):
+        """
+        Tests if `all_by_class` returns only the objects of one class.
+
+        Expected behavior:
+            - The class can be given as a class or as its name.
+            - Deleted objects are no longer returned.
+            - Objects added directly to `all()` are picked up.
+        """
+        my_user = User()
+        my_place = Place()
+        users = models.storage.all_by_class(User)
+        self.assertEqual({"User." + my_user.id: my_user}, users)
+        self.assertEqual(users, models.storage.all_by_class("User"))
+        models.storage.delete(my_user)
+        self.assertEqual({}, models.storage.all_by_class("User"))
+        self.assertIn("Place." + my_place.id,
+                      models.storage.all_by_class(Place))
+        my_state = State(id="777", created_at="2017-09-28T21:05:54.119427",
+                         updated_at="2017-09-28T21:05:54.119427")
+        models.storage.all()["State.777"] = my_state
+        self.assertEqual({"State.777": my_state},
+                         models.storage.all_by_class(State))
+        self.assertEqual({}, models.storage.all_by_class("MyModel"))
+
+    def test_count(self):
+        """
+        Tests if `count` follows creations, deletions and reloads.
+        """
+        self.assertEqual(0, models.storage.count(User))
+        my_user = User()
+        User()
+        Place()
+        self.assertEqual(2, models.storage.count(User))
+        self.assertEqual(1, models.storage.count("Place"))
+        self.assertEqual(3, models.storage.count())
+        models.storage.delete(my_user)
+        self.assertEqual(1, models.storage.count("User"))
+        models.storage.save()
+        FileStorage._FileStorage__objects = {}
+        self.assertEqual(0, models.storage.count(User))
+        models.storage.reload()
+        self.assertEqual(1, models.storage.count(User))
+        self.assertEqual(0, models.storage.count("MyModel"))
+
+    def test_lookup(self):
+        """
+        Tests if `lookup` follows the foreign keys of stored objects.
+
+        Expected behavior:
+            - Objects are found by the value of an indexed attribute.
+            - Assigning the attribute moves the object in the index.
+            - Deleted objects are no longer returned.
+        """
+        my_city = City()
+        my_city.state_id = "CA"
+        other_city = City()
+        other_city.state_id = "NV"
+        self.assertEqual({"City." + my_city.id: my_city},
+                         models.storage.lookup(City, "state_id", "CA"))
+        my_city.state_id = "NV"
+        self.assertEqual({}, models.storage.lookup(City, "state_id", "CA"))
+        self.assertEqual(2, len(models.storage.lookup("City", "state_id",
+                                                      "NV")))
+        models.storage.delete(other_city)
+        self.assertEqual({"City." + my_city.id: my_city},
+                         models.storage.lookup(City, "state_id", "NV"))
+
+    def test_lookup_after_reload(self):
+        """
+        Tests if `lookup` finds reloaded objects, including on attributes
+        without an index.
+        """
+        my_review = Review()
+        my_review.place_id = "777"
+        my_review.text = "Great"
+        models.storage.save()
+        FileStorage._FileStorage__objects = {}
+        models.storage.reload()
+        key = "Review." + my_review.id
+        self.assertIn(key, models.storage.lookup(Review, "place_id", "777"))
+        self.assertIn(key, models.storage.lookup(Review, "text", "Great"))
+
+    def test_query(self):
+        """
+        Tests if `query` returns the objects satisfying every filter.
+        """
+        places = []
+        for city_id, max_guest in (("1", 2), ("1", 6), ("2", 8)):
+            my_place = Place()
+            my_place.city_id = city_id
+            my_place.max_guest = max_guest
+            places.append(my_place)
+        result = models.storage.query(Place, city_id="1", max_guest__ge=4)
+        self.assertNotIsInstance(result, (list, dict))
+        self.assertEqual([places[1]], list(result))
+        self.assertEqual(places[1:],
+                         sorted(models.storage.query("Place",
+                                                     max_guest__gt=4),
+                                key=places.index))
+        self.assertEqual(places,
+                         sorted(models.storage.query(Place,
+                                                     city_id__in=["1", "2"]),
+                                key=places.index))
+        with self.assertRaises(ValueError):
+            models.storage.query(Place, max_guest__near=4)
+
+    def test_explain(self):
+        """
+        Tests if `explain` reports the index or scan `query` would use.
+        """
+        for city_id, max_guest in (("1", 4), ("2", 6), ("2", 8)):
+            my_place = Place()
+            my_place.city_id = city_id
+            my_place.max_guest = max_guest
+        plan = models.storage.explain(Place, city_id="1", max_guest__ge=4)
+        self.assertEqual("index", plan["access"])
+        self.assertEqual("city_id", plan["index"])
+        self.assertEqual("eq", plan["operator"])
+        self.assertEqual(1, plan["estimate"])
+        self.assertIsNone(plan["order"])
+        plan = models.storage.explain(Place, max_guest__gt=5)
+        self.assertEqual("max_guest", plan["index"])
+        self.assertEqual(2, plan["estimate"])
+        plan = models.storage.explain(Place, name="Loft")
+        self.assertEqual("scan", plan["access"])
+        self.assertEqual(3, plan["estimate"])
+        plan = models.storage.explain(Place, order_by="-price_by_night")
+        self.assertEqual("index", plan["order"])
+        plan = models.storage.explain(Place, order_by="name")
+        self.assertEqual("sort", plan["order"])
+
+    def test_query_order_by(self):
+        """
+        Tests if `query` orders, limits and ranges over numeric attributes,
+        including after updates and deletions.
+        """
+        places = []
+        for price in (80, 20, 50, 120):
+            my_place = Place()
+            my_place.price_by_night = price
+            my_place.name = str(price)
+            places.append(my_place)
+        prices = [p.price_by_night for p in
+                  models.storage.query(Place, order_by="price_by_night")]
+        self.assertEqual([20, 50, 80, 120], prices)
+        top = models.storage.query(Place, order_by="-price_by_night",
+                                   limit=2)
+        self.assertEqual([places[3], places[0]], list(top))
+        in_range = models.storage.query(Place, price_by_night__ge=50,
+                                        price_by_night__lt=120,
+                                        order_by="price_by_night")
+        self.assertEqual([places[2], places[0]], list(in_range))
+        places[1].price_by_night = 200
+        models.storage.delete(places[3])
+        prices = [p.price_by_night for p in
+                  models.storage.query(Place, order_by="-price_by_night")]
+        self.assertEqual([200, 80, 50], prices)
+        names = [p.name for p in
+                 models.storage.query(Place, order_by="name", limit=2)]
+        self.assertEqual(["20", "50"], names)
+
+    def test_query_amenities(self):
+        """
+        Tests if `query` intersects the places holding several amenities,
+        following additions and removals of amenities.
+        """
+        wifi, pool, tv = Amenity(), Amenity(), Amenity()
+        first, second = Place(), Place()
+        for amenity in (wifi, pool, tv):
+            first.add_amenity(amenity)
+        second.add_amenity(wifi)
+        second.add_amenity(pool.id)
+        result = models.storage.query(Place, amenity_ids__contains_all=[
+            wifi.id, pool.id])
+        self.assertEqual({first, second}, set(result))
+        plan = models.storage.explain(Place, amenity_ids__contains=tv.id)
+        self.assertEqual("amenity_ids", plan["index"])
+        self.assertEqual(1, plan["estimate"])
+        first.remove_amenity(pool)
+        result = models.storage.query(Place, amenity_ids__contains_all=[
+            wifi.id, pool.id])
+        self.assertEqual([second], list(result))
+
+    def test_nearby_and_within(self):
+        """
+        Tests if spatial searches follow Places as they move, and work
+        for classes without a spatial index.
+        """
+        paris = Place()
+        paris.latitude, paris.longitude = 48.8566, 2.3522
+        versailles = Place()
+        versailles.latitude, versailles.longitude = 48.8049, 2.1204
+        london = Place()
+        london.latitude, london.longitude = 51.5074, -0.1278
+        result = models.storage.nearby(Place, 48.85, 2.35, 20)
+        self.assertEqual([paris, versailles], [obj for _, obj in result])
+        self.assertAlmostEqual(0.75, result[0][0], places=2)
+        versailles.latitude = 40.0
+        self.assertEqual([paris], [obj for _, obj in
+                                   models.storage.nearby("Place", 48.85,
+                                                         2.35, 20)])
+        box = models.storage.within(Place, 48, -1, 52, 3)
+        self.assertEqual({"Place." + paris.id, "Place." + london.id},
+                         set(box))
+        models.storage.delete(london)
+        self.assertEqual(["Place." + paris.id],
+                         list(models.storage.within(Place, 48, -1, 52, 3)))
+        my_user = User()
+        my_user.latitude, my_user.longitude = 48.85, 2.35
+        self.assertEqual([my_user], [obj for _, obj in
+                                     models.storage.nearby(User, 48.85,
+                                                           2.35, 1)])
+
+    def test_search(self):
+        """
+        Tests if `search` ranks objects by their indexed text attributes.
+
+        Expected behavior:
+            - "and" searches need every word in one of the attributes.
+            - "or" searches accept any word.
+            - Searches follow attribute changes and deletions.
+        """
+        loft = Place()
+        loft.name = "Sunny loft"
+        loft.description = "Close to the beach, sunny terrace"
+        cabin = Place()
+        cabin.name = "Cabin"
+        cabin.description = "Quiet and sunny"
+        result = models.storage.search(Place, "sunny beach")
+        self.assertEqual([loft], [obj for _, obj in result])
+        result = models.storage.search("Place", "quiet beach", mode="or")
+        self.assertEqual({loft, cabin}, {obj for _, obj in result})
+        result = models.storage.search(Place, "sunny")
+        self.assertEqual([loft, cabin], [obj for _, obj in result])
+        result = models.storage.search(Place, "sunny", attribute="name")
+        self.assertEqual([loft], [obj for _, obj in result])
+        self.assertEqual(1, len(models.storage.search(Place, "sunny",
+                                                      limit=1)))
+        cabin.description = "Quiet"
+        models.storage.delete(loft)
+        self.assertEqual([], models.storage.search(Place, "sunny"))
+        my_review = Review()
+        my_review.text = "Great host"
+        self.assertEqual([my_review], [obj for _, obj in
+                                       models.storage.search(Review,
+                                                             "HOST")])
+
+    def test_text_index_persisted(self):
+        """
+        Tests if reload adopts the full-text postings persisted by
+        `close` while they match the snapshot, and rebuilds them
+        otherwise.
+        """
+        my_review = Review()
+        my_review.text = "Great host"
+        models.storage.save()
+        self.assertFalse(os.path.isfile("file.json.text"))
+        models.storage.close()
+        self.assertTrue(os.path.isfile("file.json.text"))
+        self.assertFalse(os.path.isfile("file.json.text.tmp"))
+        with open("file.json.text", "r") as f:
+            saved = json.load(f)
+        key = "Review." + my_review.id
+        saved["indexes"]["Review"]["text"]["marker"] = {key: 1}
+        with open("file.json.text", "w") as f:
+            json.dump(saved, f)
+        FileStorage._FileStorage__objects = {}
+        models.storage.reload()
+        self.assertEqual(1, len(models.storage.search(Review, "marker")))
+        self.assertEqual(1, len(models.storage.search(Review, "host")))
+        with open("file.json", "a") as f:
+            f.write(" ")
+        FileStorage._FileStorage__objects = {}
+        models.storage.reload()
+        self.assertEqual([], models.storage.search(Review, "marker"))
+        self.assertEqual(1, len(models.storage.search(Review, "host")))
+
     def test_save(self):
         """
         Tests if the `save` method correctly saves objects to the storage file.
@@ -268,6 +555,1519 @@ class TestFileStorage_methods(unittest.TestCase):
         with self.assertRaises(TypeError):
             models.storage.reload(None)
 
+    def test_save_reuses_clean_records(self):
+        """
+        Tests that `save` reuses the cached record of clean objects and
+        serializes again the objects whose attributes were assigned.
+
+        Expected behavior:
+            - Changes made behind the dirty tracking are not persisted.
+            - Assigning an attribute marks the object dirty.
+        """
+        my_user = User()
+        models.storage.save()
+        my_user.__dict__["first_name"] = "Hidden"
+        models.storage.save()
+        with open("file.json", "r") as f:
+            self.assertNotIn("Hidden", f.read())
+        my_user.last_name = "Shown"
+        models.storage.save()
+        with open("file.json", "r") as f:
+            save_text = f.read()
+            self.assertIn("Hidden", save_text)
+            self.assertIn("Shown", save_text)
+        self.assertEqual(json.loads(save_text)["User." + my_user.id],
+                         my_user.to_dict())
+
+    def test_save_is_atomic(self):
+        """
+        Tests that a save failing halfway leaves the previous snapshot
+        intact and no temporary file behind.
+        """
+        my_user = User()
+        models.storage.save()
+        with open("file.json", "r") as f:
+            before = f.read()
+        my_user.first_name = "Betty"
+        with patch.object(User, "to_dict", side_effect=OSError("disk")):
+            with self.assertRaises(OSError):
+                models.storage.save()
+        with open("file.json", "r") as f:
+            self.assertEqual(before, f.read())
+        self.assertFalse(os.path.isfile("file.json.tmp"))
+
+    def test_save_with_fsync(self):
+        """
+        Tests that a durable save writes the same snapshot.
+        """
+        storage = FileStorage(fsync=True, fsync_directory=True)
+        my_user = User()
+        storage.save()
+        with open("file.json", "r") as f:
+            self.assertIn("User." + my_user.id, json.load(f))
+        self.assertFalse(os.path.isfile("file.json.tmp"))
+
+
+class TestFileStorage_journal(unittest.TestCase):
+    """
+    This class defines unit tests for the journal mode of FileStorage.
+    """
+
+    def setUp(self):
+        """
+        Moves the storage file aside and starts from an empty storage.
+        """
+        try:
+            os.rename("file.json", "tmp.json")
+        except FileNotFoundError:
+            pass
+        FileStorage._FileStorage__objects = {}
+        FileStorage._FileStorage__pending.clear()
+        self.storage = FileStorage(journal=True)
+
+    def tearDown(self):
+        """
+        Removes the snapshot and journal files and restores the original
+        storage file (if it existed).
+        """
+        for path in ("file.json", "file.json.journal", "file.json.text",
+                     "file.json.lock"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        try:
+            os.rename("tmp.json", "file.json")
+        except FileNotFoundError:
+            pass
+        FileStorage._FileStorage__objects = {}
+
+    def test_save_appends_only_changes(self):
+        """
+        Tests that a journal save appends the changed records only.
+        """
+        my_user = User()
+        my_state = State()
+        self.storage.save()
+        my_user.first_name = "Betty"
+        models.storage.touch(my_user)
+        self.storage.save()
+        self.assertFalse(os.path.isfile("file.json"))
+        with open("file.json.journal", "r") as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(3, len(lines))
+        self.assertEqual("User." + my_user.id, lines[2]["key"])
+        self.assertEqual("Betty", lines[2]["value"]["first_name"])
+        self.assertIn("State." + my_state.id, [e["key"] for e in lines])
+
+    def test_reload_replays_journal(self):
+        """
+        Tests that reload applies upserts and tombstones of the journal
+        on top of the snapshot.
+        """
+        my_user = User()
+        my_place = Place()
+        self.storage.compact()
+        my_user.first_name = "Betty"
+        models.storage.touch(my_user)
+        self.storage.delete(my_place)
+        self.storage.save()
+        FileStorage._FileStorage__objects = {}
+        self.storage.reload()
+        objs = self.storage.all()
+        self.assertEqual("Betty", objs["User." + my_user.id].first_name)
+        self.assertNotIn("Place." + my_place.id, objs)
+
+    def test_reload_ignores_torn_line(self):
+        """
+        Tests that a partially written last journal line is skipped.
+        """
+        my_user = User()
+        self.storage.save()
+        with open("file.json.journal", "a") as f:
+            f.write('{"op": "put", "key": "User.')
+        FileStorage._FileStorage__objects = {}
+        self.storage.reload()
+        self.assertIn("User." + my_user.id, self.storage.all())
+
+    def test_compact_folds_journal(self):
+        """
+        Tests that compaction writes a snapshot and removes the journal.
+        """
+        my_user = User()
+        self.storage.save()
+        self.storage.compact()
+        self.assertFalse(os.path.isfile("file.json.journal"))
+        with open("file.json", "r") as f:
+            self.assertIn("User." + my_user.id, f.read())
+
+    def test_auto_compaction(self):
+        """
+        Tests that the journal is compacted once it outgrows the store.
+        """
+        storage = FileStorage(journal=True, journal_min_entries=2)
+        my_user = User()
+        storage.save()
+        for name in ("a", "b"):
+            my_user.first_name = name
+            storage.touch(my_user)
+            storage.save()
+        self.assertFalse(os.path.isfile("file.json.journal"))
+        with open("file.json", "r") as f:
+            self.assertIn('"first_name": "b"', f.read())
+        self.assertFalse(os.path.isfile("file.json.text"))
+
+    def test_text_index_persisted_on_compact(self):
+        """
+        Tests that explicit compaction persists the full-text postings,
+        and that closing does not while the journal holds changes.
+        """
+        my_review = Review()
+        my_review.text = "Great host"
+        self.storage.compact()
+        self.assertTrue(os.path.isfile("file.json.text"))
+        os.remove("file.json.text")
+        my_review.text = "Quiet street"
+        self.storage.save()
+        self.storage.close()
+        self.assertFalse(os.path.isfile("file.json.text"))
+
+
+class TestFileStorage_lazy(unittest.TestCase):
+    """
+    This class defines unit tests for the lazy mode of FileStorage.
+    """
+
+    def setUp(self):
+        """
+        Saves a few objects, then reloads them lazily into an empty
+        storage.
+        """
+        try:
+            os.rename("file.json", "tmp.json")
+        except FileNotFoundError:
+            pass
+        FileStorage._FileStorage__objects = {}
+        FileStorage._FileStorage__pending.clear()
+        self.user = User()
+        self.user.first_name = "Betty"
+        self.place = Place()
+        self.place.name = "Loft"
+        models.storage.save()
+        FileStorage._FileStorage__objects = {}
+        self.storage = FileStorage(lazy=True)
+        self.storage.reload()
+
+    def tearDown(self):
+        """
+        Removes the storage files and restores the original storage file
+        (if it existed).
+        """
+        for path in ("file.json", "file.json.lock", "file.json.text"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        try:
+            os.rename("tmp.json", "file.json")
+        except FileNotFoundError:
+            pass
+        FileStorage._FileStorage__objects = {}
+        FileStorage._FileStorage__raw = {}
+
+    def test_reload_defers_objects(self):
+        """
+        Tests that a lazy reload builds no object but counts the records.
+        """
+        self.assertEqual({}, FileStorage._FileStorage__objects)
+        self.assertEqual(2, self.storage.count())
+        self.assertEqual(1, self.storage.count("Place"))
+
+    def test_get_builds_one_object(self):
+        """
+        Tests that get builds only the requested object.
+        """
+        obj = self.storage.get("User", self.user.id)
+        self.assertIsInstance(obj, User)
+        self.assertEqual("Betty", obj.first_name)
+        self.assertEqual(["User." + self.user.id],
+                         list(FileStorage._FileStorage__objects))
+
+    def test_class_access_builds_class(self):
+        """
+        Tests that querying a class builds the objects of that class only.
+        """
+        self.assertEqual(1, len(self.storage.all_by_class(Place)))
+        self.assertEqual(["Loft"], [p.name for p in
+                                    self.storage.query(Place, name="Loft")])
+        self.assertNotIn("User." + self.user.id,
+                         FileStorage._FileStorage__objects)
+
+    def test_all_builds_everything(self):
+        """
+        Tests that all returns every object.
+        """
+        objs = self.storage.all()
+        self.assertIsInstance(objs["User." + self.user.id], User)
+        self.assertIsInstance(objs["Place." + self.place.id], Place)
+
+    def test_save_keeps_unbuilt_records(self):
+        """
+        Tests that saving writes the records that were never accessed.
+        """
+        obj = self.storage.get("Place", self.place.id)
+        obj.name = "Attic"
+        self.storage.save()
+        with open("file.json", "r") as f:
+            saved = json.load(f)
+        self.assertEqual("Betty", saved["User." + self.user.id]["first_name"])
+        self.assertEqual("Attic", saved["Place." + self.place.id]["name"])
+
+    def test_delete_unbuilt_record(self):
+        """
+        Tests that deleting an object drops its record from the store.
+        """
+        self.storage.delete(self.user)
+        self.storage.save()
+        self.assertEqual(1, self.storage.count())
+        with open("file.json", "r") as f:
+            self.assertNotIn("User." + self.user.id, json.load(f))
+
+
+class TestFileStorage_recovery(unittest.TestCase):
+    """
+    This class defines unit tests for the salvage of damaged snapshots.
+    """
+
+    def setUp(self):
+        """
+        Saves a user, a place and a state, then empties the storage.
+        """
+        try:
+            os.rename("file.json", "tmp.json")
+        except FileNotFoundError:
+            pass
+        FileStorage._FileStorage__objects = {}
+        self.user = User()
+        self.user.first_name = "Betty"
+        self.place = Place()
+        self.place.name = "Loft"
+        self.state = State()
+        self.state.name = "Ohio"
+        models.storage.save()
+        FileStorage._FileStorage__objects = {}
+        with open("file.json", "r") as f:
+            self.text = f.read()
+
+    def tearDown(self):
+        """
+        Removes the storage files and restores the original storage file
+        (if it existed).
+        """
+        for path in ("file.json", "file.json.lock", "file.json.text"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        try:
+            os.rename("tmp.json", "file.json")
+        except FileNotFoundError:
+            pass
+        FileStorage._FileStorage__objects = {}
+
+    def reload(self, text):
+        """
+        Writes `text` as the snapshot and reloads it.
+
+        Returns:
+            The warning printed by reload.
+        """
+        with open("file.json", "w") as f:
+            f.write(text)
+        with patch("sys.stderr", new=StringIO()) as output:
+            models.storage.reload()
+        return output.getvalue()
+
+    def test_clean_reload_is_verified(self):
+        """
+        Tests that an intact snapshot is verified and fully loaded.
+        """
+        self.assertEqual("", self.reload(self.text))
+        report = models.storage.recovery_report()
+        self.assertTrue(report["verified"])
+        self.assertEqual({"User": 1, "Place": 1, "State": 1},
+                         report["loaded"])
+        self.assertEqual({}, report["skipped"])
+        self.assertGreaterEqual(report["seconds"], 0)
+
+    def test_malformed_record_is_skipped(self):
+        """
+        Tests that a record that no longer parses is skipped and that the
+        records after it are still loaded.
+        """
+        warning = self.reload(self.text.replace('"Loft"', '"Lo"ft"'))
+        objs = models.storage.all()
+        self.assertNotIn("Place." + self.place.id, objs)
+        self.assertEqual("Betty", objs["User." + self.user.id].first_name)
+        self.assertEqual("Ohio", objs["State." + self.state.id].name)
+        self.assertEqual({"Place": 1},
+                         models.storage.recovery_report()["skipped"])
+        self.assertIn("1 Place", warning)
+
+    def test_checksum_mismatch_is_skipped(self):
+        """
+        Tests that a record altered into other valid JSON is detected.
+        """
+        self.reload(self.text.replace('"Betty"', '"Bette"'))
+        self.assertNotIn("User." + self.user.id, models.storage.all())
+        self.assertEqual(2, models.storage.count())
+        self.assertEqual({"User": 1},
+                         models.storage.recovery_report()["skipped"])
+
+    def test_truncated_snapshot(self):
+        """
+        Tests that the records before a truncation are loaded.
+        """
+        end = self.text.index('"Loft"')
+        self.reload(self.text[:end])
+        report = models.storage.recovery_report()
+        self.assertFalse(report["verified"])
+        self.assertIn("User." + self.user.id, models.storage.all())
+        self.assertEqual({"Place": 1}, report["skipped"])
+
+    def test_unknown_class_is_skipped(self):
+        """
+        Tests that a record of an unknown class does not stop the load.
+        """
+        self.reload(self.text.replace('"User.', '"Ghost.', 1))
+        self.assertEqual(2, models.storage.count())
+        self.assertEqual({"Ghost": 1},
+                         models.storage.recovery_report()["skipped"])
+
+    def test_other_name_is_skipped(self):
+        """
+        Tests that a record keyed by a name that is not a model class,
+        such as a builtin, is skipped rather than evaluated.
+        """
+        self.reload(self.text.replace('"User.', '"dict.'))
+        self.assertEqual(2, models.storage.count())
+        self.assertEqual({"dict": 1},
+                         models.storage.recovery_report()["skipped"])
+
+    def test_read_only_property_is_ignored(self):
+        """
+        Tests that a record naming a read-only relationship property is
+        loaded without it, and kept by the next compaction.
+        """
+        data = json.loads(self.text)
+        key = "State." + self.state.id
+        data[key]["cities"] = ["City.1234"]
+        data[CHECKSUMS][key] = checksum(json.dumps(data[key]))
+        self.assertEqual("", self.reload(json.dumps(data)))
+        self.assertEqual({}, models.storage.recovery_report()["skipped"])
+        self.assertEqual([], models.storage.all()[key].cities)
+        models.storage.compact()
+        FileStorage._FileStorage__objects = {}
+        models.storage.reload()
+        self.assertEqual("Ohio", models.storage.all()[key].name)
+
+    def test_large_record_is_loaded(self):
+        """
+        Tests that a valid record larger than the reader's chunks is
+        loaded, and kept by the next compaction.
+        """
+        self.reload(self.text)
+        place = models.storage.all()["Place." + self.place.id]
+        place.description = "x" * (2 << 20)
+        models.storage.save()
+        FileStorage._FileStorage__objects = {}
+        with open("file.json", "r") as f:
+            self.assertEqual("", self.reload(f.read()))
+        self.assertEqual({}, models.storage.recovery_report()["skipped"])
+        models.storage.compact()
+        FileStorage._FileStorage__objects = {}
+        models.storage.reload()
+        place = models.storage.all()["Place." + self.place.id]
+        self.assertEqual(2 << 20, len(place.description))
+
+
+class TestFileStorage_parallel(unittest.TestCase):
+    """
+    This class defines unit tests for the parallel reload of FileStorage.
+    """
+
+    def setUp(self):
+        """
+        Moves the storage file aside and saves objects of several classes.
+        """
+        try:
+            os.rename("file.json", "tmp.json")
+        except FileNotFoundError:
+            pass
+        FileStorage._FileStorage__objects = {}
+        FileStorage._FileStorage__pending.clear()
+        for i in range(100):
+            user = User()
+            user.first_name = "User {}".format(i)
+            place = Place()
+            place.user_id = user.id
+            place.description = 'see "User.{}": {{}}, nearby'.format(i)
+            State()
+        models.storage.save()
+        self.expected = {key: obj.to_dict() for key, obj in
+                         models.storage.all().items()}
+
+    def tearDown(self):
+        """
+        Removes the storage files and restores the original storage file
+        (if it existed).
+        """
+        for path in ("file.json", "file.json.lock", "file.json.text"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        try:
+            os.rename("tmp.json", "file.json")
+        except FileNotFoundError:
+            pass
+        FileStorage._FileStorage__objects = {}
+
+    def test_parallel_reload(self):
+        """
+        Tests that worker processes load the same objects as a reload in
+        this process, which is not used.
+        """
+        storage = FileStorage(reload_workers=2, reload_min_bytes=0)
+        FileStorage._FileStorage__objects = {}
+        with patch("models.engine.file_storage.scan_records",
+                   side_effect=AssertionError("serial reload")):
+            storage.reload()
+        self.assertEqual(self.expected, {key: obj.to_dict() for key, obj in
+                                         storage.all().items()})
+        report = storage.recovery_report()
+        self.assertTrue(report["verified"])
+        self.assertEqual({"User": 100, "Place": 100, "State": 100},
+                         report["loaded"])
+        self.assertEqual(100, len(list(storage.query(Place))))
+
+    def test_parallel_reload_caches_records(self):
+        """
+        Tests that the records cached by a parallel reload hold the
+        stored objects themselves, so the next save serializes nothing,
+        and that the class dictionaries hold every object.
+        """
+        storage = FileStorage(reload_workers=2, reload_min_bytes=0)
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+        records = FileStorage._FileStorage__records
+        for key, obj in storage.all().items():
+            self.assertIs(obj, records[key][0])
+        self.assertEqual(100, len(storage.all_by_class(User)))
+        with patch.object(FileStorage, "_FileStorage__serialize") as encode:
+            storage.save()
+        encode.assert_not_called()
+
+    def test_damaged_snapshot_falls_back(self):
+        """
+        Tests that a damaged snapshot is salvaged by the reload in this
+        process.
+        """
+        with open("file.json", "r") as f:
+            text = f.read()
+        with open("file.json", "w") as f:
+            f.write(text.replace('"User 7"', '"User 8"', 1))
+        storage = FileStorage(reload_workers=2, reload_min_bytes=0)
+        FileStorage._FileStorage__objects = {}
+        with patch("sys.stderr", new=StringIO()) as output:
+            storage.reload()
+        self.assertIn("1 User", output.getvalue())
+        self.assertEqual(299, storage.count())
+
+    def test_small_snapshot_loads_in_process(self):
+        """
+        Tests that a snapshot under reload_min_bytes is not handed to
+        worker processes.
+        """
+        storage = FileStorage(reload_workers=2)
+        FileStorage._FileStorage__objects = {}
+        with patch("models.engine.file_storage.split_records") as split:
+            storage.reload()
+        split.assert_not_called()
+        self.assertEqual(300, storage.count())
+
+
+class TestFileStorage_coalescing(unittest.TestCase):
+    """
+    This class defines unit tests for the coalescing of saves.
+    """
+
+    def setUp(self):
+        """
+        Moves the storage file aside and starts from an empty storage.
+        """
+        try:
+            os.rename("file.json", "tmp.json")
+        except FileNotFoundError:
+            pass
+        FileStorage._FileStorage__objects = {}
+        FileStorage._FileStorage__pending.clear()
+
+    def tearDown(self):
+        """
+        Removes the storage files and restores the original storage file
+        (if it existed).
+        """
+        for path in ("file.json", "file.json.lock", "file.json.text"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        try:
+            os.rename("tmp.json", "file.json")
+        except FileNotFoundError:
+            pass
+        FileStorage._FileStorage__objects = {}
+
+    def test_batch_writes_once(self):
+        """
+        Tests that the saves made inside nested batches are written once,
+        when the outermost batch ends.
+        """
+        storage = FileStorage()
+        with patch.object(storage, "_FileStorage__install",
+                          wraps=storage._FileStorage__install) as install:
+            with storage.batch():
+                for name in ("a", "b", "c"):
+                    my_user = User()
+                    my_user.first_name = name
+                    storage.save()
+                    with storage.batch():
+                        storage.save()
+                self.assertEqual(0, install.call_count)
+                self.assertFalse(os.path.isfile("file.json"))
+            self.assertEqual(1, install.call_count)
+        with open("file.json", "r") as f:
+            self.assertEqual(3, len(json.load(f)) - 1)
+
+    def test_save_window(self):
+        """
+        Tests that saves issued within the window are deferred until the
+        next flush.
+        """
+        storage = FileStorage(save_window=60)
+        my_user = User()
+        storage.save()
+        my_user.first_name = "Betty"
+        with patch("atexit.register") as register:
+            storage.save()
+            storage.save()
+        register.assert_called_once_with(storage.flush)
+        with open("file.json", "r") as f:
+            self.assertNotIn("Betty", f.read())
+        self.assertTrue(storage.flush())
+        self.assertFalse(storage.flush())
+        with open("file.json", "r") as f:
+            self.assertIn("Betty", f.read())
+
+    def test_no_window_writes_every_save(self):
+        """
+        Tests that saves are not deferred by default.
+        """
+        storage = FileStorage()
+        my_user = User()
+        storage.save()
+        my_user.first_name = "Betty"
+        storage.save()
+        with open("file.json", "r") as f:
+            self.assertIn("Betty", f.read())
+        self.assertFalse(storage.flush())
+
+
+class TestFileStorage_write_behind(unittest.TestCase):
+    """
+    This class defines unit tests for the write-behind mode of
+    FileStorage.
+    """
+
+    def setUp(self):
+        """
+        Moves the storage file aside and starts from an empty storage.
+        """
+        try:
+            os.rename("file.json", "tmp.json")
+        except FileNotFoundError:
+            pass
+        FileStorage._FileStorage__objects = {}
+        FileStorage._FileStorage__pending.clear()
+        self.storage = None
+
+    def tearDown(self):
+        """
+        Stops the flusher, removes the storage files and restores the
+        original storage file (if it existed).
+        """
+        if self.storage is not None:
+            self.storage.close()
+        for path in ("file.json", "file.json.lock", "file.json.text"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        try:
+            os.rename("tmp.json", "file.json")
+        except FileNotFoundError:
+            pass
+        FileStorage._FileStorage__objects = {}
+
+    def wait_for_file(self, timeout=5):
+        """
+        Returns whether file.json appears within `timeout` seconds.
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if os.path.isfile("file.json"):
+                return True
+            time.sleep(0.01)
+        return False
+
+    def flushers(self):
+        """
+        Returns the number of running flusher threads.
+        """
+        return sum(thread.name == "FileStorage flusher"
+                   for thread in threading.enumerate())
+
+    def test_save_is_written_after_interval(self):
+        """
+        Tests that a save returns at once and is written by the flusher
+        within the interval.
+        """
+        self.storage = FileStorage(write_behind=True, flush_interval=0.05)
+        my_user = User()
+        self.storage.save()
+        self.assertTrue(self.wait_for_file())
+        with open("file.json", "r") as f:
+            self.assertIn("User." + my_user.id, f.read())
+
+    def test_threshold_writes_early(self):
+        """
+        Tests that enough changed objects are written without waiting
+        for the interval.
+        """
+        self.storage = FileStorage(write_behind=True, flush_interval=60,
+                                   flush_threshold=2)
+        User()
+        User()
+        self.storage.save()
+        self.assertTrue(self.wait_for_file())
+
+    def test_close_writes_and_stops(self):
+        """
+        Tests that close writes the deferred save and stops the flusher.
+        """
+        self.storage = FileStorage(write_behind=True, flush_interval=60)
+        my_user = User()
+        self.storage.save()
+        self.assertFalse(os.path.isfile("file.json"))
+        self.assertEqual(1, self.flushers())
+        self.storage.close()
+        self.assertEqual(0, self.flushers())
+        with open("file.json", "r") as f:
+            self.assertIn("User." + my_user.id, f.read())
+
+    def test_flush(self):
+        """
+        Tests that flush writes the deferred save synchronously.
+        """
+        self.storage = FileStorage(write_behind=True, flush_interval=60)
+        User()
+        self.storage.save()
+        self.assertTrue(self.storage.flush())
+        self.assertTrue(os.path.isfile("file.json"))
+
+    def test_environment(self):
+        """
+        Tests that HBNB_FILE_WRITE_BEHIND enables the mode only for a
+        number of seconds above 0.
+        """
+        for value, expected in (("0", "False 1.0"), ("0.0", "False 1.0"),
+                                ("2.5", "True 2.5")):
+            environ = dict(os.environ, HBNB_FILE_WRITE_BEHIND=value)
+            output = subprocess.run(
+                [sys.executable, "-c", "from models import storage\n"
+                 "print(storage.write_behind, storage.flush_interval)"],
+                env=environ, check=True, capture_output=True, text=True)
+            self.assertEqual(expected, output.stdout.strip())
+
+
+class TestFileStorage_bgsave(unittest.TestCase):
+    """
+    This class defines unit tests for the background snapshots of
+    FileStorage.
+    """
+
+    def setUp(self):
+        """
+        Moves the storage file aside and starts from an empty storage.
+        """
+        try:
+            os.rename("file.json", "tmp.json")
+        except FileNotFoundError:
+            pass
+        FileStorage._FileStorage__objects = {}
+        FileStorage._FileStorage__pending.clear()
+
+    def tearDown(self):
+        """
+        Removes the storage files and restores the original storage file
+        (if it existed).
+        """
+        for path in ("file.json", "file.json.journal", "file.json.text",
+                     "file.json.lock", "file.json.bgsave.tmp"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        try:
+            os.rename("tmp.json", "file.json")
+        except FileNotFoundError:
+            pass
+        FileStorage._FileStorage__objects = {}
+
+    def test_bgsave_writes_fork_time_state(self):
+        """
+        Tests that the child writes the objects as they were when it was
+        forked, and that the status describes the snapshot.
+        """
+        storage = FileStorage()
+        my_user = User()
+        self.assertIsNotNone(storage.bgsave())
+        my_user.first_name = "Late"
+        storage.close()
+        with open("file.json", "r") as f:
+            saved = json.load(f)
+        self.assertIn("User." + my_user.id, saved)
+        self.assertNotIn("first_name", saved["User." + my_user.id])
+        status = storage.bgsave_status()
+        self.assertFalse(status["running"])
+        self.assertTrue(status["last"]["ok"])
+        self.assertFalse(status["last"]["superseded"])
+        self.assertEqual(1, status["last"]["records"])
+        self.assertEqual(os.path.getsize("file.json"),
+                         status["last"]["size"])
+        self.assertGreaterEqual(status["last"]["finished_at"],
+                                status["last"]["started_at"])
+        self.assertFalse(os.path.isfile("file.json.bgsave.tmp"))
+
+    def test_foreground_snapshot_supersedes(self):
+        """
+        Tests that a background snapshot older than a foreground one is
+        discarded.
+        """
+        storage = FileStorage()
+        my_user = User()
+        storage.bgsave()
+        my_user.first_name = "Betty"
+        storage.compact()
+        storage.close()
+        self.assertTrue(storage.bgsave_status()["last"]["superseded"])
+        with open("file.json", "r") as f:
+            self.assertIn("Betty", f.read())
+
+    def test_background_saves(self):
+        """
+        Tests that saves in background mode end up written, including the
+        ones made while a background save was running.
+        """
+        storage = FileStorage(background=True)
+        my_user = User()
+        storage.save()
+        my_user.first_name = "Betty"
+        storage.save()
+        storage.close()
+        with open("file.json", "r") as f:
+            self.assertIn("Betty", f.read())
+        self.assertFalse(storage.flush())
+
+    def test_background_saves_at_exit(self):
+        """
+        Tests that a process exiting after background saves, without
+        closing the storage, leaves the snapshot of its last save.
+        """
+        environ = dict(os.environ, HBNB_FILE_BGSAVE="1")
+        output = subprocess.run(
+            [sys.executable, "-c", "from models.user import User\n"
+             "user = User()\nuser.save()\nuser.first_name = 'Betty'\n"
+             "user.save()\nprint(user.id)"],
+            env=environ, check=True, capture_output=True, text=True)
+        with open("file.json", "r") as f:
+            saved = json.load(f)
+        user = saved["User." + output.stdout.strip()]
+        self.assertEqual("Betty", user["first_name"])
+        self.assertFalse(os.path.exists("file.json.bgsave.tmp"))
+
+    def test_bgsave_keeps_later_journal_records(self):
+        """
+        Tests that installing a background snapshot drops only the
+        journal records written before the fork.
+        """
+        storage = FileStorage(journal=True)
+        first = User()
+        storage.save()
+        storage.bgsave()
+        second = User()
+        storage.save()
+        storage.close()
+        with open("file.json.journal", "r") as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(["User." + second.id], [e["key"] for e in lines])
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+        self.assertEqual(2, storage.count("User"))
+
+
+class TestFileStorage_threads(unittest.TestCase):
+    """
+    This class defines a stress test of FileStorage used by many threads.
+    """
+
+    def setUp(self):
+        """
+        Moves the storage file aside and starts from an empty storage.
+        """
+        try:
+            os.rename("file.json", "tmp.json")
+        except FileNotFoundError:
+            pass
+        FileStorage._FileStorage__objects = {}
+        FileStorage._FileStorage__pending.clear()
+
+    def tearDown(self):
+        """
+        Removes the storage files and restores the original storage file
+        (if it existed).
+        """
+        for path in ("file.json", "file.json.lock", "file.json.text"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        try:
+            os.rename("tmp.json", "file.json")
+        except FileNotFoundError:
+            pass
+        FileStorage._FileStorage__objects = {}
+
+    def test_mixed_readers_and_writers(self):
+        """
+        Tests that threads creating, updating, deleting, saving and
+        querying objects at the same time raise no error and leave a
+        consistent storage and snapshot.
+        """
+        storage = models.storage
+        errors = []
+        stop = threading.Event()
+
+        def writer(number):
+            mine = []
+            for i in range(150):
+                place = Place()
+                place.city_id = str(number)
+                place.price_by_night = i
+                mine.append(place)
+                if i % 3 == 0:
+                    place.name = "renamed"
+                if i % 5 == 0:
+                    storage.delete(mine.pop(0))
+                if i % 25 == 0:
+                    storage.save()
+
+        def reader():
+            while not stop.is_set():
+                for key, obj in storage.snapshot().items():
+                    self.assertEqual(key.split(".")[1], obj.id)
+                list(storage.query(Place, city_id="1"))
+                list(storage.query(Place, order_by="-price_by_night",
+                                   limit=5))
+                for place in storage.query(Place):
+                    self.assertIsInstance(place, Place)
+                for place in storage.query(Place, order_by="price_by_night"):
+                    self.assertIsInstance(place, Place)
+                storage.count(Place)
+                storage.all_by_class(Place)
+                storage.search(Place, "renamed")
+
+        def run(target, *args):
+            try:
+                target(*args)
+            except Exception as error:
+                errors.append(error)
+
+        readers = [threading.Thread(target=run, args=(reader,))
+                   for _ in range(4)]
+        writers = [threading.Thread(target=run, args=(writer, n))
+                   for n in range(4)]
+        for thread in readers + writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        stop.set()
+        for thread in readers:
+            thread.join()
+        self.assertEqual([], errors)
+
+        storage.save()
+        expected = storage.snapshot()
+        self.assertEqual(4 * 120, storage.count(Place))
+        self.assertEqual(120, len(list(storage.query(Place, city_id="1"))))
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+        self.assertEqual(sorted(expected), sorted(storage.all()))
+
+    def test_query_iterator_ignores_later_changes(self):
+        """
+        Tests that a query iterator yields the objects stored when the
+        query was made, although the storage changes while it is read.
+        """
+        storage = models.storage
+        places = [Place() for _ in range(5)]
+        for i, place in enumerate(places):
+            place.price_by_night = i
+        scan = storage.query(Place)
+        ordered = storage.query(Place, order_by="price_by_night")
+        self.assertIn(next(scan), places)
+        self.assertIs(places[0], next(ordered))
+        storage.delete(places[1])
+        storage.delete(places[2])
+        Place().price_by_night = 2
+        places[3].price_by_night = -1
+        self.assertEqual(4, len(list(scan)))
+        self.assertEqual(places[1:], list(ordered))
+        self.assertEqual(4, len(list(storage.query(Place))))
+
+    def test_building_object_skips_lock(self):
+        """
+        Tests that the attributes set while building an object that is
+        not stored, as a reload does, do not take the storage lock, and
+        that stored objects still do.
+        """
+        my_user = User()
+        data = my_user.to_dict()
+        lock = FileStorage._FileStorage__lock
+        with patch.object(FileStorage, "_FileStorage__lock",
+                          wraps=lock) as wrapped:
+            copy = User(**data)
+            copy.first_name = "Betty"
+            self.assertEqual(0, wrapped.write.call_count)
+            my_user.first_name = "Betty"
+            self.assertEqual(1, wrapped.write.call_count)
+
+
+class TestFileStorage_versions(unittest.TestCase):
+    """
+    This class defines unit tests for the object versions and the
+    conditional updates of FileStorage.
+    """
+
+    def setUp(self):
+        """
+        Moves the storage file aside and starts from an empty storage.
+        """
+        try:
+            os.rename("file.json", "tmp.json")
+        except FileNotFoundError:
+            pass
+        FileStorage._FileStorage__objects = {}
+        FileStorage._FileStorage__pending.clear()
+
+    def tearDown(self):
+        """
+        Removes the storage files and restores the original storage file
+        (if it existed).
+        """
+        for path in ("file.json", "file.json.journal", "file.json.text",
+                     "file.json.lock"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        try:
+            os.rename("tmp.json", "file.json")
+        except FileNotFoundError:
+            pass
+        FileStorage._FileStorage__objects = {}
+
+    def test_save_increments_changed_objects(self):
+        """
+        Tests that a save increments the versions of the changed objects
+        only, in memory and in the file, and that reload keeps them.
+        """
+        for journal in (False, True):
+            storage = FileStorage(journal=journal)
+            first, second = User(), User()
+            storage.save()
+            first.first_name = "Betty"
+            storage.save()
+            self.assertEqual((2, 1), (first.version, second.version))
+            FileStorage._FileStorage__objects = {}
+            storage.reload()
+            self.assertEqual(2, storage.get(User, first.id).version)
+            self.assertEqual(1, storage.get(User, second.id).version)
+
+    def test_update(self):
+        """
+        Tests that an update at the current version sets the attributes
+        and saves them, the write being deferred inside a batch.
+        """
+        storage = FileStorage()
+        my_user = User()
+        storage.save()
+        with storage.batch():
+            self.assertEqual(2, storage.update(my_user, 1,
+                                               first_name="Betty"))
+            with open("file.json", "r") as f:
+                saved = json.load(f)["User." + my_user.id]
+            self.assertEqual(1, saved["version"])
+        with open("file.json", "r") as f:
+            saved = json.load(f)["User." + my_user.id]
+        self.assertEqual("Betty", saved["first_name"])
+        self.assertEqual(2, saved["version"])
+
+    def test_update_write_behind(self):
+        """
+        Tests that updates in write-behind mode leave the write to the
+        flusher, and that each update increments the version once.
+        """
+        storage = FileStorage(write_behind=True, flush_interval=60)
+        try:
+            my_user = User()
+            self.assertEqual(1, storage.update(my_user, 0, obj=5))
+            self.assertFalse(os.path.isfile("file.json"))
+            self.assertEqual(2, storage.update(my_user, 1, version=7))
+            with self.assertRaises(ConflictError):
+                storage.update(my_user, 1, first_name="Holly")
+        finally:
+            storage.close()
+        with open("file.json", "r") as f:
+            saved = json.load(f)["User." + my_user.id]
+        self.assertEqual((5, 2), (saved["obj"], saved["version"]))
+
+    def test_update_stale_version(self):
+        """
+        Tests that an update expecting an older version fails without
+        changing the object.
+        """
+        storage = FileStorage()
+        my_user = User()
+        storage.save()
+        storage.update(my_user, 1, first_name="Betty")
+        with self.assertRaises(ConflictError) as caught:
+            storage.update(my_user, 1, first_name="Holly")
+        self.assertEqual(("User." + my_user.id, 1, 2),
+                         (caught.exception.key, caught.exception.expected,
+                          caught.exception.actual))
+        self.assertEqual("Betty", my_user.first_name)
+
+    def test_update_deleted(self):
+        """
+        Tests that updating a deleted object fails.
+        """
+        storage = FileStorage()
+        my_user = User()
+        storage.save()
+        storage.delete(my_user)
+        with self.assertRaises(ConflictError) as caught:
+            storage.update(my_user, 1, first_name="Betty")
+        self.assertIsNone(caught.exception.actual)
+
+
+class TestFileStorage_async(unittest.TestCase):
+    """
+    This class defines unit tests for the asyncio methods of FileStorage.
+    """
+
+    def setUp(self):
+        """
+        Moves the storage file aside and starts from an empty storage.
+        """
+        try:
+            os.rename("file.json", "tmp.json")
+        except FileNotFoundError:
+            pass
+        FileStorage._FileStorage__objects = {}
+        FileStorage._FileStorage__pending.clear()
+
+    def tearDown(self):
+        """
+        Removes the storage files and restores the original storage file
+        (if it existed).
+        """
+        for path in ("file.json", "file.json.lock", "file.json.text"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        try:
+            os.rename("tmp.json", "file.json")
+        except FileNotFoundError:
+            pass
+        FileStorage._FileStorage__objects = {}
+
+    def test_asave_and_areload(self):
+        """
+        Tests that asave writes the objects from another thread, and that
+        areload reads them back.
+        """
+        storage = FileStorage()
+        my_user = User()
+        real_save = FileStorage.save
+        threads = []
+
+        def save(self):
+            threads.append(threading.current_thread())
+            real_save(self)
+
+        async def main():
+            await storage.asave()
+            FileStorage._FileStorage__objects = {}
+            await storage.areload()
+
+        with patch.object(FileStorage, "save", autospec=True,
+                          side_effect=save):
+            asyncio.run(main())
+        storage.close()
+        self.assertEqual(1, len(threads))
+        self.assertIsNot(threading.main_thread(), threads[0])
+        self.assertIn("User." + my_user.id, storage.all())
+
+    def test_concurrent_asaves_share_a_write(self):
+        """
+        Tests that the saves requested while one is running wait for a
+        single next save, and that the event loop goes on meanwhile.
+        """
+        storage = FileStorage()
+        User()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def save(self):
+            calls.append(threading.current_thread())
+            started.set()
+            release.wait(5)
+
+        async def main():
+            loop = asyncio.get_running_loop()
+            first = asyncio.ensure_future(storage.asave())
+            await loop.run_in_executor(None, started.wait, 5)
+            others = [asyncio.ensure_future(storage.asave())
+                      for _ in range(4)]
+            await asyncio.sleep(0.01)
+            release.set()
+            await asyncio.gather(first, *others)
+
+        with patch.object(FileStorage, "save", autospec=True,
+                          side_effect=save):
+            asyncio.run(main())
+        storage.close()
+        self.assertEqual(2, len(calls))
+        self.assertNotIn(threading.main_thread(), calls)
+
+    def test_touch_during_asave(self):
+        """
+        Tests that objects can be changed from the event loop while the
+        writer thread writes the file, the change being left pending for
+        the next save.
+        """
+        storage = FileStorage()
+        my_user = User()
+        writing = threading.Event()
+        touched = threading.Event()
+        write_snapshot = storage._FileStorage__write_snapshot
+
+        def slow_write(*args):
+            writing.set()
+            touched.wait(5)
+            return write_snapshot(*args)
+
+        async def main():
+            loop = asyncio.get_running_loop()
+            save = asyncio.ensure_future(storage.asave())
+            await loop.run_in_executor(None, writing.wait, 5)
+            started = time.monotonic()
+            my_user.first_name = "Betty"
+            touched.set()
+            await save
+            return time.monotonic() - started
+
+        with patch.object(storage, "_FileStorage__write_snapshot",
+                          slow_write):
+            self.assertLess(asyncio.run(main()), 1)
+        with open("file.json", "r") as f:
+            saved = json.load(f)
+        self.assertNotIn("first_name", saved["User." + my_user.id])
+        self.assertIn("User." + my_user.id,
+                      FileStorage._FileStorage__pending)
+        storage.save()
+        storage.close()
+        with open("file.json", "r") as f:
+            saved = json.load(f)
+        self.assertEqual("Betty", saved["User." + my_user.id]["first_name"])
+
+    def test_aquery(self):
+        """
+        Tests that aquery yields the same objects as query, across
+        several chunks.
+        """
+        storage = FileStorage()
+        for price in range(10):
+            place = Place()
+            place.price_by_night = price
+
+        async def main():
+            return [place async for place in storage.aquery(
+                Place, order_by="-price_by_night", chunk_size=3,
+                price_by_night__ge=2)]
+
+        self.assertEqual(list(storage.query(Place, order_by="-price_by_night",
+                                            price_by_night__ge=2)),
+                         asyncio.run(main()))
+
+
+class TestFileStorage_processes(unittest.TestCase):
+    """
+    This class defines unit tests for FileStorage sharing its files with
+    other processes.
+    """
+
+    def setUp(self):
+        """
+        Moves the storage file aside and starts from an empty storage.
+        """
+        try:
+            os.rename("file.json", "tmp.json")
+        except FileNotFoundError:
+            pass
+        FileStorage._FileStorage__objects = {}
+        FileStorage._FileStorage__pending.clear()
+
+    def tearDown(self):
+        """
+        Removes the storage files and restores the original storage file
+        (if it existed).
+        """
+        for path in ("file.json", "file.json.journal", "file.json.text",
+                     "file.json.lock", "file.json.bgsave.tmp"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        try:
+            os.rename("tmp.json", "file.json")
+        except FileNotFoundError:
+            pass
+        FileStorage._FileStorage__objects = {}
+
+    def run_other(self, code, **env):
+        """
+        Runs `code` in another process using the same files, after
+        `from models import storage`.
+        """
+        environ = {name: value for name, value in os.environ.items()
+                   if not name.startswith("HBNB_")}
+        environ.update(env)
+        subprocess.run([sys.executable, "-c",
+                        "from models import storage\n" + code],
+                       env=environ, check=True)
+
+    def test_save_merges_other_process(self):
+        """
+        Tests that a save keeps the objects another process created and
+        updated, and updates the stored objects in place.
+        """
+        storage = FileStorage()
+        my_user = User()
+        storage.save()
+        self.run_other("from models.state import State\n"
+                       "user = storage.get('User', '{}')\n"
+                       "user.first_name = 'Other'\n"
+                       "State().save()\n".format(my_user.id))
+        my_place = Place()
+        storage.save()
+        with open("file.json", "r") as f:
+            saved = json.load(f)
+        self.assertEqual("Other", saved["User." + my_user.id]["first_name"])
+        self.assertIn("Place." + my_place.id, saved)
+        self.assertEqual(1, len([key for key in saved
+                                 if key.startswith("State.")]))
+        self.assertEqual("Other", my_user.first_name)
+        self.assertIs(my_user, storage.get(User, my_user.id))
+        self.assertEqual(1, storage.count(State))
+
+    def test_save_overtaken_while_writing(self):
+        """
+        Tests that a snapshot is not installed when another process wrote
+        the files while it was being written, and that the save is done
+        again with the records of both processes.
+        """
+        storage = FileStorage()
+        my_user = User()
+        storage.save()
+        write_snapshot = storage._FileStorage__write_snapshot
+        calls = []
+
+        def other_write(*args):
+            if not calls:
+                self.run_other("from models.state import State\n"
+                               "State().save()\n")
+            calls.append(args[0])
+            return write_snapshot(*args)
+
+        my_user.first_name = "Betty"
+        with patch.object(storage, "_FileStorage__write_snapshot",
+                          other_write):
+            storage.save()
+        self.assertEqual(2, len(calls))
+        self.assertEqual(calls[1], calls[0])
+        self.assertFalse(os.path.exists(calls[0]))
+        with open("file.json", "r") as f:
+            saved = json.load(f)
+        self.assertEqual("Betty", saved["User." + my_user.id]["first_name"])
+        self.assertEqual(2, saved["User." + my_user.id]["version"])
+        self.assertEqual(1, len([key for key in saved
+                                 if key.startswith("State.")]))
+        self.assertEqual({}, FileStorage._FileStorage__pending)
+
+    def test_pending_change_wins(self):
+        """
+        Tests that a change not saved yet is not overwritten by the
+        record another process saved meanwhile.
+        """
+        storage = FileStorage()
+        my_user = User()
+        storage.save()
+        self.run_other("user = storage.get('User', '{}')\n"
+                       "user.first_name = 'Other'\n"
+                       "user.save()\n".format(my_user.id))
+        my_user.first_name = "Mine"
+        storage.save()
+        with open("file.json", "r") as f:
+            saved = json.load(f)
+        self.assertEqual("Mine", saved["User." + my_user.id]["first_name"])
+
+    def test_refresh_builds_changed_records_only(self):
+        """
+        Tests that refresh updates and removes only the objects another
+        process changed, and does nothing when the files did not change.
+        """
+        storage = FileStorage()
+        users = [User(), User(), User()]
+        storage.save()
+        self.run_other("user = storage.get('User', '{}')\n"
+                       "user.last_name = 'Changed'\n"
+                       "storage.delete(storage.get('User', '{}'))\n"
+                       "storage.save()\n".format(users[0].id, users[1].id))
+        with patch.object(User, "__init__", autospec=True,
+                          side_effect=BaseModel.__init__) as init:
+            self.assertEqual(2, storage.refresh())
+        self.assertEqual(1, init.call_count)
+        self.assertEqual("Changed", users[0].last_name)
+        self.assertIsNone(storage.get(User, users[1].id))
+        self.assertIs(users[2], storage.get(User, users[2].id))
+        self.assertEqual(0, storage.refresh())
+
+    def test_refresh_reads_journal_tail(self):
+        """
+        Tests that the records another process appended to the journal
+        are merged, and survive the next reload.
+        """
+        storage = FileStorage(journal=True)
+        User()
+        storage.save()
+        self.run_other("from models.state import State\n"
+                       "State().save()\n", HBNB_FILE_JOURNAL="1")
+        self.assertEqual(1, storage.refresh())
+        self.assertEqual(1, storage.count(State))
+        Place()
+        storage.save()
+        FileStorage._FileStorage__objects = {}
+        storage.reload()
+        self.assertEqual(3, storage.count())
+
+    def test_overwritten_bgsave_is_saved_again(self):
+        """
+        Tests that the objects of a background snapshot superseded by
+        another process's snapshot are written again.
+        """
+        storage = FileStorage()
+        my_user = User()
+        self.assertIsNotNone(storage.bgsave())
+        self.run_other("from models.state import State\n"
+                       "State().save()\n")
+        storage.close()
+        self.assertTrue(storage.bgsave_status()["last"]["superseded"])
+        with open("file.json", "r") as f:
+            saved = json.load(f)
+        self.assertIn("User." + my_user.id, saved)
+        self.assertEqual(2, len(saved) - 1)
+
+    def test_update_conflicts_with_other_process(self):
+        """
+        Tests that an update expecting the version read before another
+        process saved the object fails, leaving the saved state loaded.
+        """
+        storage = FileStorage()
+        my_user = User()
+        storage.save()
+        self.run_other("user = storage.get('User', '{}')\n"
+                       "storage.update(user, 1, first_name='Other')\n"
+                       .format(my_user.id))
+        with self.assertRaises(ConflictError) as caught:
+            storage.update(my_user, 1, first_name="Mine")
+        self.assertEqual(2, caught.exception.actual)
+        self.assertEqual("Other", my_user.first_name)
+        self.assertEqual(3, storage.update(my_user, 2, first_name="Mine"))
+
+    def test_pending_change_keeps_versions_growing(self):
+        """
+        Tests that saving a change over a newer version saved by another
+        process gives the object a higher version, and that an update
+        expecting the older version fails.
+        """
+        storage = FileStorage()
+        my_user = User()
+        storage.save()
+        self.run_other("user = storage.get('User', '{}')\n"
+                       "user.save()\n"
+                       "user.save()\n".format(my_user.id))
+        my_user.first_name = "Mine"
+        with self.assertRaises(ConflictError):
+            storage.update(my_user, 1)
+        storage.save()
+        self.assertEqual(4, my_user.version)
+
+    def test_lock_excludes_writers(self):
+        """
+        Tests that a save waits while another process holds the lock.
+        """
+        fcntl = models.engine.file_storage.fcntl
+        if fcntl is None:
+            self.skipTest("fcntl is not available")
+        storage = FileStorage()
+        User()
+        fd = os.open("file.json.lock", os.O_RDWR | os.O_CREAT)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            thread = threading.Thread(target=storage.save)
+            thread.start()
+            time.sleep(0.1)
+            self.assertFalse(os.path.isfile("file.json"))
+        finally:
+            os.close(fd)
+        thread.join(5)
+        self.assertTrue(os.path.isfile("file.json"))
+
 
 """
 Run the tests if the script is executed directly
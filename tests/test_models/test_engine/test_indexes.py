@@ -0,0 +1,336 @@
+#!/usr/bin/python3
+"""
+This script defines unit tests for the secondary indexes
+used by the storage engine.
+"""
+import unittest
+from models.engine.indexes import HashIndex, SortedIndex, GridIndex
+from models.engine.indexes import TextIndex, SetIndex, tokenize
+from models.engine.indexes import build_indexes, distance_km
+from models.city import City
+from models.state import State
+
+
+class Record:
+    """
+    A plain object used as an indexed value holder.
+    """
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class TestHashIndex(unittest.TestCase):
+    """
+    This class defines unit tests for the HashIndex class.
+    """
+
+    def test_lookup(self):
+        """
+        Tests that objects are found by the value of their attribute.
+        """
+        index = HashIndex("state_id")
+        first = Record(state_id="CA")
+        second = Record(state_id="CA")
+        third = Record(state_id="NV")
+        index.add("a", first)
+        index.add("b", second)
+        index.add("c", third)
+        self.assertEqual({"a": first, "b": second}, index.lookup("CA"))
+        self.assertEqual({"c": third}, index.lookup("NV"))
+        self.assertEqual({}, index.lookup("TX"))
+
+    def test_add_replaces_previous_value(self):
+        """
+        Tests that adding a key again moves it to its new value.
+        """
+        index = HashIndex("state_id")
+        record = Record(state_id="CA")
+        index.add("a", record)
+        record.state_id = "NV"
+        index.add("a", record)
+        self.assertEqual({}, index.lookup("CA"))
+        self.assertEqual({"a": record}, index.lookup("NV"))
+
+    def test_remove(self):
+        """
+        Tests that removed keys are no longer returned, and that removing
+        an unknown key is a no-op.
+        """
+        index = HashIndex("state_id")
+        index.add("a", Record(state_id="CA"))
+        index.remove("a")
+        index.remove("b")
+        self.assertEqual({}, index.lookup("CA"))
+
+    def test_unhashable_values_are_skipped(self):
+        """
+        Tests that objects holding unhashable values are left out.
+        """
+        index = HashIndex("state_id")
+        index.add("a", Record(state_id=["CA"]))
+        self.assertEqual({}, index.lookup(["CA"]))
+
+
+class TestSortedIndex(unittest.TestCase):
+    """
+    This class defines unit tests for the SortedIndex class.
+    """
+
+    def setUp(self):
+        """
+        Builds an index over the prices of a few records.
+        """
+        self.index = SortedIndex("price_by_night")
+        self.records = {}
+        for key, price in (("a", 50), ("b", 20), ("c", 50), ("d", 90)):
+            self.records[key] = Record(id=key, price_by_night=price)
+            self.index.add(key, self.records[key])
+
+    def test_range_search(self):
+        """
+        Tests that range conditions return the matching keys in order.
+        """
+        self.assertEqual(["a", "c", "d"],
+                         list(self.index.search("ge", 50)))
+        self.assertEqual(["d"], list(self.index.search("gt", 50)))
+        self.assertEqual(["b", "a", "c"],
+                         list(self.index.search("le", 50)))
+        self.assertEqual(["b"], list(self.index.search("lt", 50)))
+        self.assertEqual(["a", "c"], list(self.index.search("eq", 50)))
+
+    def test_estimate(self):
+        """
+        Tests that estimates count the matches, and that unsupported
+        conditions are refused.
+        """
+        self.assertEqual(2, self.index.estimate("eq", 50))
+        self.assertEqual(4, self.index.estimate("gt", 0))
+        self.assertIsNone(self.index.estimate("ne", 50))
+        self.assertIsNone(self.index.estimate("ge", "fifty"))
+
+    def test_ordered(self):
+        """
+        Tests ordered iteration in both directions, with non-numeric
+        values ordered after the numbers.
+        """
+        self.records["a"].price_by_night = "unknown"
+        self.index.add("a", self.records["a"])
+        keys = [key for key, obj in self.index.ordered()]
+        self.assertEqual(["b", "c", "d", "a"], keys)
+        keys = [key for key, obj in self.index.ordered(reverse=True)]
+        self.assertEqual(["a", "d", "c", "b"], keys)
+
+    def test_remove(self):
+        """
+        Tests that removed keys are no longer returned.
+        """
+        self.index.remove("a")
+        self.index.remove("z")
+        self.assertEqual(["c"], list(self.index.search("eq", 50)))
+
+    def test_ordered_ignores_later_changes(self):
+        """
+        Tests that an ordered iteration walks the entries as they were
+        when it started.
+        """
+        ordered = self.index.ordered()
+        self.assertEqual("b", next(ordered)[0])
+        self.index.remove("a")
+        self.index.add("e", Record(id="e", price_by_night=60))
+        self.assertEqual(["a", "c", "d"], [key for key, obj in ordered])
+        self.assertEqual(["b", "c", "e", "d"],
+                         [key for key, obj in self.index.ordered()])
+
+    def test_build(self):
+        """
+        Tests that building the index at once replaces its entries and
+        orders them as adding the objects one at a time does.
+        """
+        self.records["e"] = Record(id="e", price_by_night=None)
+        built = SortedIndex("price_by_night")
+        built.add("z", Record(id="z", price_by_night=10))
+        built.build(self.records)
+        self.index.add("e", self.records["e"])
+        self.assertEqual(list(self.index.ordered()), list(built.ordered()))
+        self.assertEqual(["b", "a", "c", "d", "e"],
+                         [key for key, obj in built.ordered()])
+        built.remove("a")
+        self.assertEqual(["c"], list(built.search("eq", 50)))
+
+
+class TestGridIndex(unittest.TestCase):
+    """
+    This class defines unit tests for the GridIndex class.
+    """
+
+    def setUp(self):
+        """
+        Builds an index over a few points around the world.
+        """
+        self.index = GridIndex("latitude", "longitude")
+        points = {"paris": (48.8566, 2.3522), "london": (51.5074, -0.1278),
+                  "fiji": (-17.7, 179.9), "samoa": (-17.8, -179.9)}
+        for key, (lat, lon) in points.items():
+            self.index.add(key, Record(latitude=lat, longitude=lon))
+
+    def test_distance(self):
+        """
+        Tests the haversine distance between two known points.
+        """
+        self.assertAlmostEqual(343.5, distance_km(48.8566, 2.3522,
+                                                  51.5074, -0.1278),
+                               places=0)
+
+    def test_nearby(self):
+        """
+        Tests radius searches, including across the antimeridian.
+        """
+        result = self.index.nearby(50, 1, 400)
+        self.assertEqual(["paris", "london"], [k for _, k, _ in result])
+        result = self.index.nearby(-17.75, 180.0, 50)
+        self.assertEqual({"fiji", "samoa"}, {k for _, k, _ in result})
+        self.assertEqual([], self.index.nearby(0, 0, 100))
+
+    def test_within(self):
+        """
+        Tests bounding box searches, including across the antimeridian.
+        """
+        self.assertEqual({"paris"}, set(self.index.within(48, 0, 50, 5)))
+        self.assertEqual({"fiji", "samoa"},
+                         set(self.index.within(-20, 179, -15, -179)))
+
+    def test_move_and_remove(self):
+        """
+        Tests that moved objects are found at their new position, and
+        that invalid coordinates are left out.
+        """
+        self.index.add("paris", Record(latitude=0.0, longitude=0.0))
+        self.assertEqual(["paris"],
+                         [k for _, k, _ in self.index.nearby(0, 0, 1)])
+        self.index.remove("paris")
+        self.index.add("nowhere", Record(latitude="N", longitude=0.0))
+        self.assertEqual([], self.index.nearby(0, 0, 1))
+
+
+class TestTextIndex(unittest.TestCase):
+    """
+    This class defines unit tests for the TextIndex class and the
+    tokenize function.
+    """
+
+    def setUp(self):
+        """
+        Builds an index over the text of a few reviews.
+        """
+        self.index = TextIndex("text")
+        texts = {"a": "Great view, great host", "b": "Great location",
+                 "c": "Noisy street but a great view", "d": ""}
+        for key, text in texts.items():
+            self.index.add(key, Record(text=text))
+
+    def test_tokenize(self):
+        self.assertEqual(["great", "view", "great", "host"],
+                         tokenize("Great view, great host!"))
+        self.assertEqual([], tokenize(None))
+
+    def test_and_search(self):
+        """
+        Tests that "and" searches require every term, ranking documents
+        with more occurrences first.
+        """
+        scores = self.index.search(["great", "view"])
+        self.assertEqual({"a", "c"}, set(scores))
+        self.assertGreater(scores["a"], scores["c"])
+        self.assertEqual({}, self.index.search(["great", "pool"]))
+
+    def test_or_search(self):
+        """
+        Tests that "or" searches accept any term, rare terms weighing more.
+        """
+        scores = self.index.search(["host", "location"], "or")
+        self.assertEqual({"a", "b"}, set(scores))
+        scores = self.index.search(["noisy", "great"], "or")
+        self.assertGreater(scores["c"], scores["a"])
+
+    def test_update_and_remove(self):
+        """
+        Tests that changed and removed documents leave the postings.
+        """
+        self.index.add("b", Record(text="Quiet"))
+        self.index.remove("a")
+        self.assertEqual({"c"}, set(self.index.search(["great"])))
+        self.assertEqual({"b"}, set(self.index.search(["quiet"])))
+
+    def test_dump_and_restore(self):
+        """
+        Tests that restored postings answer like the original index.
+        """
+        bucket = {key: Record() for key in "abcd"}
+        restored = TextIndex("text")
+        restored.restore(self.index.dump(), bucket)
+        self.assertEqual(self.index.search(["great", "view"]),
+                         restored.search(["great", "view"]))
+        restored.remove("a")
+        self.assertEqual({"c"}, set(restored.search(["view"])))
+
+
+class TestSetIndex(unittest.TestCase):
+    """
+    This class defines unit tests for the SetIndex class.
+    """
+
+    def setUp(self):
+        """
+        Builds an index over the amenities of a few places.
+        """
+        self.index = SetIndex("amenity_ids")
+        self.index.add("a", Record(amenity_ids=["wifi", "pool"]))
+        self.index.add("b", Record(amenity_ids=["wifi"]))
+        self.index.add("c", Record(amenity_ids=["wifi", "pool", "tv"]))
+        self.index.add("d", Record())
+
+    def test_contains(self):
+        self.assertEqual({"a", "c"}, set(self.index.search("contains",
+                                                           "pool")))
+        self.assertEqual(2, self.index.estimate("contains", "pool"))
+        self.assertIsNone(self.index.estimate("eq", "pool"))
+
+    def test_contains_all(self):
+        self.assertEqual({"c"}, set(self.index.search(
+            "contains_all", ["tv", "wifi", "pool"])))
+        self.assertEqual(1, self.index.estimate("contains_all",
+                                                ["wifi", "tv"]))
+        self.assertEqual({}, self.index.search("contains_all",
+                                               ["wifi", "gym"]))
+
+    def test_update_and_remove(self):
+        self.index.add("b", Record(amenity_ids=["pool"]))
+        self.index.remove("a")
+        self.index.add("d", Record(amenity_ids="pool"))
+        self.assertEqual({"b", "c"}, set(self.index.search("contains",
+                                                           "pool")))
+        self.assertEqual({"c"}, set(self.index.search("contains", "wifi")))
+
+
+class TestBuildIndexes(unittest.TestCase):
+    """
+    This class defines unit tests for the build_indexes function.
+    """
+
+    def test_declared_indexes(self):
+        """
+        Tests that one index is built per declaration of the model.
+        """
+        indexes = build_indexes(City)
+        self.assertEqual(1, len(indexes))
+        self.assertEqual("state_id", indexes[0].attribute)
+
+    def test_no_declaration(self):
+        """
+        Tests that models without declarations get no indexes.
+        """
+        self.assertEqual([], build_indexes(State))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+"""
+This script defines unit tests for the query filter conditions.
+"""
+import unittest
+from models.engine.query import parse_filters, matches
+
+
+class Record:
+    """
+    A plain object holding the attributes to filter on.
+    """
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class TestParseFilters(unittest.TestCase):
+    """
+    This class defines unit tests for the parse_filters function.
+    """
+
+    def test_bare_attribute_is_equality(self):
+        self.assertEqual([("city_id", "eq", "1")],
+                         parse_filters({"city_id": "1"}))
+
+    def test_operator_suffix(self):
+        self.assertEqual([("max_guest", "ge", 4)],
+                         parse_filters({"max_guest__ge": 4}))
+
+    def test_unknown_operator(self):
+        with self.assertRaises(ValueError):
+            parse_filters({"max_guest__near": 4})
+
+
+class TestMatches(unittest.TestCase):
+    """
+    This class defines unit tests for the matches function.
+    """
+
+    def test_all_conditions_must_hold(self):
+        record = Record(city_id="1", max_guest=4)
+        self.assertTrue(matches(record, [("city_id", "eq", "1"),
+                                         ("max_guest", "ge", 4)]))
+        self.assertFalse(matches(record, [("city_id", "eq", "1"),
+                                          ("max_guest", "gt", 4)]))
+
+    def test_membership(self):
+        record = Record(city_id="1")
+        self.assertTrue(matches(record, [("city_id", "in", ["1", "2"])]))
+        self.assertFalse(matches(record, [("city_id", "in", ["3"])]))
+
+    def test_incomparable_values_do_not_match(self):
+        record = Record(max_guest="four")
+        self.assertFalse(matches(record, [("max_guest", "ge", 4)]))
+
+    def test_missing_attribute(self):
+        self.assertFalse(matches(Record(), [("city_id", "eq", "1")]))
+
+
+if __name__ == "__main__":
+    unittest.main()
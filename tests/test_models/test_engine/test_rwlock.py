@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+"""
+This script defines unit tests for the readers-writer lock.
+"""
+import threading
+import time
+import unittest
+from models.engine.rwlock import RWLock
+
+
+class TestRWLock(unittest.TestCase):
+    """
+    This class defines unit tests for the RWLock class.
+    """
+
+    def test_readers_share(self):
+        lock = RWLock()
+        barrier = threading.Barrier(3, timeout=5)
+
+        def reader():
+            with lock.read():
+                barrier.wait()
+
+        threads = [threading.Thread(target=reader) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        for thread in threads:
+            thread.join()
+
+    def test_writer_excludes_readers(self):
+        lock = RWLock()
+        events = []
+
+        def reader():
+            with lock.read():
+                events.append("read")
+
+        with lock.write():
+            thread = threading.Thread(target=reader)
+            thread.start()
+            time.sleep(0.05)
+            events.append("written")
+        thread.join()
+        self.assertEqual(["written", "read"], events)
+
+    def test_waiting_writer_goes_first(self):
+        lock = RWLock()
+        events = []
+
+        def writer():
+            with lock.write():
+                events.append("write")
+
+        def reader():
+            with lock.read():
+                events.append("read")
+
+        with lock.read():
+            first = threading.Thread(target=writer)
+            first.start()
+            time.sleep(0.05)
+            second = threading.Thread(target=reader)
+            second.start()
+            time.sleep(0.05)
+            self.assertEqual([], events)
+        first.join()
+        second.join()
+        self.assertEqual(["write", "read"], events)
+
+    def test_reentrant(self):
+        lock = RWLock()
+        with lock.write():
+            with lock.write():
+                with lock.read():
+                    pass
+        with lock.read():
+            with lock.read():
+                pass
+        with lock.write():
+            pass
+
+    def test_no_upgrade(self):
+        lock = RWLock()
+        with lock.read():
+            with self.assertRaises(RuntimeError):
+                with lock.write():
+                    pass
+        with lock.write():
+            pass
+
+
+"""
+Run the tests if the script is executed directly
+"""
+if __name__ == "__main__":
+    unittest.main()
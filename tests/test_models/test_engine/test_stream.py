@@ -0,0 +1,186 @@
+#!/usr/bin/python3
+"""
+This script defines unit tests for the incremental JSON reader and writer.
+"""
+import io
+import json
+import unittest
+from models.engine.stream import CHECKSUMS, checksum, parse_records
+from models.engine.stream import scan_records
+from models.engine.stream import split_records, write_records
+
+
+class TestWriteRecords(unittest.TestCase):
+    """
+    This class defines unit tests for the write_records function.
+    """
+
+    def test_round_trip(self):
+        store = {"User.1": {"id": "1"}, "Place.2": {"name": "Loft"}}
+        file = io.StringIO()
+        count = write_records(file, ((key, json.dumps(value))
+                                     for key, value in store.items()))
+        self.assertEqual(2, count)
+        self.assertEqual(json.dumps(store), file.getvalue())
+        file.seek(0)
+        self.assertEqual(list(store.items()),
+                         [(key, value) for key, value, _ in
+                          scan_records(file)])
+
+    def test_no_records(self):
+        file = io.StringIO()
+        self.assertEqual(0, write_records(file, iter(())))
+        self.assertEqual("{}", file.getvalue())
+
+
+class TestScanRecords(unittest.TestCase):
+    """
+    This class defines unit tests for the scan_records function.
+    """
+
+    text = '{"User.1": {"id": "1"}, "Place.2": {"id": "2"}, ' \
+        '"State.3": {"id": "3"}}'
+
+    store = {
+        "User.1": {"id": "1", "first_name": "Betty", "tags": ["a", "b"]},
+        "Place.2": {"id": "2", "name": "Quote \" and {brace}",
+                    "price_by_night": 120, "latitude": 48.85},
+        "Review.3": {"id": "3", "text": "café \\ ok", "nested": {}},
+    }
+
+    def scan(self, text, chunk_size=1 << 16):
+        return list(scan_records(io.StringIO(text), chunk_size))
+
+    def test_intact_file(self):
+        for chunk_size in (1, 5, 1 << 16):
+            self.assertEqual([("User.1", {"id": "1"}, '{"id": "1"}'),
+                              ("Place.2", {"id": "2"}, '{"id": "2"}'),
+                              ("State.3", {"id": "3"}, '{"id": "3"}')],
+                             self.scan(self.text, chunk_size))
+
+    def test_matches_json_load(self):
+        text = json.dumps(self.store, indent=2)
+        for chunk_size in (1, 2, 3, 7, 1 << 16):
+            self.assertEqual(list(self.store.items()),
+                             [(key, value) for key, value, _ in
+                              self.scan(text, chunk_size)])
+
+    def test_number_split_across_chunks(self):
+        self.assertEqual([("a", 12345, "12345")],
+                         self.scan('{"a": 12345}', 8))
+
+    def test_empty_object(self):
+        self.assertEqual([], self.scan(" { } "))
+
+    def test_truncated_file_yields_complete_records(self):
+        text = json.dumps(self.store)
+        self.assertEqual([("User.1", True), ("Place.2", True),
+                          ("Review.3", False)],
+                         [(key, value is not None) for key, value, _ in
+                          self.scan(text[:-30], 4)])
+
+    def test_not_an_object(self):
+        self.assertEqual([(None, None, None)], self.scan("[1, 2]"))
+
+    def test_resumes_after_malformed_value(self):
+        text = self.text.replace('{"id": "2"}', '{"id": "2}')
+        for chunk_size in (3, 1 << 16):
+            scanned = self.scan(text, chunk_size)
+            self.assertEqual([("User.1", "1"), ("Place.2", None),
+                              ("State.3", "3")],
+                             [(key, value and value["id"])
+                              for key, value, _ in scanned])
+
+    def test_resumes_after_malformed_key(self):
+        text = self.text.replace('"Place.2"', '"Place.2')
+        keys = [key for key, value, _ in self.scan(text) if value]
+        self.assertEqual(["User.1", "State.3"], keys)
+
+    def test_empty_file(self):
+        self.assertEqual([], self.scan(""))
+
+    def test_large_value(self):
+        large = '{"id": "2", "text": "' + "x" * (3 << 20) + '"}'
+        text = self.text.replace('{"id": "2"}', large)
+        scanned = self.scan(text, 1 << 10)
+        self.assertEqual(["User.1", "Place.2", "State.3"],
+                         [key for key, value, _ in scanned])
+        self.assertEqual(large, scanned[1][2])
+
+    def test_malformed_value_at_end(self):
+        text = self.text.replace('{"id": "3"}', '{"id": "3}')
+        scanned = self.scan(text, 4)
+        self.assertEqual([("User.1", True), ("Place.2", True),
+                          ("State.3", False)],
+                         [(key, value is not None)
+                          for key, value, _ in scanned])
+
+    def test_checksums_member(self):
+        file = io.StringIO()
+        write_records(file, [("User.1", '{"id": "1"}')], checksums=True)
+        scanned = self.scan(file.getvalue())
+        self.assertEqual(CHECKSUMS, scanned[1][0])
+        self.assertEqual({"User.1": checksum('{"id": "1"}')},
+                         scanned[1][1])
+
+
+class TestSplitRecords(unittest.TestCase):
+    """
+    This class defines unit tests for the split_records and
+    parse_records functions.
+    """
+
+    def snapshot(self, count):
+        """
+        Returns the bytes of a snapshot of `count` records whose text
+        looks like record keys.
+        """
+        file = io.StringIO()
+        write_records(file, [
+            ("User.{}".format(i),
+             json.dumps({"id": str(i), "bio": ', "User.0": {' * (i % 3)}))
+            for i in range(count)], checksums=True)
+        return file.getvalue().encode("utf-8")
+
+    def test_ranges_hold_whole_records(self):
+        """
+        Tests that parsing every range gives back every record in order,
+        and that only the last range ends the object.
+        """
+        data = self.snapshot(500)
+        offsets = split_records(io.BytesIO(data), 8, window=64)
+        self.assertGreater(len(offsets), 3)
+        self.assertEqual((0, len(data)), (offsets[0], offsets[-1]))
+        keys = []
+        ends = []
+        for start, end in zip(offsets, offsets[1:]):
+            records, closed = parse_records(data[start:end].decode("utf-8"))
+            keys.extend(key for key, value, text in records)
+            ends.append(closed)
+        self.assertEqual(["User.{}".format(i) for i in range(500)] +
+                         [CHECKSUMS], keys)
+        self.assertEqual([False] * (len(ends) - 1) + [True], ends)
+
+    def test_small_file(self):
+        """
+        Tests that a file without records to cut at is a single range.
+        """
+        self.assertEqual([0, 2], split_records(io.BytesIO(b"{}"), 4))
+        self.assertEqual(([], True), parse_records(" { } "))
+
+    def test_malformed_range(self):
+        """
+        Tests that a malformed range is refused.
+        """
+        for text in ('{"User.1": {"id": "1"} "User.2": {}}',
+                     '{"User.1": {"id": "1"',
+                     '{"User.1": {}} trailing'):
+            with self.assertRaises(ValueError):
+                parse_records(text)
+
+
+"""
+Run the tests if the script is executed directly
+"""
+if __name__ == "__main__":
+    unittest.main()
@@ -13,6 +13,7 @@ import unittest
 from datetime import datetime
 from time import sleep
 from models.place import Place
+from models.review import Review
 
 """
 Test class for Place instantiation and attributes
@@ -39,10 +40,11 @@ class TestPlace_instantiation(unittest.TestCase):
         """
         Remove file.json and restore tmp.json if it exists.
         """
-        try:
-            os.remove("file.json")
-        except FileNotFoundError:
-            pass
+        for path in ("file.json", "file.json.lock"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
         try:
             os.rename("tmp.json", "file.json")
         except FileNotFoundError:
@@ -131,6 +133,24 @@ class TestPlace_instantiation(unittest.TestCase):
         self.assertIn("amenity_ids", dir(my_place))
         self.assertNotIn("amenity_ids", my_place.__dict__)
 
+    def test_amenity_ids_not_shared(self):
+        my_place1 = Place()
+        my_place2 = Place()
+        my_place1.amenity_ids.append("777")
+        self.assertEqual(["777"], my_place1.amenity_ids)
+        self.assertEqual([], my_place2.amenity_ids)
+        self.assertEqual([], Place.amenity_ids)
+
+    def test_add_and_remove_amenity_copy_the_list(self):
+        my_place = Place()
+        amenity_ids = my_place.amenity_ids
+        my_place.add_amenity("777")
+        my_place.add_amenity("777")
+        self.assertEqual(["777"], my_place.amenity_ids)
+        self.assertEqual([], amenity_ids)
+        my_place.remove_amenity("777")
+        self.assertEqual([], my_place.amenity_ids)
+
     def test_two_places_unique_ids(self):
         my_place1 = Place()
         my_place2 = Place()
@@ -189,10 +209,11 @@ class TestPlace_save(unittest.TestCase):
             pass
 
     def tearDown(self):
-        try:
-            os.remove("file.json")
-        except FileNotFoundError:
-            pass
+        for path in ("file.json", "file.json.lock"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
         try:
             os.rename("tmp.json", "file.json")
         except FileNotFoundError:
@@ -242,10 +263,11 @@ class TestPlace_to_dict(unittest.TestCase):
             pass
 
     def tearDown(self):
-        try:
-            os.remove("file.json")
-        except FileNotFoundError:
-            pass
+        for path in ("file.json", "file.json.lock"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
         try:
             os.rename("tmp.json", "file.json")
         except FileNotFoundError:
@@ -300,6 +322,51 @@ class TestPlace_to_dict(unittest.TestCase):
             my_place.to_dict(None)
 
 
+class TestPlace_reviews(unittest.TestCase):
+    """
+    Test class for the Place.reviews relationship
+    """
+    def setUp(self):
+        try:
+            os.rename("file.json", "tmp.json")
+        except FileNotFoundError:
+            pass
+
+    def tearDown(self):
+        for path in ("file.json", "file.json.lock"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        try:
+            os.rename("tmp.json", "file.json")
+        except FileNotFoundError:
+            pass
+    """
+    Tests for the reviews accessor
+    """
+    def test_reviews_follow_place_id(self):
+        place = Place()
+        other = Place()
+        first = Review()
+        first.place_id = place.id
+        second = Review()
+        second.place_id = place.id
+        Review().place_id = other.id
+        self.assertEqual([first, second], place.reviews)
+        second.place_id = other.id
+        self.assertEqual([first], place.reviews)
+        models.storage.delete(first)
+        self.assertEqual([], place.reviews)
+
+    def test_reviews_is_read_only(self):
+        place = Place()
+        self.assertEqual([], place.reviews)
+        self.assertNotIn("reviews", place.to_dict())
+        with self.assertRaises(AttributeError):
+            place.reviews = []
+
+
 """
 Run the tests if the script is executed directly
 """
@@ -120,10 +120,11 @@ class TestReview_save(unittest.TestCase):
 
     def tearDown(self):
         """Remove file.json and restore tmp.json if it exists."""
-        try:
-            os.remove("file.json")
-        except FileNotFoundError:
-            pass
+        for path in ("file.json", "file.json.lock"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
         try:
             os.rename("tmp.json", "file.json")
         except FileNotFoundError:
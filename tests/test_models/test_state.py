@@ -11,6 +11,7 @@ import unittest
 from datetime import datetime
 from time import sleep
 from models.state import State
+from models.city import City
 
 
 class TestState_instantiation(unittest.TestCase):
@@ -106,10 +107,11 @@ class TestState_save(unittest.TestCase):
 
     def tearDown(self):
         """Remove file.json and restore tmp.json if it exists."""
-        try:
-            os.remove("file.json")
-        except FileNotFoundError:
-            pass
+        for path in ("file.json", "file.json.lock"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
         try:
             os.rename("tmp.json", "file.json")
         except FileNotFoundError:
@@ -198,6 +200,60 @@ class TestState_to_dict(unittest.TestCase):
             state.to_dict(None)
 
 
+class TestState_cities(unittest.TestCase):
+    """
+    Test class for the State.cities relationship
+    """
+    def setUp(self):
+        try:
+            os.rename("file.json", "tmp.json")
+        except FileNotFoundError:
+            pass
+
+    def tearDown(self):
+        for path in ("file.json", "file.json.lock"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        try:
+            os.rename("tmp.json", "file.json")
+        except FileNotFoundError:
+            pass
+    """
+    Tests for the cities accessor
+    """
+    def test_cities_follow_state_id(self):
+        state = State()
+        other = State()
+        first = City()
+        first.state_id = state.id
+        second = City()
+        second.state_id = state.id
+        City().state_id = other.id
+        self.assertEqual([first, second], state.cities)
+        second.state_id = other.id
+        self.assertEqual([first], state.cities)
+        models.storage.delete(first)
+        self.assertEqual([], state.cities)
+
+    def test_cities_is_read_only(self):
+        state = State()
+        self.assertEqual([], state.cities)
+        self.assertNotIn("cities", state.to_dict())
+        with self.assertRaises(AttributeError):
+            state.cities = []
+
+    def test_cities_ignored_in_dictionary(self):
+        state = State()
+        data = state.to_dict()
+        data["cities"] = ["City.1234"]
+        loaded = State(**data)
+        self.assertEqual(state.id, loaded.id)
+        self.assertEqual([], loaded.cities)
+        self.assertNotIn("cities", loaded.__dict__)
+
+
 """
 Run the tests if the script is executed directly
 """
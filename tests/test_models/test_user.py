@@ -11,6 +11,7 @@ import unittest
 from datetime import datetime
 from time import sleep
 from models.user import User
+from models.place import Place
 
 
 class TestUser_instantiation(unittest.TestCase):
@@ -116,10 +117,11 @@ class TestUser_save(unittest.TestCase):
 
     def tearDown(self):
         """Remove file.json and restore tmp.json if it exists."""
-        try:
-            os.remove("file.json")
-        except IOError:
-            pass
+        for path in ("file.json", "file.json.lock"):
+            try:
+                os.remove(path)
+            except IOError:
+                pass
         try:
             os.rename("tmp", "file.json")
         except IOError:
@@ -208,6 +210,51 @@ class TestUser_to_dict(unittest.TestCase):
             us.to_dict(None)
 
 
+class TestUser_places(unittest.TestCase):
+    """
+    Test class for the User.places relationship
+    """
+    def setUp(self):
+        try:
+            os.rename("file.json", "tmp.json")
+        except FileNotFoundError:
+            pass
+
+    def tearDown(self):
+        for path in ("file.json", "file.json.lock"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        try:
+            os.rename("tmp.json", "file.json")
+        except FileNotFoundError:
+            pass
+    """
+    Tests for the places accessor
+    """
+    def test_places_follow_user_id(self):
+        user = User()
+        other = User()
+        first = Place()
+        first.user_id = user.id
+        second = Place()
+        second.user_id = user.id
+        Place().user_id = other.id
+        self.assertEqual([first, second], user.places)
+        second.user_id = other.id
+        self.assertEqual([first], user.places)
+        models.storage.delete(first)
+        self.assertEqual([], user.places)
+
+    def test_places_is_read_only(self):
+        user = User()
+        self.assertEqual([], user.places)
+        self.assertNotIn("places", user.to_dict())
+        with self.assertRaises(AttributeError):
+            user.places = []
+
+
 """
 Run the tests if the script is executed directly
 """